@@ -0,0 +1,73 @@
+"""
+Benchmark generate_preview against the previous iterrows-based implementation.
+
+Run from the repository root:
+    python -m benchmarks.bench_preview [--sizes 10000 100000 1000000]
+
+Both versions log at INFO to a discarded stream, as in production, so the
+per-row logging cost of the previous implementation is part of the measurement.
+"""
+import argparse
+import io
+import logging
+import time
+from benchmarks.synthetic import make_report, sub_names
+from src.utils.data_processing import generate_preview
+
+logger = logging.getLogger("benchmarks.legacy_preview")
+
+SUBS = sub_names(18)
+
+
+def legacy_generate_preview(df, subs_list, date_range):
+    """The filtering steps and logging of generate_preview before the vectorized rewrite."""
+    filtered_df = df.copy()
+    logger.info(f"Columns in the DataFrame: {list(filtered_df.columns)}")
+    filtered_df['Tech'] = filtered_df['Tech'].astype(str)
+    totals_mask = filtered_df['Tech'].str.contains("Totals represent tech's share", na=False, case=False)
+    filtered_df = filtered_df[~totals_mask]
+    logger.info(f"All unique Tech names in data: {list(filtered_df['Tech'].unique())}")
+    subs_lower = [sub.lower().strip() for sub in subs_list]
+    filtered_df = filtered_df[filtered_df['Tech'].str.lower().str.strip().isin(subs_lower)]
+    for idx, row in filtered_df.iterrows():
+        logger.info(f"Row {idx}: Tech={row['Tech']}, Job#={row['Job#']}, Status={row.get('Status', 'N/A')}, Completed On={row.get('Completed On', 'N/A')}")
+    logger.info(f"All unique Status values: {list(filtered_df['Status'].unique())}")
+    filtered_df = filtered_df[filtered_df['Status'] == 'Invoiced']
+    filtered_df['Missing Date'] = False
+    for idx, row in filtered_df.head(20).iterrows():
+        logger.info(f"Final row {idx}: Tech={row['Tech']}, Job#={row['Job#']}, Status={row.get('Status', 'N/A')}, Completed On={row.get('Completed On', 'N/A')}")
+    return filtered_df, []
+
+
+def time_call(func, *args, repeat=3):
+    """Return the best wall-clock time of several calls."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    
+    # Production logs at INFO; send the records to a throwaway stream
+    root = logging.getLogger()
+    root.handlers = [logging.StreamHandler(io.StringIO())]
+    root.setLevel(logging.INFO)
+    
+    print(f"{'rows':>10} {'legacy (s)':>12} {'current (s)':>12} {'speedup':>8}")
+    for rows in args.sizes:
+        df = make_report(rows, subs=len(SUBS))
+        legacy = time_call(legacy_generate_preview, df, SUBS, None, repeat=args.repeat)
+        current = time_call(generate_preview, df, SUBS, None, repeat=args.repeat)
+        assert len(legacy_generate_preview(df, SUBS, None)[0]) == len(generate_preview(df, SUBS, None)[0])
+        print(f"{rows:>10} {legacy:>12.3f} {current:>12.3f} {legacy / current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Time how long the app and the utility modules take to import in a fresh interpreter.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --update-baseline
+
+Each import is timed in its own Python process (best of several), so nothing is
+already loaded. The first page of the app is also drawn in a fresh process (its
+whole top-level script, run through Streamlit's AppTest with nothing uploaded), since
+a module imported inside the script, e.g. in a collapsed expander, costs as much as
+one imported at the top. Results are written to benchmarks/startup_results.json and
+compared with benchmarks/startup_baseline.json like run_benchmarks does. The exit
+status is also 1 if the app's startup imports or its first page load pandas or
+openpyxl, which must only be imported when first needed.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from benchmarks.run_benchmarks import compare
+
+BENCH_DIR = Path(__file__).resolve().parent
+SRC_DIR = BENCH_DIR.parent / "src"
+APP_SCRIPT = SRC_DIR / "app.py"
+DEFAULT_RESULTS = BENCH_DIR / "startup_results.json"
+DEFAULT_BASELINE = BENCH_DIR / "startup_baseline.json"
+
+# What src/app.py imports before it draws the page
+APP_STARTUP_IMPORTS = [
+    "streamlit", "utils.subs_store", "utils.job_runner", "utils.instrumentation",
+    "utils.diagnostics", "utils.warmup"
+]
+
+# Cases: name -> modules imported together
+CASES = {
+    "app": APP_STARTUP_IMPORTS,
+    "utils.subs_store": ["utils.subs_store"],
+    "utils.job_runner": ["utils.job_runner"],
+    "utils.data_processing": ["utils.data_processing"],
+    "utils.report_loader": ["utils.report_loader"],
+    "utils.template_layout": ["utils.template_layout"],
+    "utils.excel_writer": ["utils.excel_writer"],
+    "pandas": ["pandas"],
+    "openpyxl": ["openpyxl"]
+}
+
+# Modules the app must not load at startup
+HEAVY_MODULES = ["pandas", "openpyxl", "pyarrow"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def time_imports(modules, repeat=3):
+    """
+    Import modules in fresh interpreters.
+
+    Returns:
+        tuple: (best seconds, heavy modules loaded by the import)
+    """
+    best = float("inf")
+    loaded = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(modules=modules, heavy=HEAVY_MODULES)],
+            cwd=SRC_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        probe = json.loads(output.strip().splitlines()[-1])
+        best = min(best, probe["seconds"])
+        loaded = probe["loaded"]
+    return best, loaded
+
+
+_SCRIPT_PROBE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+app = AppTest.from_file({script!r}, default_timeout=60).run()
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+    "errors": [str(error.value) for error in app.exception]
+}}))
+"""
+
+
+def time_app_script(repeat=3):
+    """
+    Draw the app's first page (nothing uploaded) in fresh interpreters.
+
+    The background warmup is turned off, since it loads pandas on purpose, and the
+    ledger points at a scratch file so nothing real is touched.
+
+    Returns:
+        tuple: (best seconds, heavy modules loaded by the page, errors raised by the script)
+    """
+    best = float("inf")
+    loaded, errors = [], []
+    with tempfile.TemporaryDirectory() as scratch:
+        env = {**os.environ, "SUBPAY_WARMUP": "0", "SUBPAY_LEDGER_PATH": os.path.join(scratch, "ledger.sqlite3")}
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", _SCRIPT_PROBE.format(script=str(APP_SCRIPT), heavy=HEAVY_MODULES)],
+                cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True
+            ).stdout
+            probe = json.loads(output.strip().splitlines()[-1])
+            best = min(best, probe["seconds"])
+            loaded, errors = probe["loaded"], probe["errors"]
+    return best, loaded, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark import time (cold start latency).")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per case (best is kept)")
+    parser.add_argument("--output", type=Path, default=DEFAULT_RESULTS)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed slowdown factor against the baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = []
+    heavy_at_startup = []
+    for case, modules in CASES.items():
+        seconds, loaded = time_imports(modules, args.repeat)
+        results.append({"case": f"import/{case}", "stage": "import", "modules": modules, "loaded": loaded, "seconds": round(seconds, 4)})
+        print(f"import/{case:<28} {seconds:>9.4f}s  {'loads ' + ', '.join(loaded) if loaded else ''}")
+        if case == "app":
+            heavy_at_startup = loaded
+
+    seconds, loaded, errors = time_app_script(args.repeat)
+    results.append({"case": "script/app", "stage": "script", "loaded": loaded, "seconds": round(seconds, 4)})
+    print(f"{'script/app':<35} {seconds:>9.4f}s  {'loads ' + ', '.join(loaded) if loaded else ''}")
+    heavy_at_startup = sorted(set(heavy_at_startup) | set(loaded))
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results
+    }
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.output}")
+
+    status = 0
+    if heavy_at_startup:
+        print(f"REGRESSION app startup loads {', '.join(heavy_at_startup)}; import them where they are first used")
+        status = 1
+    if errors:
+        print(f"ERROR the app's first page raised: {'; '.join(errors)}")
+        status = 1
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Baseline updated: {args.baseline}")
+        return status
+
+    if not args.baseline.exists():
+        print("No baseline to compare with; run with --update-baseline to store one.")
+        return status
+
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+    for case, base, seconds in regressions:
+        print(f"REGRESSION {case}: {base:.4f}s -> {seconds:.4f}s ({seconds / base:.1f}x)")
+    if regressions:
+        return 1
+    if not status:
+        print(f"No regressions beyond {args.tolerance}x of the baseline.")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
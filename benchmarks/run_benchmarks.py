@@ -0,0 +1,154 @@
+"""
+Time the report -> pay sheet pipeline on synthetic data and compare with a stored baseline.
+
+Run from the repository root:
+    python -m benchmarks.run_benchmarks --quick              # 1k-10k rows, 10 subs
+    python -m benchmarks.run_benchmarks                      # 1k-1M rows, 10-500 subs
+    python -m benchmarks.run_benchmarks --quick --update-baseline
+
+Results are written to benchmarks/results.json. Each timing is compared with the same
+case in benchmarks/baseline.json, and the exit status is 1 if any case is slower than
+the baseline by more than the allowed factor.
+"""
+import argparse
+import io
+import json
+import logging
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from benchmarks.synthetic import make_report, make_template, report_to_xlsx, sub_names, TemplateUpload
+from src.utils.data_processing import infer_week_range, generate_preview
+from src.utils.excel_writer import build_pay_sheet
+from src.utils.report_loader import read_worksheet, type_report_columns
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_RESULTS = BENCH_DIR / "results.json"
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+
+FULL_ROWS = [1_000, 10_000, 100_000, 1_000_000]
+FULL_SUBS = [10, 100, 500]
+QUICK_ROWS = [1_000, 10_000]
+QUICK_SUBS = [10]
+
+# Parsing XLSX is slow to set up; only benchmark it up to this many rows
+MAX_PARSE_ROWS = 100_000
+
+# Timings below this are dominated by noise and never count as regressions
+MIN_COMPARABLE_SECONDS = 0.02
+
+
+def time_call(func, *args, repeat=3, **kwargs):
+    """Return the best wall-clock time of several calls, and the last result."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_case(rows, subs, repeat):
+    """Time every pipeline stage for one (rows, subs) combination."""
+    report_df = make_report(rows, subs=subs, seed=rows + subs)
+    template = TemplateUpload(make_template(subs))
+    subs_list = sub_names(subs)
+    timings = {}
+
+    if rows <= MAX_PARSE_ROWS:
+        data = report_to_xlsx(report_df)
+        timings["read_worksheet"], _ = time_call(read_worksheet, data, repeat=1)
+
+    # Later stages get the typed report, as load_report returns it
+    timings["type_report_columns"], report_df = time_call(type_report_columns, report_df, repeat=repeat)
+
+    timings["infer_week_range"], date_range = time_call(infer_week_range, report_df, repeat=repeat)
+    timings["generate_preview"], (filtered_df, _) = time_call(generate_preview, report_df, subs_list, date_range, repeat=repeat)
+    for engine in ("openpyxl", "xml"):
+        timings[f"create_pay_sheet[{engine}]"], _ = time_call(
+            build_pay_sheet, template, filtered_df, list(date_range), engine=engine, repeat=repeat
+        )
+
+    return [
+        {"case": f"{stage}/rows={rows}/subs={subs}", "stage": stage, "rows": rows, "subs": subs, "seconds": round(seconds, 4)}
+        for stage, seconds in timings.items()
+    ]
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with the baseline.
+
+    Returns:
+        list: (case, baseline_seconds, seconds) for every regression beyond tolerance
+    """
+    previous = {entry["case"]: entry["seconds"] for entry in baseline.get("results", [])}
+    regressions = []
+    for entry in results:
+        base = previous.get(entry["case"])
+        if base is None or max(base, entry["seconds"]) < MIN_COMPARABLE_SECONDS:
+            continue
+        if entry["seconds"] > base * tolerance:
+            regressions.append((entry["case"], base, entry["seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the report -> pay sheet pipeline.")
+    parser.add_argument("--quick", action="store_true", help="Small sizes only, for a fast pre-deploy check")
+    parser.add_argument("--rows", type=int, nargs="+", help="Report sizes to benchmark")
+    parser.add_argument("--subs", type=int, nargs="+", help="Subcontractor counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per timing (best is kept)")
+    parser.add_argument("--output", type=Path, default=DEFAULT_RESULTS)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed slowdown factor against the baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    rows_list = args.rows or (QUICK_ROWS if args.quick else FULL_ROWS)
+    subs_list = args.subs or (QUICK_SUBS if args.quick else FULL_SUBS)
+
+    # Production logs at INFO; keep the records but don't print them
+    root = logging.getLogger()
+    root.handlers = [logging.StreamHandler(io.StringIO())]
+    root.setLevel(logging.INFO)
+
+    results = []
+    for rows in rows_list:
+        for subs in subs_list:
+            for entry in run_case(rows, subs, args.repeat):
+                results.append(entry)
+                print(f"{entry['case']:<55} {entry['seconds']:>9.4f}s")
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results
+    }
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print("No baseline to compare with; run with --update-baseline to store one.")
+        return 0
+
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+    for case, base, seconds in regressions:
+        print(f"REGRESSION {case}: {base:.4f}s -> {seconds:.4f}s ({seconds / base:.1f}x)")
+    if regressions:
+        return 1
+    print(f"No regressions beyond {args.tolerance}x of the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Synthetic Service Fusion reports and pay sheet templates for benchmarks.
+
+The distributions roughly follow real exports: most jobs belong to employees, about a
+third to subcontractors (a few of them busy, most with a handful of jobs), each tech's
+jobs end with a "Totals represent tech's share" row, and the Customer header comes in
+the spellings Service Fusion has used.
+"""
+import io
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+STATUSES = ["Invoiced", "Completed", "Scheduled", "Cancelled", "On Hold"]
+STATUS_WEIGHTS = [0.62, 0.18, 0.12, 0.05, 0.03]
+CATEGORIES = ["Repair", "Install", "Inspection", "Paint", "Roofing", "Plumbing", "Electrical", "Cleanup"]
+CUSTOMER_HEADERS = ["Customer", "Customer)", "Customer )"]
+TOTALS_TEXT = "Totals represent tech's share"
+
+
+def sub_names(count):
+    """Subcontractor names as they appear both in the report and as template tabs."""
+    return [f"Sub {i:03d} Contracting" for i in range(count)]
+
+
+def make_report(rows, subs=18, employees=60, weeks=1, seed=0, customer_header="Customer", extra_columns=20):
+    """
+    Build a synthetic Service Fusion report.
+
+    Args:
+        rows (int): Number of job rows (Totals rows come on top)
+        subs (int): Number of subcontractors
+        employees (int): Number of employee techs
+        weeks (int): Number of weeks the completion dates span
+        seed (int): Random seed
+        customer_header (str): Header used for the Customer column
+        extra_columns (int): Number of unused columns, as in the full-width export
+
+    Returns:
+        pandas.DataFrame: Report with the columns of the "Worksheet" sheet
+    """
+    rng = np.random.default_rng(seed)
+    sub_list = sub_names(subs)
+    employee_list = [f"Employee {i}" for i in range(employees)]
+
+    # A few busy subcontractors and a long tail (Zipf-like weights)
+    sub_weights = 1 / np.arange(1, subs + 1) ** 0.8
+    is_sub = rng.random(rows) < 0.3
+    techs = np.where(
+        is_sub,
+        rng.choice(sub_list, rows, p=sub_weights / sub_weights.sum()),
+        rng.choice(employee_list, rows)
+    ).astype(object)
+    # Service Fusion spellings differ in case and padding now and then
+    odd = is_sub & (rng.random(rows) < 0.05)
+    techs[odd] = [f" {tech.upper()} " for tech in techs[odd]]
+
+    start = pd.Timestamp("2024-05-06")
+    offsets = rng.integers(0, 7 * weeks, rows)
+    dates = (start + pd.to_timedelta(offsets, unit="D")).strftime("%m/%d/%Y").to_numpy(dtype=object)
+    dates[rng.random(rows) < 0.01] = None
+
+    df = pd.DataFrame({
+        'Tech': techs,
+        'Job#': rng.integers(100000, 999999, rows),
+        'Status': rng.choice(STATUSES, rows, p=STATUS_WEIGHTS),
+        'Completed On': dates,
+        'Job Category': rng.choice(CATEGORIES, rows),
+        'Job Details': np.where(rng.random(rows) < 0.85, "Replace damaged section, patch and paint. " * 4, None),
+        customer_header: np.where(rng.random(rows) < 0.95, rng.choice([f"Property {i}" for i in range(500)], rows), None),
+        'Service Location Address 1': rng.choice([f"{i} Main St" for i in range(1, 500)], rows),
+    })
+    for i in range(extra_columns):
+        df[f"Extra {i}"] = rng.random(rows)
+
+    # One Totals row after each tech's block of jobs
+    df = df.sort_values('Tech', kind='mergesort').reset_index(drop=True)
+    last_rows = df.drop_duplicates('Tech', keep='last').index
+    totals = pd.DataFrame({'Tech': [TOTALS_TEXT] * len(last_rows)}, index=last_rows + 0.5)
+    return pd.concat([df, totals]).sort_index().reset_index(drop=True)
+
+
+def report_to_xlsx(df):
+    """Serialize a report DataFrame to XLSX bytes with a "Worksheet" sheet."""
+    buffer = io.BytesIO()
+    df.to_excel(buffer, sheet_name="Worksheet", index=False)
+    return buffer.getvalue()
+
+
+def make_template(subs=18, styled=True, extra_rows=0):
+    """
+    Build a pay sheet template with one tab per subcontractor.
+
+    Args:
+        subs (int): Number of subcontractor tabs
+        styled (bool): Apply fonts, fills and borders like the real template
+        extra_rows (int): Additional styled rows below the summary (notes, signatures)
+
+    Returns:
+        bytes: XLSX content of the template
+    """
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    thin = Side(style="thin")
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill("solid", fgColor="1F4E78")
+
+    for name in sub_names(subs):
+        sheet = wb.create_sheet(title=name[:31])
+        sheet["A1"] = "Subcontractor Pay Sheet"
+        sheet["A2"] = "Subcontractor:"
+        sheet["B2"] = name
+        sheet["A3"] = "Week Of:"
+        for col, header in enumerate(["Date", "Property", "Job #", "Description", "Qty", "Per Unit", "Amount"], start=1):
+            sheet.cell(row=12, column=col).value = header
+        for row in range(13, 30):
+            sheet.cell(row=row, column=7).value = f"=E{row}*F{row}"
+        sheet.cell(row=30, column=4).value = "Total"
+        sheet.cell(row=30, column=7).value = "=SUM(G13:G29)"
+        for row in range(31, 31 + extra_rows):
+            sheet.cell(row=row, column=1).value = f"Note {row}"
+
+        if styled:
+            sheet["A1"].font = Font(bold=True, size=14)
+            for col in range(1, 8):
+                cell = sheet.cell(row=12, column=col)
+                cell.font = header_font
+                cell.fill = header_fill
+                for row in range(13, 31):
+                    cell = sheet.cell(row=row, column=col)
+                    cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+                    cell.alignment = Alignment(vertical="top", wrap_text=col == 4)
+            sheet.column_dimensions["B"].width = 30
+            sheet.column_dimensions["D"].width = 50
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+class TemplateUpload:
+    """Stands in for a Streamlit upload of the template."""
+
+    def __init__(self, content):
+        self.content = content
+
+    def getvalue(self):
+        return self.content
@@ -1,8 +1,20 @@
+import json
+import time
 import streamlit as st
-import pandas as pd
-import os
-from utils.data_processing import load_subs, save_subs, infer_week_range, generate_preview
-from utils.excel_writer import create_pay_sheet
+# Only modules that load without pandas or openpyxl are imported here; the pipeline modules
+# are imported where they are first needed, so the page starts drawing before they load
+# (and utils.warmup loads them in the background once the first page is drawn)
+from utils.subs_store import load_subs, save_subs, subs_version, team_subs, team_membership, TEAMS, ALL_TEAMS
+from utils.job_runner import (
+    get_job_runner, run_preview_job, run_pay_sheet_job, request_key, job_set_hash,
+    estimate_preview_memory, estimate_pay_sheet_memory, JobQueueFullError
+)
+from utils.instrumentation import span, start_run, finish_run, metrics_sink_path
+from utils.diagnostics import configure_logging, recent_events
+from utils.warmup import start_warmup
+from utils.output_cache import get_output_cache
+
+configure_logging()
 
 # Set page title and configuration
 st.set_page_config(
@@ -27,17 +39,52 @@ if 'filtered_jobs' not in st.session_state:
 if 'selected_team' not in st.session_state:
     st.session_state.selected_team = 'Construction'
 
+if 'subs_versions' not in st.session_state:
+    st.session_state.subs_versions = {}
+if 'pay_sheet_job' not in st.session_state:
+    st.session_state.pay_sheet_job = None
+if 'preview_request' not in st.session_state:
+    st.session_state.preview_request = None
+if 'preview_summary' not in st.session_state:
+    st.session_state.preview_summary = None
+if 'preview_warnings' not in st.session_state:
+    st.session_state.preview_warnings = []
+if 'preview_teams' not in st.session_state:
+    st.session_state.preview_teams = None
+if 'week_histogram' not in st.session_state:
+    st.session_state.week_histogram = None
+if 'week_histogram_hash' not in st.session_state:
+    st.session_state.week_histogram_hash = None
+
+# Seconds between progress checks of a running pay sheet job
+JOB_POLL_SECONDS = 1.0
+
+def job_status_text(job):
+    """One line describing a queued or running job."""
+    if job.status == "queued":
+        return f"{job.label}: waiting in the queue (position {job.position})..."
+    return f"{job.label}: {job.message or 'working...'}"
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_pay_sheet_job(job_id):
+    """Show the progress of a running job; rerun the whole page once it has finished."""
+    job = get_job_runner().get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    st.progress(job.fraction, text=job_status_text(job))
+
 # Sidebar - Subcontractor List Management
 with st.sidebar:
     st.header("Settings")
     
     # Team selection
     st.subheader("Team Selection")
+    team_options = [*TEAMS, ALL_TEAMS]
     team = st.selectbox(
         "Select Team",
-        ["Construction", "Welding"],
-        index=0 if st.session_state.selected_team == 'Construction' else 1,
-        help="Choose between Construction and Welding teams"
+        team_options,
+        index=team_options.index(st.session_state.selected_team),
+        help="Choose between Construction and Welding teams, or All teams to filter the report once and create one pay sheet per team"
     )
     
     # Update selected team in session state
@@ -45,17 +92,57 @@ with st.sidebar:
         st.session_state.selected_team = team
         st.rerun()
     
-    # Subcontractor list management
-    st.subheader(f"{team} Subcontractor List")
-    subs_text = st.text_area("Edit subcontractor names (one per line)", value="\n".join(load_subs(team)), height=200)
+    if team == ALL_TEAMS:
+        st.subheader("Subcontractor Lists")
+        st.caption(f"All teams uses the saved {' and '.join(TEAMS)} lists together. Select a team to edit its list.")
+    else:
+        # Subcontractor list management. The version shown on the previous run is what the
+        # user edited; saving is refused if another session has changed the list since.
+        st.subheader(f"{team} Subcontractor List")
+        edited_version = st.session_state.subs_versions.get(team)
+        st.session_state.subs_versions[team] = subs_version(team)
+        subs_text = st.text_area("Edit subcontractor names (one per line)", value="\n".join(load_subs(team)), height=200)
+    
+        if st.button("Save List"):
+            if save_subs(subs_text, team, expected_version=edited_version):
+                st.session_state.subs_versions[team] = subs_version(team)
+                st.success(f"{team} subcontractor list saved!")
+            else:
+                st.error(f"The {team} list was not saved: it was changed in another session, or the file could not be written. The current list is shown above; apply your edits again.")
     
-    if st.button("Save List"):
-        save_subs(subs_text, team)
-        st.success(f"{team} subcontractor list saved!")
+    # Jobs already paid to a subcontractor, from the job ledger. The body of an expander runs even
+    # while it is collapsed, so the ledger (and pandas) is only read once the toggle is on.
+    with st.expander("Payment History"):
+        history_sub = st.selectbox("Subcontractor", load_subs(team), key="history_sub")
+        if history_sub and st.toggle("Show payment history", key="show_history"):
+            from utils.job_ledger import get_job_ledger
+            try:
+                st.dataframe(get_job_ledger().history(history_sub), hide_index=True, use_container_width=True)
+            except Exception as e:
+                st.error(f"Could not read the job ledger: {str(e)}")
     
     # Date range selection
     st.subheader("Date Range")
     
+    # Weeks of the loaded report with their job counts; picking one sets the date range
+    if st.session_state.week_histogram is not None and not st.session_state.week_histogram.empty:
+        from utils.excel_writer import format_week_of
+        
+        def choose_week():
+            week = st.session_state.week_choice
+            if week:
+                st.session_state.start_date, st.session_state.end_date = week[0], week[1]
+        
+        st.selectbox(
+            "Weeks in report",
+            [(start, end, int(jobs)) for start, end, jobs in st.session_state.week_histogram.itertuples(index=False, name=None)],
+            index=None,
+            format_func=lambda week: f"{format_week_of(week[:2])} ({week[2]} jobs)",
+            placeholder="Jump to a week...",
+            key="week_choice",
+            on_change=choose_week
+        )
+    
     # If a report is loaded and dates are available, use them for the input
     if st.session_state.start_date and st.session_state.end_date:
         date_range = st.date_input(
@@ -74,6 +161,41 @@ with st.sidebar:
     if len(date_range) == 2:
         st.session_state.start_date = date_range[0]
         st.session_state.end_date = date_range[1]
+    
+    # Output engine selection
+    st.subheader("Output")
+    engine = st.radio(
+        "Pay sheet engine",
+        ["openpyxl", "xml"],
+        format_func=lambda name: "Standard (openpyxl)" if name == "openpyxl" else "Fast (patch only sheets with jobs)",
+        help="The fast engine edits only the tabs of subcontractors with jobs and copies the rest of the template unchanged."
+    )
+    split_per_sub = st.checkbox(
+        "One workbook per subcontractor (ZIP)",
+        disabled=team == ALL_TEAMS,
+        help="Also creates a separate workbook for each subcontractor, holding only their tab, bundled with the combined workbook. Not available for All teams."
+    ) and team != ALL_TEAMS
+    split_weeks = st.checkbox(
+        "Split into weekly pay sheets (ZIP)",
+        disabled=team == ALL_TEAMS,
+        help="For reports spanning several weeks: creates one pay sheet per Monday-Sunday week from all invoiced jobs, ignoring the selected date range. Not available for All teams."
+    ) and team != ALL_TEAMS
+    skip_paid = st.checkbox(
+        "Skip jobs already on a pay sheet",
+        value=True,
+        help="Jobs are recorded in the job ledger when a pay sheet is generated. Jobs recorded from an earlier report are left out of the preview; untick to keep them (they are flagged in the Paid Week column)."
+    )
+    show_diagnostics = st.checkbox(
+        "Show diagnostics",
+        help="Shows the most recent diagnostic events (sampled per-sheet details, warnings and a summary per preview or pay sheet) kept in memory by the server."
+    )
+    show_performance = st.checkbox(
+        "Show performance details",
+        help="Times each processing stage (report parsing, filtering, template loading, cell writes, saving) and shows the results below."
+    )
+
+# Record stage timings when requested in the UI or when a metrics file is configured
+metrics_run = start_run("app") if show_performance or metrics_sink_path() else None
 
 # Main area - File Upload
 col1, col2 = st.columns(2)
@@ -85,18 +207,47 @@ with col1:
 with col2:
     st.subheader("Upload Pay Sheet Template")
     template_file = st.file_uploader("Upload Pay Sheet Template (.xlsx)", type="xlsx", help="Template should have one sheet per subcontractor")
+    
+    # Validate the template as soon as it is uploaded (compiled once per template content)
+    template_layout = None
+    if template_file:
+        from utils.template_layout import get_template_layout
+        try:
+            template_layout = get_template_layout(template_file)
+            st.caption(f"Template has {len(template_layout.sheets)} subcontractor tabs.")
+            if template_layout.issues:
+                st.warning("\n".join(template_layout.issues))
+        except Exception as e:
+            st.error(f"Could not read the pay sheet template: {str(e)}")
 
 # Process files when both are uploaded
 if report_file and template_file:
+    from utils.report_loader import load_report
+    from utils.data_processing import infer_week_range
+    from utils.dates import week_histogram
+    from utils.job_ledger import get_job_ledger
+    from utils.job_table import summarize_jobs, job_page, PREVIEW_PAGE_SIZE
+    
     try:
-        # Load the report and infer date range if not already set
-        report_df = pd.read_excel(report_file, sheet_name="Worksheet")
+        # Load the report (parsed once per distinct upload) and infer date range if not already set
+        report_df, report_hash = load_report(report_file)
         
-        # Infer date range if not set
+        # Infer date range if not set, and count the report's jobs per week for the week picker
+        rerun = False
         if not st.session_state.start_date or not st.session_state.end_date:
-            st.session_state.start_date, st.session_state.end_date = infer_week_range(report_df)
+            with span("infer_week_range", rows=len(report_df)):
+                st.session_state.start_date, st.session_state.end_date = infer_week_range(report_df)
             st.sidebar.success("Date range automatically set based on report dates.")
-            # Need to rerun to update the date input widget
+            rerun = True
+        if st.session_state.week_histogram_hash != report_hash:
+            if 'Completed On' in report_df.columns:
+                st.session_state.week_histogram = week_histogram(report_df['Completed On'])
+            else:
+                st.session_state.week_histogram = None
+            st.session_state.week_histogram_hash = report_hash
+            rerun = True
+        if rerun:
+            # Need to rerun to update the date input widget and the week picker
             st.rerun()
         
         # Get updated subcontractor list for selected team
@@ -105,59 +256,207 @@ if report_file and template_file:
         # Preview Generation Button
         if st.button("Generate Preview", type="primary"):
             with st.spinner("Filtering jobs..."):
-                # Generate preview DataFrame
-                preview_df, warnings = generate_preview(
-                    report_df, 
-                    subs_list, 
-                    [st.session_state.start_date, st.session_state.end_date]
+                # Generate preview DataFrame in the shared job queue; identical requests from
+                # other sessions waiting or running at the same time are filtered once. A finished
+                # preview is not reused, since the ledger may have changed since it ran.
+                preview_request = dict(
+                    report_hash=report_hash,
+                    date_range=[st.session_state.start_date, st.session_state.end_date],
+                    team=st.session_state.selected_team,
+                    subs_version=subs_version(st.session_state.selected_team),
+                    include_paid=not skip_paid
                 )
-                
-                # Store in session state
-                st.session_state.filtered_jobs = preview_df
-                
-                # Display warnings if any
-                if warnings:
-                    st.warning("\n".join(warnings))
-                
-                # Show preview in an expander
-                with st.expander("Job Preview", expanded=True):
-                    if preview_df.empty:
-                        st.warning("No jobs found matching the criteria.")
+                preview_job = None
+                with span("generate_preview", rows=len(report_df)) as timing:
+                    try:
+                        preview_job_id = get_job_runner().submit(
+                            run_preview_job,
+                            report_df,
+                            subs_list,
+                            preview_request['date_range'],
+                            ledger=get_job_ledger(),
+                            report_hash=report_hash,
+                            include_paid=not skip_paid,
+                            label="Preview",
+                            key=request_key(template_hash=None, **preview_request),
+                            memory=estimate_preview_memory(report_df),
+                            reuse_finished=False
+                        )
+                    except JobQueueFullError as e:
+                        st.error(f"The server is busy: {str(e)}")
                     else:
-                        # Group by subcontractor for better viewing
-                        for sub, group in preview_df.groupby('Tech'):
-                            st.subheader(f"{sub} ({len(group)} jobs)")
-                            st.dataframe(
-                                group[['Job#', 'Completed On', 'Job Category']],
-                                hide_index=True,
-                                use_container_width=True
-                            )
+                        status = st.empty()
+                        preview_job = get_job_runner().get(preview_job_id)
+                        while not preview_job.finished:
+                            status.caption(job_status_text(preview_job))
+                            time.sleep(JOB_POLL_SECONDS / 10)
+                            preview_job = get_job_runner().get(preview_job_id)
+                        status.empty()
+                        if preview_job.status == "failed":
+                            raise RuntimeError(preview_job.error)
+                        preview_df, warnings = preview_job.result
+                        timing.set(jobs=len(preview_df))
+                
+                if preview_job is not None:
+                    # Store in session state, with the per-subcontractor summary computed once
+                    preview_teams = team_subs(ALL_TEAMS) if st.session_state.selected_team == ALL_TEAMS else None
+                    with span("summarize_jobs", jobs=len(preview_df)):
+                        summary = summarize_jobs(preview_df)
+                        if preview_teams:
+                            teams_of = team_membership(summary['Tech'], preview_teams)
+                            summary.insert(1, 'Team', [", ".join(teams_of[sub]) for sub in summary['Tech']])
+                        st.session_state.preview_summary = summary
+                    st.session_state.preview_teams = preview_teams
+                    st.session_state.filtered_jobs = preview_df
+                    st.session_state.preview_request = preview_request
+                    st.session_state.preview_warnings = warnings
+        
+        # Show the preview: one summary row per subcontractor, job rows on demand, a page at a time
+        if st.session_state.filtered_jobs is not None:
+            # Display warnings if any
+            if st.session_state.preview_warnings:
+                st.warning("\n".join(st.session_state.preview_warnings))
+            
+            with st.expander("Job Preview", expanded=True):
+                preview_df = st.session_state.filtered_jobs
+                summary = st.session_state.preview_summary
+                if preview_df.empty:
+                    st.warning("No jobs found matching the criteria.")
+                else:
+                    st.caption(f"{len(preview_df)} jobs for {len(summary)} subcontractors")
+                    st.dataframe(summary, hide_index=True, use_container_width=True)
+                    
+                    sub_col, page_col = st.columns([3, 1])
+                    detail_sub = sub_col.selectbox("Show jobs of", [None] + summary['Tech'].tolist(),
+                                                   format_func=lambda sub: "(select a subcontractor)" if sub is None else sub)
+                    if detail_sub is not None:
+                        jobs_count = int(summary.loc[summary['Tech'] == detail_sub, 'Jobs'].iloc[0])
+                        page_count = max(1, -(-jobs_count // PREVIEW_PAGE_SIZE))
+                        page = page_col.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1,
+                                                     key=f"preview_page_{detail_sub}")
+                        page_df, _ = job_page(preview_df, detail_sub, page)
+                        st.dataframe(page_df, hide_index=True, use_container_width=True)
         
         # Only show Generate Pay Sheet button if we have a preview
         if st.session_state.filtered_jobs is not None:
-            if st.button("Generate Pay Sheet", type="primary"):
-                with st.spinner("Creating pay sheet..."):
-                    # Generate the pay sheet
-                    output_path, skipped_subs = create_pay_sheet(
-                        template_file,
+            job_id = st.session_state.pay_sheet_job
+            job = get_job_runner().get(job_id) if job_id else None
+            running = job is not None and not job.finished
+            if st.button("Generate Pay Sheet", type="primary", disabled=running):
+                # Generation runs in the background, so it keeps going across reruns. The same
+                # preview, template and options requested by another session share one job, and
+                # an output generated before (in any session or process) is served from the cache
+                # right away instead of waiting in the queue.
+                template_bytes = template_file.getvalue()
+                pay_range = [st.session_state.start_date, st.session_state.end_date]
+                key = None
+                if template_layout is not None and st.session_state.preview_request:
+                    key = request_key(
+                        template_hash=template_layout.template_hash,
+                        engine=engine,
+                        per_sub=split_per_sub,
+                        split_weeks=split_weeks,
+                        teams=bool(st.session_state.preview_teams),
+                        jobs=job_set_hash(st.session_state.filtered_jobs),
+                        **{**st.session_state.preview_request, "date_range": pay_range}
+                    )
+                output_cache = get_output_cache()
+                submit = get_job_runner().run_inline if key is not None and output_cache.contains(key) else get_job_runner().submit
+                try:
+                    st.session_state.pay_sheet_job = submit(
+                        run_pay_sheet_job,
+                        template_bytes,
                         st.session_state.filtered_jobs,
-                        [st.session_state.start_date, st.session_state.end_date]
+                        pay_range,
+                        layout=template_layout,
+                        engine=engine,
+                        per_sub=split_per_sub,
+                        split_weeks=split_weeks,
+                        ledger=get_job_ledger(),
+                        report_hash=report_hash,
+                        teams=st.session_state.preview_teams,
+                        output_cache=output_cache,
+                        cache_key=key,
+                        label="Team pay sheets" if st.session_state.preview_teams else "Weekly pay sheets" if split_weeks else "Pay sheet",
+                        key=key,
+                        memory=estimate_pay_sheet_memory(template_bytes, st.session_state.filtered_jobs, engine, split_per_sub, split_weeks)
                     )
-                    
-                    # Show warnings for skipped subcontractors
-                    if skipped_subs:
-                        st.warning(f"The following subcontractors were skipped because they don't have matching tabs in the template: {', '.join(skipped_subs)}")
-                    
-                    # Provide download button
-                    with open(output_path, "rb") as file:
-                        st.download_button(
-                            label="Download Pay Sheet",
-                            data=file,
-                            file_name=os.path.basename(output_path),
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        )
+                    if metrics_run:
+                        # This run ends here; the job's stages are written on their own and shown with its result
+                        finish_run(metrics_run)
+                    st.rerun()
+                except JobQueueFullError as e:
+                    st.error(f"The server is busy: {str(e)}")
     
     except Exception as e:
         st.error(f"Error processing files: {str(e)}")
 else:
-    st.info("Please upload both the Service Fusion report and the pay sheet template to proceed.") 
\ No newline at end of file
+    st.info("Please upload both the Service Fusion report and the pay sheet template to proceed.")
+
+# Pay sheet job of this session: progress while it runs, then the download
+if st.session_state.pay_sheet_job:
+    job = get_job_runner().get(st.session_state.pay_sheet_job)
+    if job is None:
+        st.session_state.pay_sheet_job = None
+        st.info("The last generated pay sheet has expired; generate it again to download it.")
+    elif not job.finished:
+        poll_pay_sheet_job(job.job_id)
+    elif job.status == "failed":
+        st.error(f"Error creating pay sheet: {job.error}")
+    else:
+        result = job.result
+        if result["cached"]:
+            st.caption("Served from the cache: generated earlier from the same report, template, dates, list and options.")
+        if result["weeks"]:
+            st.info(f"Created pay sheets for {len(result['weeks'])} weeks: " + ", ".join(f"{start:%m/%d} - {end:%m/%d}" for start, end in result["weeks"]))
+        if result["ledger_error"]:
+            st.warning(f"The pay sheet was created, but its jobs could not be recorded in the job ledger: {result['ledger_error']}")
+        
+        # Show warnings for skipped subcontractors
+        if result["skipped_subs"]:
+            st.warning(f"The following subcontractors were skipped because they don't have matching tabs in the template: {', '.join(result['skipped_subs'])}")
+        if result["tab_matches"]:
+            from utils.template_layout import describe_tab_match
+            for tab_match in result["tab_matches"]:
+                st.warning(describe_tab_match(tab_match))
+        
+        # Provide download button, streaming the generated bytes directly
+        is_zip = result["name"].endswith(".zip")
+        st.download_button(
+            label="Download Pay Sheets (ZIP)" if is_zip else "Download Pay Sheet",
+            data=result["data"],
+            file_name=result["name"],
+            mime="application/zip" if is_zip else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
+# Performance details for this run
+if metrics_run:
+    finish_run(metrics_run)
+    if show_performance:
+        with st.expander("Performance", expanded=True):
+            if metrics_run.spans:
+                st.caption(f"{metrics_run.total_seconds():.2f}s across {len(metrics_run.spans)} stages")
+                st.dataframe(metrics_run.records(), hide_index=True, use_container_width=True)
+            else:
+                st.caption("No stages ran on this interaction (cached results were reused).")
+            pay_sheet_job = get_job_runner().get(st.session_state.pay_sheet_job) if st.session_state.pay_sheet_job else None
+            if pay_sheet_job is not None and pay_sheet_job.metrics:
+                st.caption(f"{pay_sheet_job.label} job: {sum(record['seconds'] for record in pay_sheet_job.metrics):.2f}s across {len(pay_sheet_job.metrics)} stages")
+                st.dataframe(pay_sheet_job.metrics, hide_index=True, use_container_width=True)
+
+# Recent diagnostic events, on demand
+if show_diagnostics:
+    with st.expander("Diagnostics", expanded=True):
+        min_level = st.selectbox("Minimum level", ["DEBUG", "INFO", "WARNING", "ERROR"], index=1)
+        events = recent_events(min_level, limit=200)
+        if events:
+            st.dataframe(
+                [{**record, "fields": json.dumps(record["fields"], default=str)} for record in events],
+                hide_index=True,
+                use_container_width=True
+            )
+        else:
+            st.caption("No diagnostic events recorded yet.")
+
+# The page is drawn; import the pipeline modules and warm the caches for the first upload
+start_warmup()
@@ -0,0 +1,96 @@
+"""
+Generate pay sheets from the command line, without Streamlit.
+
+Examples:
+    python src/cli.py --pair report.xlsx template.xlsx --output-dir out
+    python src/cli.py --input-dir reports/ --template template.xlsx --output-dir out --workers 4
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime
+from utils.batch import discover_pairs, run_batch
+from utils.subs_store import load_subs, team_subs, TEAMS, ALL_TEAMS
+from utils.job_ledger import default_ledger_path
+from utils.diagnostics import configure_logging
+from utils.template_layout import describe_tab_match
+
+# Marker for "--ledger" given without a path
+LEDGER_DEFAULT = "default"
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD command-line date."""
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate subcontractor pay sheets from Service Fusion reports.")
+    parser.add_argument("--pair", nargs=2, action="append", default=[], metavar=("REPORT", "TEMPLATE"),
+                        help="A report and the template to fill from it (can be repeated)")
+    parser.add_argument("--input-dir", help="Process every .xlsx report in this directory (requires --template)")
+    parser.add_argument("--template", help="Template used for the reports in --input-dir")
+    parser.add_argument("--output-dir", required=True, help="Directory for the pay sheets and summary.json")
+    parser.add_argument("--team", default="Construction", choices=TEAMS)
+    parser.add_argument("--all-teams", action="store_true",
+                        help="Filter every team's subcontractors in one pass and write one pay sheet per team, as a ZIP")
+    parser.add_argument("--subs-file", help="Subcontractor list (one per line) instead of the team's saved list")
+    parser.add_argument("--start", type=parse_date, help="Week start (YYYY-MM-DD); inferred per report if omitted")
+    parser.add_argument("--end", type=parse_date, help="Week end (YYYY-MM-DD); inferred per report if omitted")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--engine", default="openpyxl", choices=["openpyxl", "xml"])
+    parser.add_argument("--per-sub", action="store_true", help="Write one workbook per subcontractor, bundled as a ZIP")
+    parser.add_argument("--split-weeks", action="store_true", help="Write one pay sheet per week of each report, as a ZIP")
+    parser.add_argument("--ledger", nargs="?", const=LEDGER_DEFAULT, metavar="PATH",
+                        help="Skip jobs already in the job ledger and record the new ones (default ledger if no PATH)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log progress at INFO level")
+
+    args = parser.parse_args(argv)
+    if args.input_dir and not args.template:
+        parser.error("--input-dir requires --template")
+    if not args.pair and not args.input_dir:
+        parser.error("give at least one --pair or an --input-dir")
+    if args.all_teams and (args.per_sub or args.split_weeks or args.subs_file):
+        parser.error("--all-teams cannot be combined with --per-sub, --split-weeks or --subs-file")
+    if bool(args.start) != bool(args.end):
+        parser.error("--start and --end must be given together")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(logging.INFO if args.verbose else logging.WARNING)
+
+    pairs = [tuple(pair) for pair in args.pair]
+    if args.input_dir:
+        pairs.extend(discover_pairs(args.input_dir, args.template))
+
+    teams = None
+    if args.subs_file:
+        with open(args.subs_file) as f:
+            subs_list = [line.strip() for line in f if line.strip()]
+    elif args.all_teams:
+        subs_list = load_subs(ALL_TEAMS)
+        teams = team_subs(ALL_TEAMS)
+    else:
+        subs_list = load_subs(args.team)
+
+    date_range = [args.start, args.end] if args.start else None
+    ledger_path = default_ledger_path() if args.ledger == LEDGER_DEFAULT else args.ledger
+    summary = run_batch(pairs, subs_list, args.output_dir, workers=args.workers, date_range=date_range,
+                        engine=args.engine, per_sub=args.per_sub, split_weeks=args.split_weeks, ledger_path=ledger_path,
+                        teams=teams)
+
+    print(f"Processed {summary['processed']} reports ({summary['failed']} failed) in {summary['seconds']}s")
+    for result in summary["results"]:
+        status = f"error: {result['error']}" if result["error"] else result["output"] or "no matching jobs"
+        print(f"  {result['report']}: {status}")
+        if result["skipped_subs"]:
+            print(f"    warning: no template tab for {', '.join(result['skipped_subs'])}")
+        for tab_match in result["tab_matches"]:
+            print(f"    warning: {describe_tab_match(tab_match)}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import io
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from .data_processing import infer_week_range, generate_preview
+from .excel_writer import build_pay_sheet, build_pay_sheet_bundle, build_weekly_pay_sheets, build_team_pay_sheets
+from .template_layout import describe_tab_match
+from .report_loader import load_report
+from .job_ledger import get_job_ledger
+from .instrumentation import collect_metrics, span
+from .diagnostics import diagnostics_run
+
+logger = logging.getLogger(__name__)
+
+# File name of the run summary written next to the outputs
+SUMMARY_FILENAME = "summary.json"
+
+
+def discover_pairs(input_dir, template_path):
+    """
+    Pair every report in a directory with the same template.
+
+    Args:
+        input_dir (str): Directory holding Service Fusion reports (.xlsx)
+        template_path (str): Pay sheet template used for every report
+
+    Returns:
+        list: List of (report_path, template_path) tuples, sorted by report name
+    """
+    template = Path(template_path).resolve()
+    reports = sorted(
+        path for path in Path(input_dir).glob("*.xlsx")
+        if path.resolve() != template and not path.name.startswith("~$")
+    )
+    return [(str(report), str(template)) for report in reports]
+
+
+def process_pair(report_path, template_path, subs_list, output_dir, date_range=None, engine="openpyxl", per_sub=False, split_weeks=False, ledger_path=None, teams=None):
+    """
+    Run the whole report -> pay sheet pipeline for one report/template pair.
+
+    Args:
+        report_path (str): Path of the Service Fusion report
+        template_path (str): Path of the pay sheet template
+        subs_list (list): List of approved subcontractor names
+        output_dir (str): Directory the pay sheet is written to
+        date_range (list): [start_date, end_date]; inferred from the report if not given
+        engine (str): Output engine, "openpyxl" or "xml"
+        per_sub (bool): Write the per-subcontractor ZIP bundle instead of a single workbook
+        split_weeks (bool): Write one pay sheet per week of the report, as a ZIP
+        ledger_path (str): Job ledger to skip already-paid jobs and record the new ones; not used if None
+        teams (dict): Team name -> subcontractor names; if given, subs_list is the union of the
+                      lists and one pay sheet per team is written, as a ZIP
+
+    Returns:
+        dict: Summary of the run (output path, date range, job count, warnings, skipped subs,
+              subs matched to a tab by similarity, error)
+    """
+    started = time.perf_counter()
+    result = {
+        "report": report_path,
+        "template": template_path,
+        "output": None,
+        "date_range": None,
+        "jobs": 0,
+        "warnings": [],
+        "skipped_subs": [],
+        "tab_matches": [],
+        "error": None
+    }
+
+    with collect_metrics(Path(report_path).name) as run, diagnostics_run(Path(report_path).name) as diagnostics:
+        try:
+            report_df, report_hash = load_report(Path(report_path).read_bytes())
+            ledger = get_job_ledger(ledger_path) if ledger_path else None
+            template_file = io.BytesIO(Path(template_path).read_bytes())
+
+            if not date_range:
+                with span("infer_week_range", rows=len(report_df)):
+                    date_range = list(infer_week_range(report_df))
+            result["date_range"] = [str(date_range[0]), str(date_range[1])]
+
+            with span("generate_preview", rows=len(report_df)) as timing:
+                filtered_df, warnings = generate_preview(report_df, subs_list, date_range, ledger=ledger, report_hash=report_hash)
+                timing.set(jobs=len(filtered_df))
+            result["warnings"] = warnings
+            result["jobs"] = len(filtered_df)
+
+            if not filtered_df.empty:
+                if teams:
+                    filename, data, skipped_subs, tab_matches, written_jobs = build_team_pay_sheets(template_file, filtered_df, teams, date_range, engine=engine)
+                elif split_weeks:
+                    filename, data, skipped_subs, tab_matches, weeks, written_jobs = build_weekly_pay_sheets(template_file, filtered_df, engine=engine)
+                    result["date_range"] = [str(weeks[0][0]), str(weeks[-1][1])]
+                    result["weeks"] = len(weeks)
+                else:
+                    build = build_pay_sheet_bundle if per_sub else build_pay_sheet
+                    filename, data, skipped_subs, tab_matches, written_jobs = build(template_file, filtered_df, date_range, engine=engine)
+                result["skipped_subs"] = list(skipped_subs)
+                result["tab_matches"] = tab_matches
+                result["warnings"].extend(describe_tab_match(tab_match) for tab_match in tab_matches)
+
+                # Prefix with the report name so reports covering the same week don't collide
+                output_path = Path(output_dir) / f"{Path(report_path).stem}__{filename}"
+                output_path.write_bytes(data)
+                result["output"] = str(output_path)
+                
+                if ledger is not None:
+                    # Only jobs that made it onto the pay sheet; skipped subs and overflow rows stay unpaid
+                    result["recorded_jobs"] = ledger.record(filtered_df.loc[written_jobs], None if split_weeks else date_range, report_hash)
+
+        except Exception as e:
+            logger.error(f"Error processing {report_path}: {str(e)}")
+            result["error"] = str(e)
+
+    result["timings"] = run.records()
+    result["counters"] = dict(diagnostics.counters)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_batch(pairs, subs_list, output_dir, workers=None, date_range=None, engine="openpyxl", per_sub=False, split_weeks=False, ledger_path=None, teams=None):
+    """
+    Process many report/template pairs concurrently and write a JSON summary.
+
+    Args:
+        pairs (list): List of (report_path, template_path) tuples
+        subs_list (list): List of approved subcontractor names
+        output_dir (str): Directory the pay sheets and summary.json are written to
+        workers (int): Number of worker processes (defaults to the number of CPUs)
+        date_range (list): [start_date, end_date] for every report; inferred per report if not given
+        engine (str): Output engine, "openpyxl" or "xml"
+        per_sub (bool): Write per-subcontractor ZIP bundles instead of single workbooks
+        split_weeks (bool): Write one pay sheet per week of each report, as a ZIP
+        ledger_path (str): Job ledger shared by all workers; not used if None
+        teams (dict): Team name -> subcontractor names, to write one pay sheet per team (see process_pair)
+
+    Returns:
+        dict: Summary with one entry per pair, in input order
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    results = [None] * len(pairs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(process_pair, report, template, subs_list, output_dir, date_range, engine, per_sub, split_weeks, ledger_path, teams): idx
+            for idx, (report, template) in enumerate(pairs)
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            status = "failed" if result["error"] else f"{result['jobs']} jobs"
+            logger.info(f"Processed {result['report']}: {status}")
+
+    summary = {
+        "processed": len(results),
+        "failed": sum(1 for result in results if result["error"]),
+        "seconds": round(time.perf_counter() - started, 3),
+        "results": results
+    }
+    with open(Path(output_dir) / SUMMARY_FILENAME, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    return summary
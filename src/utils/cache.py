@@ -0,0 +1,73 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def content_hash(data):
+    """
+    Compute a stable content hash for uploaded file bytes.
+
+    Args:
+        data (bytes): Raw file content
+
+    Returns:
+        str: Hex digest identifying the content
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+class LRUCache:
+    """
+    Small thread-safe least-recently-used cache shared by all sessions of the app.
+
+    Streamlit runs each session in its own thread, so every access is guarded by a lock.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key and mark it as most recently used.
+
+        Args:
+            key: Cache key
+            default: Value returned when the key is not cached
+
+        Returns:
+            The cached value or default
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """
+        Store a value, evicting the least recently used entries beyond max_entries.
+
+        Args:
+            key: Cache key
+            value: Value to store
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
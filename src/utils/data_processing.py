@@ -1,96 +1,21 @@
 import pandas as pd
-import os
-import streamlit as st
-from pathlib import Path
+import numpy as np
+from collections import Counter
 from datetime import datetime, timedelta
 import logging
+from .report_loader import TOTALS_MARKER
+from .name_index import get_name_index
+from .job_table import compact_jobs
+from .job_ledger import job_keys, tech_keys
+# The subcontractor list helpers live in subs_store (no pandas needed); re-exported for existing callers
+from .subs_store import load_subs, save_subs, subs_version, team_subs, team_membership  # noqa: F401
+from .diagnostics import event, enabled
+from .dates import parse_completed_on, week_starts
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Default list of subcontractors (fallback if file is missing or empty)
-DEFAULT_SUBS = [
-    "Fire Sprinkler Co.",
-    "HVAC Masters",
-    "Electric Pros"
-]
-
-# Path to the subcontractors text files
-# Use a more robust path approach
-CONSTRUCTION_SUBS_FILE = Path(os.path.abspath("subcontractors.txt"))
-WELDING_SUBS_FILE = Path(os.path.abspath("welding_subcontractors.txt"))
-
-@st.cache_data
-def load_subs(team="Construction"):
-    """
-    Load the subcontractor list from the text file for the specified team.
-    Falls back to default list if file is missing or empty.
-    
-    Args:
-        team (str): Team name ("Construction" or "Welding")
-    
-    Returns:
-        list: List of subcontractor names
-    """
-    try:
-        subs_file_path = CONSTRUCTION_SUBS_FILE if team == "Construction" else WELDING_SUBS_FILE
-        logger.info(f"Trying to load {team} subcontractors from: {subs_file_path}")
-        
-        if not subs_file_path.exists():
-            logger.info(f"Subcontractor file not found at {subs_file_path}. Using default list.")
-            return DEFAULT_SUBS
-        
-        with open(subs_file_path, 'r') as f:
-            lines = f.read().splitlines()
-        
-        # Filter out empty lines and strip whitespace
-        subs = [line.strip() for line in lines if line.strip()]
-        
-        if not subs:
-            logger.info(f"Subcontractor file is empty. Using default list.")
-            return DEFAULT_SUBS
-            
-        logger.info(f"Loaded {len(subs)} subcontractors from file: {subs}")
-        return subs
-    
-    except Exception as e:
-        logger.error(f"Error loading subcontractors: {str(e)}")
-        return DEFAULT_SUBS
-
-def save_subs(text, team="Construction"):
-    """
-    Save the subcontractor list to the text file for the specified team.
-    
-    Args:
-        text (str): Text content with one subcontractor per line
-        team (str): Team name ("Construction" or "Welding")
-    
-    Returns:
-        bool: True if successful, False otherwise
-    """
-    try:
-        # Split the text by newlines and filter out empty lines
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        
-        # Get absolute path
-        subs_file_path = CONSTRUCTION_SUBS_FILE if team == "Construction" else WELDING_SUBS_FILE
-        logger.info(f"Saving {team} subcontractors to: {subs_file_path}")
-        
-        # Write to file
-        with open(subs_file_path, 'w') as f:
-            f.write('\n'.join(lines))
-        
-        logger.info(f"Saved {len(lines)} subcontractors to file: {lines}")
-        
-        # Clear the load_subs cache so it reloads on next call
-        load_subs.clear()
-        
-        return True
-    
-    except Exception as e:
-        logger.error(f"Error saving subcontractors: {str(e)}")
-        return False
+# Number of rows sampled into DEBUG diagnostics
+DEBUG_SAMPLE_SIZE = 5
 
 def infer_week_range(df):
     """
@@ -112,13 +37,14 @@ def infer_week_range(df):
             end = start + timedelta(days=6)  # Sunday
             return start, end
         
-        # Convert to datetime, handling potential errors
-        df['Completed On'] = pd.to_datetime(df['Completed On'], errors='coerce')
+        # Parsed once by the report loader; raw values are converted here without touching
+        # the report, because it may be the cached copy shared with other sessions.
+        completed_on = parse_completed_on(df['Completed On'])
         
         # Drop rows with missing dates for the purpose of inference
-        dates_df = df.dropna(subset=['Completed On'])
+        completed_on = completed_on.dropna()
         
-        if dates_df.empty:
+        if completed_on.empty:
             logger.warning("No valid dates found in 'Completed On' column.")
             # Return current week's Monday and Sunday as fallback
             today = datetime.now().date()
@@ -127,8 +53,8 @@ def infer_week_range(df):
             return start, end
         
         # Get min and max dates
-        min_date = dates_df['Completed On'].min().date()
-        max_date = dates_df['Completed On'].max().date()
+        min_date = completed_on.min().date()
+        max_date = completed_on.max().date()
         
         # Find the Monday of the week containing the min date
         start_date = min_date - timedelta(days=min_date.weekday())
@@ -153,15 +79,140 @@ def infer_week_range(df):
         end = start + timedelta(days=6)  # Sunday
         return start, end
 
-def generate_preview(df, subs_list, date_range):
+def split_by_week(df):
+    """
+    Bucket jobs into Monday-Sunday (ISO) weeks by their 'Completed On' date, in one pass.
+    
+    Args:
+        df (pandas.DataFrame): Jobs with a 'Completed On' column
+    
+    Returns:
+        tuple: (weeks, undated_count) - list of ((start_date, end_date), DataFrame) sorted by week,
+               and the number of jobs without a valid date (left out of every week)
+    """
+    mondays = week_starts(df['Completed On'])
+    undated_count = int(mondays.isna().sum())
+    
+    weeks = []
+    for week_start, week_df in df.groupby(mondays, sort=True):
+        start_date = week_start.date()
+        weeks.append(((start_date, start_date + timedelta(days=6)), week_df))
+    
+    if undated_count:
+        logger.warning(f"{undated_count} jobs have no valid 'Completed On' date and are not in any week")
+    logger.info(f"Split {len(df)} jobs into {len(weeks)} weeks")
+    return weeks, undated_count
+
+def normalize_tech_keys(tech):
     """
-    Filter the report based on subcontractor list and Invoiced status only.
+    Compute the case- and whitespace-insensitive matching key of each Tech value.
+
+    Normalization runs once per distinct Tech name rather than once per row, and the
+    result is returned as a categorical Series aligned with the input.
+
+    Args:
+        tech (pandas.Series): Tech column of the report
+
+    Returns:
+        pandas.Series: Categorical Series of normalized Tech keys
+    """
+    codes, uniques = pd.factorize(tech, use_na_sentinel=False)
+    normalized = pd.Index([str(value) for value in uniques], dtype=object).str.lower().str.strip()
+    key_codes, categories = pd.factorize(normalized)
+    return pd.Series(
+        pd.Categorical.from_codes(key_codes[codes], categories=categories),
+        index=tech.index,
+        name=tech.name
+    )
+
+def flag_repeated_jobs(filtered_df, warnings, ledger=None, report_hash=None, include_paid=False):
+    """
+    Flag jobs listed twice in the report, and jobs already paid according to the ledger.
+    Expects the compact job table (see job_table.compact_jobs).
+    
+    Adds a 'Duplicate' column (every repeat of a Job# for the same subcontractor after the
+    first) and, with a ledger, a 'Paid Week' column holding the start of the pay week an
+    earlier report put the job on. Already-paid jobs are dropped unless include_paid.
+    
+    Args:
+        filtered_df (pandas.DataFrame): Jobs of the selected subcontractors
+        warnings (list): Warning messages, appended to
+        ledger (JobLedger): Ledger of jobs already on a pay sheet
+        report_hash (str): Hash of the report the jobs come from
+        include_paid (bool): Keep already-paid jobs instead of dropping them
+    
+    Returns:
+        pandas.DataFrame: The jobs with the flag columns
+    """
+    if 'Job#' not in filtered_df.columns:
+        return filtered_df
+    
+    # Keyed as in the ledger, so 1001, 1001.0 and "1001 " are one job even when a text
+    # Job# elsewhere in the report keeps the column from being numeric
+    keys = pd.DataFrame({'job': job_keys(filtered_df['Job#']), 'tech': tech_keys(filtered_df['Tech'])})
+    duplicate = keys.duplicated() & keys['job'].notna()
+    filtered_df = filtered_df.assign(Duplicate=duplicate)
+    if duplicate.any():
+        msg = f"{int(duplicate.sum())} jobs appear more than once in the report for the same subcontractor (marked as Duplicate)."
+        logger.warning(msg)
+        warnings.append(msg)
+    
+    if ledger is None:
+        return filtered_df
+    
+    try:
+        paid = ledger.find_paid(filtered_df)
+    except Exception as e:
+        msg = f"Could not check the job ledger for already-paid jobs: {str(e)}"
+        logger.error(msg)
+        warnings.append(msg)
+        return filtered_df
+    
+    # Jobs recorded from this same report are a re-run, not a second payment
+    already_paid = paid['recorded'] & (paid['report_hash'] != report_hash)
+    filtered_df = filtered_df.assign(**{'Paid Week': paid['week_start'].where(already_paid)})
+    paid_count = int(already_paid.sum())
+    if paid_count:
+        if include_paid:
+            msg = f"{paid_count} jobs are already on an earlier pay sheet (see Paid Week)."
+        else:
+            filtered_df = filtered_df.loc[~already_paid.to_numpy()]
+            msg = f"Skipped {paid_count} jobs already on an earlier pay sheet."
+        logger.warning(msg)
+        warnings.append(msg)
+    
+    return filtered_df
+
+def generate_preview(df, subs_list, date_range, ledger=None, report_hash=None, include_paid=False):
+    """
+    Filter the report to the invoiced jobs of the listed subcontractors.
     Ensures we keep the property address and job details columns for the pay sheet.
     
+    Jobs are not filtered by date: 'Completed On' is parsed once and jobs without a
+    valid completion date are kept and flagged in 'Missing Date'. Jobs repeated in the
+    report are flagged in 'Duplicate' and, with a ledger, jobs already on an earlier
+    pay sheet are dropped or flagged (see flag_repeated_jobs).
+    
+    The report is never copied as a whole: the Totals, subcontractor and Status
+    conditions are combined into one boolean mask and only matching rows are taken,
+    and those are returned as a compact job table (see job_table.compact_jobs).
+    Per-row diagnostics are only produced when DEBUG logging is enabled, and then
+    only for a small sample of rows.
+    
+    Tech names are matched to the list through a name index (see name_index.py), so
+    differences in dashes, punctuation, spacing and word order don't drop jobs. Matched
+    rows get the subcontractor's name from the list in 'Tech'; fuzzy matches are
+    reported in the warnings.
+    
     Args:
         df (pandas.DataFrame): Service Fusion report DataFrame
         subs_list (list): List of approved subcontractor names
-        date_range (list): Not used for filtering
+        date_range (list): [start_date, end_date] of the pay sheet; jobs outside it are kept
+                           (it identifies the request, see job_runner.request_key)
+        ledger (JobLedger): Ledger of jobs already on a pay sheet; not consulted if None
+        report_hash (str): Hash of the report; jobs recorded from this same report are not
+                           treated as paid, so regenerating a pay sheet is not blocked
+        include_paid (bool): Keep already-paid jobs (flagged in 'Paid Week') instead of dropping them
     
     Returns:
         tuple: (filtered_df, warnings) - DataFrame of filtered jobs and list of warning messages
@@ -169,91 +220,93 @@ def generate_preview(df, subs_list, date_range):
     warnings = []
     
     try:
-        # Make a copy to avoid modifying the original
-        filtered_df = df.copy()
-        original_count = len(filtered_df)
-        logger.info(f"Starting with {original_count} total rows")
-        
-        # Print column names for debugging
-        logger.info(f"Columns in the DataFrame: {list(filtered_df.columns)}")
+        original_count = len(df)
+        available_cols = list(df.columns)
+        event("report_columns", logging.DEBUG, f"Report has {len(available_cols)} columns", columns=available_cols)
         
         # Check for important columns used for the pay sheet
         important_cols = ['Tech', 'Job#', 'Job Category', 'Service Location Address 1', 'Job Details', 'Customer', 'Customer)', 'Customer )']
-        available_cols = list(filtered_df.columns)
         missing_important = [col for col in important_cols if col not in available_cols]
         
         # Check specifically for Customer column variations
         customer_cols_found = [col for col in ['Customer', 'Customer)', 'Customer )'] if col in available_cols]
         
-        if customer_cols_found:
-            logger.info(f"Found Customer column variations: {customer_cols_found}")
-        else:
-            logger.warning(f"No Customer column found! Available columns: {available_cols}")
+        if not customer_cols_found:
+            event("customer_column_missing", logging.WARNING, "No Customer column found", columns=len(available_cols))
             warnings.append("Customer column not found in the report. Property field will use Service Location Address as fallback.")
         
         if missing_important:
-            logger.warning(f"Some important columns are missing that may be needed for the pay sheet: {missing_important}")
             # Only warn about truly missing columns (exclude Customer variations if at least one is found)
             truly_missing = [col for col in missing_important if not (col.startswith('Customer') and customer_cols_found)]
             if truly_missing:
+                logger.warning(f"Some important columns are missing that may be needed for the pay sheet: {truly_missing}")
                 warnings.append(f"Missing columns needed for pay sheet: {', '.join(truly_missing)}. Output may be incomplete.")
-
-        # Convert Tech column to string to handle potential numeric values
-        filtered_df['Tech'] = filtered_df['Tech'].astype(str)
-        
-        # Filter out rows with "Totals represent tech's share" in the Tech column
-        totals_mask = filtered_df['Tech'].str.contains("Totals represent tech's share", na=False, case=False)
-        filtered_df = filtered_df[~totals_mask]
-        non_totals_count = len(filtered_df)
-        logger.info(f"After removing 'Totals' rows: {non_totals_count} rows (removed {original_count - non_totals_count})")
         
-        # Add debug info - what are all the unique tech names?
-        unique_techs = filtered_df['Tech'].unique()
-        logger.info(f"All unique Tech names in data: {list(unique_techs)}")
+        # Classify each distinct Tech name once, then broadcast to rows through the codes
+        tech_keys = normalize_tech_keys(df['Tech'])
+        categories = tech_keys.cat.categories
+        is_totals = categories.str.contains(TOTALS_MARKER, regex=False)
+        sub_index = get_name_index(tuple(subs_list))
+        matches = [None if totals else sub_index.match(key) for key, totals in zip(categories, is_totals)]
+        is_sub = np.array([match is not None for match in matches], dtype=bool)
+        # Every spelling of a subcontractor is written under their name from the list;
+        # sub_codes maps each Tech category to the code of that name
+        sub_names = pd.Index(sorted({match.name for match in matches if match}), dtype=object)
+        sub_codes = sub_names.get_indexer([match.name if match else None for match in matches])
+        
+        codes = tech_keys.cat.codes.to_numpy()
+        sub_mask = is_sub[codes]
+        sub_count = int(sub_mask.sum())
+        totals_count = int(is_totals[codes].sum())
+        
+        # Report how the subcontractors were matched; fuzzy matches need a human look
+        method_counts = Counter(match.method for match in matches if match)
+        if method_counts:
+            event("tech_matches", logging.INFO, "Matched Tech names", **method_counts)
+        for key, match in zip(categories, matches):
+            if match and match.method == "fuzzy":
+                warnings.append(f"Tech '{key}' was matched to subcontractor '{match.name}' by similarity ({match.score:.0%}). Check this is the same subcontractor.")
+        
+        if 'Status' in df.columns:
+            mask = sub_mask & (df['Status'] == 'Invoiced').to_numpy()
+        else:
+            mask = sub_mask
         
-        # Log subcontractor list we're checking against
-        logger.info(f"Filtering for subcontractors: {subs_list}")
+        filtered_df = df.loc[mask]
+        event("preview_filtered", logging.INFO, f"Filtered {original_count} rows, {len(filtered_df)} invoiced jobs kept",
+              rows=original_count, totals_rows=totals_count, sub_rows=sub_count, kept=len(filtered_df))
         
-        # Filter by subcontractor list (case-insensitive)
-        subs_lower = [sub.lower().strip() for sub in subs_list]
-        subs_mask = filtered_df['Tech'].str.lower().str.strip().isin(subs_lower)
-        filtered_df = filtered_df[subs_mask]
-        sub_filtered_count = len(filtered_df)
-        logger.info(f"After filtering for selected subcontractors: {sub_filtered_count} rows (removed {non_totals_count - sub_filtered_count})")
+        if enabled(logging.DEBUG):
+            unmatched = categories[~is_sub & ~is_totals]
+            event("tech_unmatched", logging.DEBUG, f"{len(unmatched)} Tech names not in the list",
+                  subs=len(subs_list), unmatched=len(unmatched), examples=list(unmatched[:DEBUG_SAMPLE_SIZE]))
+            for idx, row in filtered_df.head(DEBUG_SAMPLE_SIZE).iterrows():
+                event("preview_row", logging.DEBUG, f"Row {idx}", tech=row['Tech'], job=row.get('Job#', 'N/A'),
+                      status=row.get('Status', 'N/A'), completed_on=row.get('Completed On', 'N/A'))
         
-        if filtered_df.empty:
+        if sub_count == 0:
             msg = "No jobs match the selected subcontractors."
             logger.warning(msg)
             warnings.append(msg)
-            return filtered_df, warnings
-        
-        # Debug - what's in filtered_df BEFORE status filter?
-        for idx, row in filtered_df.iterrows():
-            logger.info(f"Row {idx}: Tech={row['Tech']}, Job#={row['Job#']}, Status={row.get('Status', 'N/A')}, Completed On={row.get('Completed On', 'N/A')}")
-        
-        # Filter for rows where Status is "Invoiced" if the column exists
-        if 'Status' in filtered_df.columns:
-            # Log all unique status values
-            unique_statuses = filtered_df['Status'].unique()
-            logger.info(f"All unique Status values: {list(unique_statuses)}")
-            
-            invoiced_mask = filtered_df['Status'] == 'Invoiced'
-            filtered_df = filtered_df[invoiced_mask]
-            invoiced_count = len(filtered_df)
-            logger.info(f"After filtering for 'Invoiced' status: {invoiced_count} rows (removed {sub_filtered_count - invoiced_count})")
-        
-        # Set Missing Date flag to False for all rows (no date filtering)
-        filtered_df['Missing Date'] = False
+            return compact_jobs(filtered_df), warnings
+        
+        # Flag rows without a completion date (no date filtering is applied). Dates parsed by
+        # the report loader pass through; raw ones are parsed here once for the writer too.
+        columns = {'Tech': pd.Categorical.from_codes(sub_codes[codes[mask]], categories=sub_names)}
+        if 'Completed On' in filtered_df.columns:
+            columns['Completed On'] = parse_completed_on(filtered_df['Completed On'], report_hash)
+            columns['Missing Date'] = columns['Completed On'].isna()
+        else:
+            columns['Missing Date'] = True
+        filtered_df = filtered_df.assign(**columns)
+        # Carry only what the writer needs, in compact dtypes, into session state
+        filtered_df = compact_jobs(filtered_df)
+        filtered_df = flag_repeated_jobs(filtered_df, warnings, ledger, report_hash, include_paid)
         
         if filtered_df.empty:
             msg = "No jobs match the criteria (subcontractor and Invoiced status)."
             logger.warning(msg)
             warnings.append(msg)
-        else:
-            # Log the FINAL results
-            logger.info(f"Final result: {len(filtered_df)} jobs")
-            for idx, row in filtered_df.head(20).iterrows():
-                logger.info(f"Final row {idx}: Tech={row['Tech']}, Job#={row['Job#']}, Status={row.get('Status', 'N/A')}, Completed On={row.get('Completed On', 'N/A')}")
         
         return filtered_df, warnings
     
@@ -261,4 +314,4 @@ def generate_preview(df, subs_list, date_range):
         msg = f"Error generating preview: {str(e)}"
         logger.error(msg)
         warnings.append(msg)
-        return pd.DataFrame(), warnings 
\ No newline at end of file
+        return pd.DataFrame(), warnings
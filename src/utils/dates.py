@@ -0,0 +1,194 @@
+import logging
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from .cache import LRUCache
+from .diagnostics import count
+from .xlsx_patch import EXCEL_EPOCH
+
+logger = logging.getLogger(__name__)
+
+# Text date formats tried on a sample of a report's dates, most common Service Fusion export first.
+# Month-first only: day-first formats would silently swap day and month of US dates.
+DATE_FORMATS = [
+    '%m/%d/%Y',
+    '%m/%d/%Y %I:%M %p',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%y',
+    '%m/%d/%y %I:%M %p',
+    '%Y-%m-%d',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%b %d, %Y',
+    '%B %d, %Y'
+]
+
+# Distinct text values checked against DATE_FORMATS
+FORMAT_SAMPLE_SIZE = 50
+
+# Numbers in this range are read as Excel serial dates (1900-01-01 to 9999-12-31)
+EXCEL_SERIAL_RANGE = (1, 2958465)
+
+# Inferred formats keyed by report hash, so a report is only sampled once
+MAX_CACHED_FORMATS = 32
+_format_cache = LRUCache(max_entries=MAX_CACHED_FORMATS)
+
+# Marks a report whose sample matched none of DATE_FORMATS (cached like a format)
+_NO_FORMAT = ""
+
+
+def from_excel_serial(values):
+    """
+    Convert Excel serial day numbers to datetimes in one vectorized pass.
+
+    Args:
+        values (pandas.Series): Numbers (days since 1899-12-30, fractions are the time of day)
+
+    Returns:
+        pandas.Series: datetime64 Series; NaT where the value is missing or out of range
+    """
+    numbers = pd.to_numeric(values, errors='coerce').astype('float64')
+    numbers = numbers.where(numbers.between(*EXCEL_SERIAL_RANGE))
+    return pd.Timestamp(EXCEL_EPOCH) + pd.to_timedelta(numbers, unit='D').dt.round('s')
+
+
+def infer_date_format(values, sample_size=FORMAT_SAMPLE_SIZE):
+    """
+    Find the format of DATE_FORMATS that parses the most values in a sample of distinct dates.
+
+    Values in other formats are left to per-element parsing, so a few odd dates do not
+    stop the rest of the report from being converted in one pass.
+
+    Args:
+        values (pandas.Series): Date strings
+        sample_size (int): Number of distinct values checked
+
+    Returns:
+        str: The best format, or None if none of them parses at least half of the sample
+    """
+    sample = pd.Series(pd.unique(values.dropna()), dtype=object)
+    if sample.empty:
+        return None
+    # Spread the sample over the report instead of taking only its first rows
+    if len(sample) > sample_size:
+        sample = sample.iloc[::len(sample) // sample_size][:sample_size]
+    best_format, best_count = None, len(sample) / 2
+    for date_format in DATE_FORMATS:
+        matched = int(pd.to_datetime(sample, format=date_format, errors='coerce').notna().sum())
+        if matched == len(sample):
+            return date_format
+        if matched > best_count:
+            best_format, best_count = date_format, matched
+    return best_format
+
+
+def _parse_text(text, report_hash=None):
+    """
+    Parse date strings: serial numbers, then one inferred format, then per-element parsing for the rest.
+
+    Each distinct string is parsed once; reports repeat the same dates across many jobs.
+    """
+    codes, uniques = pd.factorize(text)
+    uniques = pd.Series(uniques, dtype=object).str.strip()
+
+    # "45123" and "45123.5" are serial numbers that lost their cell type along the way
+    parsed = from_excel_serial(uniques)
+    rest = uniques[parsed.isna() & (uniques != "")]
+    if not rest.empty:
+        date_format = _format_cache.get(report_hash) if report_hash else None
+        if date_format is None:
+            date_format = infer_date_format(rest) or _NO_FORMAT
+            if report_hash:
+                _format_cache.put(report_hash, date_format)
+            logger.debug(f"Inferred 'Completed On' format {date_format or '(none)'}")
+
+        if date_format:
+            parsed[rest.index] = pd.to_datetime(rest, format=date_format, errors='coerce')
+            rest = rest[parsed[rest.index].isna()]
+        if not rest.empty:
+            # Values the inferred format cannot handle (mixed formats) are parsed one by one
+            count("dates_parsed_per_element", len(rest))
+            parsed[rest.index] = pd.to_datetime(rest, errors='coerce', format='mixed')
+
+    # Missing values have code -1, which picks the NaT appended at the end
+    values = np.append(parsed.to_numpy(dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))[codes]
+    return pd.Series(values, index=text.index, dtype='datetime64[ns]')
+
+
+def parse_completed_on(values, report_hash=None):
+    """
+    Convert the 'Completed On' column to datetimes, vectorized per kind of value.
+
+    Cells openpyxl already read as dates are kept, numbers are converted as Excel serial
+    dates, and text is parsed with one format inferred from a sample of the values
+    (cached per report_hash). Only text the inferred format cannot handle is parsed
+    element by element, so mixed date formats still come out right; anything
+    unparseable is NaT. Columns that are already datetimes are returned unchanged, so
+    every consumer can call this on the parsed report for free.
+
+    Args:
+        values (pandas.Series): Raw 'Completed On' values
+        report_hash (str): Hash of the report the values come from, to reuse its inferred format
+
+    Returns:
+        pandas.Series: datetime64 Series aligned with values
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return from_excel_serial(values)
+    if pd.api.types.is_string_dtype(values) and not pd.api.types.is_object_dtype(values):
+        return _parse_text(values, report_hash)
+
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind == 'empty':
+        return pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    if kind == 'string':
+        return _parse_text(values, report_hash)
+    if kind in ('integer', 'floating', 'mixed-integer-float', 'decimal'):
+        return from_excel_serial(values)
+    if kind in ('datetime', 'datetime64', 'date'):
+        return pd.to_datetime(values, errors='coerce').astype('datetime64[ns]')
+
+    # Mixed cells: split them by type once and convert each group in one pass
+    types = values.map(type)
+    is_text = types == str
+    is_number = types.isin([int, float]) & values.notna()
+    parsed = pd.to_datetime(values.where(~(is_text | is_number)), errors='coerce').astype('datetime64[ns]')
+    if is_number.any():
+        parsed[is_number] = from_excel_serial(values[is_number])
+    if is_text.any():
+        parsed[is_text] = _parse_text(values[is_text], report_hash)
+    return parsed
+
+
+def week_starts(dates):
+    """Monday of each date's Monday-Sunday week (NaT stays NaT)."""
+    dates = parse_completed_on(dates).dt.normalize()
+    return dates - pd.to_timedelta(dates.dt.weekday, unit='D')
+
+
+def week_histogram(dates):
+    """
+    Count jobs per Monday-Sunday week, for choosing the pay week.
+
+    Args:
+        dates (pandas.Series): 'Completed On' values (parsed or raw)
+
+    Returns:
+        pandas.DataFrame: Week Start, Week End (datetime.date) and Jobs, one row per week
+                          with jobs, earliest week first; undated jobs are left out
+    """
+    counts = week_starts(dates).value_counts().sort_index()
+    starts = [week_start.date() for week_start in counts.index]
+    return pd.DataFrame({
+        'Week Start': starts,
+        'Week End': [start + timedelta(days=6) for start in starts],
+        'Jobs': counts.to_numpy(dtype=int)
+    })
+
+
+def clear_format_cache():
+    """Forget the inferred date format of every report."""
+    _format_cache.clear()
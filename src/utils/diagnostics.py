@@ -0,0 +1,240 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Console log format and level set up by the app and the CLI (library modules never configure logging)
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_LEVEL_ENV = "SUBPAY_LOG_LEVEL"
+
+# Diagnostic events below this level are only counted, never kept or logged
+DIAGNOSTICS_LEVEL_ENV = "SUBPAY_DIAGNOSTICS_LEVEL"
+DEFAULT_DIAGNOSTICS_LEVEL = "INFO"
+
+# Events kept in memory for the UI; the oldest are dropped first
+DIAGNOSTICS_BUFFER_ENV = "SUBPAY_DIAGNOSTICS_BUFFER"
+DEFAULT_DIAGNOSTICS_BUFFER = 1000
+
+# Per-event sampling: an event with rate N keeps its 1st, N+1th, 2N+1th, ... occurrence in
+# each run. Overridden per event with SUBPAY_DIAGNOSTICS_SAMPLE="sheet_filled=50,sheet_matched=1".
+DIAGNOSTICS_SAMPLE_ENV = "SUBPAY_DIAGNOSTICS_SAMPLE"
+DEFAULT_SAMPLE_RATES = {
+    "sheet_filled": 20,
+    "sheet_matched": 20,
+    "sheet_missing": 5,
+    "sheet_truncated": 5
+}
+
+
+def parse_level(value):
+    """Logging level from a name ("DEBUG") or number ("10")."""
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    level = logging.getLevelName(value.upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {value}")
+    return level
+
+
+def _parse_sample_rates(text):
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        name, _, every = item.partition("=")
+        try:
+            rates[name.strip()] = max(1, int(every))
+        except ValueError:
+            logger.warning(f"Ignoring invalid sample rate '{item}' in {DIAGNOSTICS_SAMPLE_ENV}")
+    return rates
+
+
+class DiagnosticsRun:
+    """Counters of every diagnostic event in one pipeline run (a preview, a pay sheet, a batch report)."""
+
+    def __init__(self, label):
+        self.label = label
+        self.run_id = uuid.uuid4().hex[:12]
+        self.start = time.perf_counter()
+        self.counters = Counter()
+        self.seen = Counter()
+
+    def summary(self):
+        """
+        Return the run's counters.
+
+        Returns:
+            dict: label, run_id, seconds and every counter recorded in the run
+        """
+        return {
+            "label": self.label,
+            "run_id": self.run_id,
+            "seconds": round(time.perf_counter() - self.start, 4),
+            "counters": dict(self.counters)
+        }
+
+
+# Diagnostics run of the current job/thread; events outside a run are sampled process-wide
+_current_run = contextvars.ContextVar("subpay_diagnostics_run", default=None)
+_lock = threading.Lock()
+_level = parse_level(os.environ.get(DIAGNOSTICS_LEVEL_ENV, DEFAULT_DIAGNOSTICS_LEVEL))
+_sample_rates = _parse_sample_rates(os.environ.get(DIAGNOSTICS_SAMPLE_ENV))
+_buffer = deque(maxlen=int(os.environ.get(DIAGNOSTICS_BUFFER_ENV, DEFAULT_DIAGNOSTICS_BUFFER)))
+_seen = Counter()
+
+
+def configure_logging(level=None):
+    """
+    Send log records to the console, once per process (called by the app and the CLI).
+
+    Args:
+        level: Root log level; SUBPAY_LOG_LEVEL (default INFO) if None
+    """
+    level = parse_level(level if level is not None else os.environ.get(LOG_LEVEL_ENV, "INFO"))
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+    logging.getLogger().setLevel(level)
+
+
+def set_level(level):
+    """Change the minimum level of kept diagnostic events; returns the previous level."""
+    global _level
+    previous, _level = _level, parse_level(level)
+    return previous
+
+
+def set_sample_rate(name, every):
+    """Keep one in every occurrences of the event name per run (1 keeps all)."""
+    _sample_rates[name] = max(1, int(every))
+
+
+def set_buffer_size(size):
+    """Keep the newest size events in the ring buffer (existing events are kept up to size)."""
+    global _buffer
+    with _lock:
+        _buffer = deque(_buffer, maxlen=int(size))
+
+
+def enabled(level):
+    """True if events at level are kept; use it to skip building costly event fields."""
+    return level >= _level
+
+
+def count(name, value=1):
+    """Add value to a counter of the current run's summary, without recording an event."""
+    run = _current_run.get()
+    if run is not None:
+        run.counters[name] += value
+
+
+def event(name, level=logging.INFO, message="", **fields):
+    """
+    Record a structured diagnostic event.
+
+    Every occurrence is counted in the current run's summary. Occurrences at or above
+    the diagnostics level that pass the event's sampling are also kept in the ring
+    buffer and logged as one line with the fields as JSON.
+
+    Args:
+        name (str): Event name, e.g. "sheet_filled"
+        level (int): Logging level of the event
+        message (str): Human-readable description
+        **fields: Structured values (counts, names); must be JSON-serializable or str()-able
+
+    Returns:
+        bool: True if the event was kept, False if it was gated or sampled out
+    """
+    run = _current_run.get()
+    if run is not None:
+        run.counters[name] += 1
+    if level < _level:
+        return False
+
+    every = _sample_rates.get(name, 1)
+    if every > 1:
+        if run is not None:
+            run.seen[name] += 1
+            occurrence = run.seen[name]
+        else:
+            with _lock:
+                _seen[name] += 1
+                occurrence = _seen[name]
+        if (occurrence - 1) % every:
+            return False
+
+    record = {
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "level": logging.getLevelName(level),
+        "event": name,
+        "run": run.label if run is not None else None,
+        "run_id": run.run_id if run is not None else None,
+        "message": message,
+        "fields": fields
+    }
+    with _lock:
+        _buffer.append(record)
+    logger.log(level, f"{name}: {message} {json.dumps(fields, default=str)}" if fields else f"{name}: {message}",
+               extra={"event": name, "fields": fields})
+    return True
+
+
+def recent_events(min_level=logging.DEBUG, limit=None, event_name=None):
+    """
+    Return kept events from the ring buffer, newest first.
+
+    Args:
+        min_level: Only events at or above this level (name or number)
+        limit (int): Maximum number of events returned
+        event_name (str): Only events with this name
+
+    Returns:
+        list: Event dicts (time, level, event, run, run_id, message, fields)
+    """
+    min_level = parse_level(min_level)
+    with _lock:
+        records = list(_buffer)
+    records = [
+        record for record in reversed(records)
+        if parse_level(record["level"]) >= min_level and (event_name is None or record["event"] == event_name)
+    ]
+    return records[:limit] if limit else records
+
+
+def clear_events():
+    """Empty the ring buffer and the process-wide sampling counts."""
+    with _lock:
+        _buffer.clear()
+        _seen.clear()
+
+
+@contextmanager
+def diagnostics_run(label):
+    """
+    Count diagnostic events in a block and record one summary event at the end.
+
+    Per-row and per-sheet events are sampled; the summary carries how many of each
+    occurred, so the log holds one line per run instead of one per row.
+
+    Args:
+        label (str): Name of the run, e.g. "Preview" or the report file
+
+    Yields:
+        DiagnosticsRun: The active run
+    """
+    run = DiagnosticsRun(label)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+        summary = run.summary()
+        event("run_summary", logging.INFO, f"{label} finished in {summary['seconds']}s",
+              run_id=run.run_id, seconds=summary["seconds"], counters=summary["counters"])
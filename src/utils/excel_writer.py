@@ -1,257 +1,721 @@
 import pandas as pd
-import openpyxl
+import numpy as np
+import io
 import os
+import re
+import shutil
 import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import logging
 from pathlib import Path
-import dateutil.parser
+from .data_processing import split_by_week
+from .subs_store import team_membership
+from .template_layout import get_template_layout, WRITTEN_COLUMNS
+from .xlsx_patch import patch_workbook, XlsxPatchError
+from .dates import parse_completed_on
+from .job_table import MAX_DESCRIPTION_LENGTH
+from .instrumentation import span
+from .diagnostics import event, count
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def create_pay_sheet(template_file, filtered_df, date_range):
+# Available output engines (see create_pay_sheet)
+ENGINES = ("openpyxl", "xml")
+
+# Directory for outputs spilled to disk, and how long they are kept
+SPILL_DIR = Path(tempfile.gettempdir()) / "sub_pay_sheets"
+SPILL_MAX_AGE_SECONDS = 60 * 60
+
+# Report columns that may hold the customer (property) name, in order of preference
+CUSTOMER_COLUMNS = ['Customer', 'Customer)', 'Customer )']
+
+# Columns derived once per job table and copied into the pay sheet rows, in written order
+SHEET_COLUMNS = ['Date', 'Property', 'Job Number', 'Description']
+
+def _text(values):
+    """str() of every present value, missing values kept missing; string columns are used as they are."""
+    if pd.api.types.is_string_dtype(values) and not pd.api.types.is_object_dtype(values):
+        return values
+    return values.astype(str).astype(object).where(values.notna())
+
+def resolve_sheet_columns(filtered_df):
     """
-    Create a pay sheet from the template and filtered job data.
+    Derive the written columns of every job at once, as whole columns.
+    
+    The report columns are resolved once instead of per row: Property is the first
+    non-empty Customer variant, falling back to the service address; Job Number is
+    the Job# as a whole number when it is numeric, otherwise as text; Description is
+    the Job Details cut to MAX_DESCRIPTION_LENGTH, falling back to the Job Category.
+    Missing values become "N/A". Frames that already have these columns (e.g. a
+    weekly split of a resolved frame) are returned unchanged.
     
     Args:
-        template_file: The uploaded template file object
         filtered_df (pandas.DataFrame): DataFrame of filtered jobs
+    
+    Returns:
+        pandas.DataFrame: filtered_df with SHEET_COLUMNS added (Date as datetime.date or None)
+    """
+    if all(col in filtered_df.columns for col in SHEET_COLUMNS):
+        return filtered_df
+    index = filtered_df.index
+    missing = pd.Series([None] * len(index), index=index, dtype=object)
+    
+    def column(name):
+        return filtered_df[name] if name in filtered_df.columns else missing
+    
+    if 'Completed On' in filtered_df.columns:
+        dates = parse_completed_on(filtered_df['Completed On'])
+        dates = dates.dt.date.astype(object).where(dates.notna(), None)
+    else:
+        dates = missing
+    
+    # First non-empty Customer variant, then the address (as is), then N/A
+    property_ = missing
+    for col in CUSTOMER_COLUMNS:
+        if col in filtered_df.columns:
+            customers = _text(filtered_df[col]).str.strip()
+            property_ = property_.where(property_.notna(), customers.where(customers != ""))
+    property_ = property_.where(property_.notna(), _text(column('Service Location Address 1'))).fillna("N/A")
+    
+    # Whole numbers where the Job# is numeric (truncated like int(float(...))), text otherwise
+    job_numbers = column('Job#')
+    if pd.api.types.is_integer_dtype(job_numbers):
+        job_number = job_numbers.astype(object).where(job_numbers.notna(), "N/A")
+    else:
+        numeric = pd.to_numeric(job_numbers, errors='coerce').astype('float64')
+        whole = np.isfinite(numeric)
+        job_number = _text(job_numbers).astype(object).where(job_numbers.notna(), "N/A")
+        if whole.any():
+            job_number = job_number.mask(whole, np.trunc(numeric.where(whole, 0)).astype('int64').astype(object))
+    
+    # Job Details, cut with "..." past the length limit, else the category, else N/A
+    details = _text(column('Job Details'))
+    too_long = details.str.len() > MAX_DESCRIPTION_LENGTH
+    if too_long.any():
+        details = details.where(~too_long, details.str.slice(0, MAX_DESCRIPTION_LENGTH) + "...")
+    description = details.where(details.notna(), _text(column('Job Category'))).fillna("N/A")
+    
+    return filtered_df.assign(**{'Date': dates, 'Property': property_, 'Job Number': job_number, 'Description': description})
+
+def group_sheet_rows(filtered_df):
+    """
+    Turn the filtered jobs into ready-to-write rows, grouped by subcontractor, with the
+    index of the job each row came from.
+
+    The written values are derived as whole columns (see resolve_sheet_columns), jobs
+    are stably sorted by (Tech, date) with undated jobs last, and a single groupby
+    splits them per subcontractor, so rows are only copied, never computed, per job.
+
+    Args:
+        filtered_df (pandas.DataFrame): DataFrame of filtered jobs, resolved or not
+
+    Returns:
+        tuple: (sheet_rows, row_indexes) - dict of Tech name -> list of (date, property,
+               job number, description, qty, per unit) tuples, with subcontractors in order
+               of first appearance in filtered_df, and dict of Tech name -> list of the
+               filtered_df index labels of those rows, in the same order
+    """
+    resolved = resolve_sheet_columns(filtered_df)
+    jobs = pd.DataFrame({
+        'Tech': resolved['Tech'],
+        'Sort Date': pd.to_datetime(resolved['Date']),
+        **{col: resolved[col] for col in SHEET_COLUMNS}
+    }, index=resolved.index)
+    jobs = jobs.sort_values(['Tech', 'Sort Date'], kind='mergesort', na_position='last')
+    
+    grouped = {}
+    indexes = {}
+    for sub, group in jobs.groupby('Tech', sort=False, observed=True):
+        job_count = len(group)
+        grouped[sub] = list(zip(*(group[col].tolist() for col in SHEET_COLUMNS), [1] * job_count, [None] * job_count))
+        indexes[sub] = group.index.tolist()
+    
+    subs = [sub for sub in pd.unique(filtered_df['Tech']) if sub in grouped]
+    return {sub: grouped[sub] for sub in subs}, {sub: indexes[sub] for sub in subs}
+
+def prepare_sheet_rows(filtered_df):
+    """
+    Turn the filtered jobs into ready-to-write rows, grouped by subcontractor (see group_sheet_rows).
+
+    Args:
+        filtered_df (pandas.DataFrame): DataFrame of filtered jobs, resolved or not
+
+    Returns:
+        dict: Tech name -> list of (date, property, job number, description, qty, per unit)
+              tuples, with subcontractors in order of first appearance in filtered_df
+    """
+    return group_sheet_rows(filtered_df)[0]
+
+def format_week_of(date_range):
+    """Format the date range as the "Week Of" text (MM/DD/YY - MM/DD/YY), or None if there is none."""
+    if date_range and len(date_range) == 2:
+        start_date, end_date = date_range
+        return f"{start_date.strftime('%m/%d/%y')} - {end_date.strftime('%m/%d/%y')}"
+    return None
+
+def plan_sheet_updates(sheet_rows, layout, date_range, row_indexes=None):
+    """
+    Work out every cell to write, per template sheet, independently of the output engine.
+    
+    Args:
+        sheet_rows (dict): Tech name -> row tuples, as returned by prepare_sheet_rows
+        layout (TemplateLayout): Compiled template layout
         date_range (list): [start_date, end_date] as datetime.date objects
+        row_indexes (dict): Tech name -> index label of each row, as returned by group_sheet_rows
     
     Returns:
-        tuple: (output_path, skipped_subs) - Path to the generated Excel file and list of skipped subcontractors
+        tuple: (sheet_updates, skipped_subs, tab_matches, written_jobs) - dict of sheet name ->
+               {(row, column): value}, list of subcontractors without a matching sheet, list of
+               subcontractors written to a tab matched by similarity rather than by name (dicts of
+               sub, sheet, method and score), and the index labels of the jobs actually written (None without
+               row_indexes); jobs of skipped subcontractors and jobs beyond a sheet's capacity are
+               not in it
     """
+    sheet_updates = {}
     skipped_subs = []
+    tab_matches = []
+    written_jobs = [] if row_indexes is not None else None
+    week_of_text = format_week_of(date_range)
+    
+    for sub, sub_rows in sheet_rows.items():
+        # Find matching sheet in template (normalized, with a bounded fuzzy fallback)
+        sheet_layout, match = layout.match_sheet(sub)
+        
+        if sheet_layout is None:
+            event("sheet_missing", logging.WARNING, f"No matching sheet found for subcontractor: {sub}", sub=sub)
+            skipped_subs.append(sub)
+            continue
+        if match.method != "exact":
+            event("sheet_matched", logging.INFO, f"Matched {sub} to sheet '{sheet_layout.sheet_name}'",
+                  sub=sub, sheet=sheet_layout.sheet_name, method=match.method, score=match.score)
+            # Case and spacing differences are expected; other matches are worth a check by the user
+            if match.method != "normalized":
+                tab_matches.append({"sub": sub, "sheet": sheet_layout.sheet_name, "method": match.method,
+                                    "score": round(match.score, 3)})
+        
+        cells = sheet_updates.setdefault(sheet_layout.sheet_name, {})
+        
+        # Add Week Of date range to the cell right of the "Week Of:" label (B4 if there is none)
+        if week_of_text:
+            cells[sheet_layout.week_of_cell] = week_of_text
+        
+        # Check if we'll exceed the available rows
+        max_rows = max(0, min(len(sub_rows), sheet_layout.capacity))
+        if len(sub_rows) > max_rows:
+            event("sheet_truncated", logging.WARNING, f"Only {max_rows} of {len(sub_rows)} jobs will be included for {sub} due to template limits",
+                  sub=sub, jobs=len(sub_rows), capacity=max_rows)
+        
+        # Date, Property, Job #, Description, Qty and Per Unit (columns A-F).
+        # Columns holding formulas in the template (e.g. Amount) are left untouched.
+        columns = [col for col in range(1, WRITTEN_COLUMNS + 1) if col not in sheet_layout.formula_columns]
+        for row, values in enumerate(sub_rows[:max_rows], start=sheet_layout.data_start_row):
+            for column in columns:
+                cells[(row, column)] = values[column - 1]
+        if written_jobs is not None:
+            written_jobs.extend(row_indexes[sub][:max_rows])
+        
+        event("sheet_filled", logging.DEBUG, f"Added {max_rows} of {len(sub_rows)} jobs for {sub}",
+              sub=sub, sheet=sheet_layout.sheet_name, jobs=max_rows)
+        count("jobs_written", max_rows)
+    
+    return sheet_updates, skipped_subs, tab_matches, written_jobs
+
+def apply_sheet_updates(workbook, sheet_updates, progress=None):
+    """
+    Write planned cell values into an openpyxl workbook.
     
+    Args:
+        workbook (openpyxl.Workbook): Loaded template workbook
+        sheet_updates (dict): Sheet name -> {(row, column): value}
+        progress (callable): Called as progress(done, total, message) after each sheet
+    """
+    for done, (sheet_name, cells) in enumerate(sheet_updates.items(), start=1):
+        sheet = workbook[sheet_name]
+        for (row, column), value in cells.items():
+            sheet.cell(row=row, column=column).value = value
+        if progress:
+            progress(done, len(sheet_updates), f"Filled sheet '{sheet_name}'")
+
+def output_filename(date_range, prefix="Sub_PaySheet", extension="xlsx"):
+    """
+    Build the download file name from the date range.
+    
+    Args:
+        date_range (list): [start_date, end_date] as datetime.date objects
+        prefix (str): File name prefix
+        extension (str): File extension without the dot
+    
+    Returns:
+        str: File name such as Sub_PaySheet_2024-05-06_to_2024-05-12.xlsx
+    """
+    if date_range and len(date_range) == 2:
+        start_date_str = date_range[0].strftime("%Y-%m-%d")
+        end_date_str = date_range[1].strftime("%Y-%m-%d")
+        return f"{prefix}_{start_date_str}_to_{end_date_str}.{extension}"
+    # Fallback if date range is not provided
+    return f"{prefix}_{datetime.now().strftime('%Y-%m-%d')}.{extension}"
+
+def render_workbook(template_bytes, sheet_updates, engine="openpyxl", only_sheet=None, progress=None):
+    """
+    Apply planned cell values to the template and return the resulting XLSX content.
+    
+    Args:
+        template_bytes (bytes): Raw XLSX content of the template
+        sheet_updates (dict): Sheet name -> {(row, column): value}
+        engine (str): Output engine, "openpyxl" or "xml"
+        only_sheet (str): If given, every other sheet is removed from the output (openpyxl only)
+        progress (callable): Called as progress(done, total, message) after each sheet is filled
+    
+    Returns:
+        bytes: XLSX content of the filled workbook
+    """
+    cell_count = sum(len(cells) for cells in sheet_updates.values())
+    
+    if engine == "xml" and only_sheet is None:
+        try:
+            with span("patch_xml", sheets=len(sheet_updates), cells=cell_count):
+                return patch_workbook(template_bytes, sheet_updates, progress=progress)
+        except XlsxPatchError as e:
+            logger.warning(f"XML engine cannot patch this template ({str(e)}); falling back to openpyxl")
+    
+    # Load the workbook with openpyxl (preserving formulas), imported on first use to keep startup fast
+    import openpyxl
+    with span("load_template", bytes=len(template_bytes)) as timing:
+        workbook = openpyxl.load_workbook(io.BytesIO(template_bytes), keep_vba=False)
+        timing.set(sheets=len(workbook.sheetnames))
+    if only_sheet is not None:
+        for sheet_name in workbook.sheetnames:
+            if sheet_name != only_sheet:
+                workbook.remove(workbook[sheet_name])
+        workbook.active = 0
+        sheet_updates = {only_sheet: sheet_updates[only_sheet]}
+    
+    with span("write_cells", sheets=len(sheet_updates), cells=cell_count):
+        apply_sheet_updates(workbook, sheet_updates, progress=progress)
+    
+    with span("save_workbook") as timing:
+        output = io.BytesIO()
+        workbook.save(output)
+        timing.set(bytes=output.tell())
+    return output.getvalue()
+
+def render_workbooks(template_bytes, updates_by_output, engine="openpyxl", progress=None):
+    """
+    Fill the same template several times (e.g. once per team) from a single template load.
+    
+    With openpyxl the template is loaded once; for each output the planned cells are
+    written, the workbook saved, and the template's original values put back before
+    the next output. The XML engine patches each output from the template bytes.
+    
+    Args:
+        template_bytes (bytes): Raw XLSX content of the template
+        updates_by_output (dict): Output name -> sheet updates (sheet name -> {(row, column): value})
+        engine (str): Output engine, "openpyxl" or "xml"
+        progress (callable): Called as progress(done, total, message) as each output is finished
+    
+    Returns:
+        dict: Output name -> XLSX content
+    """
+    outputs = {}
+    total = len(updates_by_output)
+    
+    if engine == "xml":
+        try:
+            for done, (name, sheet_updates) in enumerate(updates_by_output.items(), start=1):
+                with span("patch_xml", sheets=len(sheet_updates)):
+                    outputs[name] = patch_workbook(template_bytes, sheet_updates)
+                if progress:
+                    progress(done, total, f"Created the {name} pay sheet")
+            return outputs
+        except XlsxPatchError as e:
+            logger.warning(f"XML engine cannot patch this template ({str(e)}); falling back to openpyxl")
+            outputs = {}
+    
+    import openpyxl
+    with span("load_template", bytes=len(template_bytes)) as timing:
+        workbook = openpyxl.load_workbook(io.BytesIO(template_bytes), keep_vba=False)
+        timing.set(sheets=len(workbook.sheetnames))
+    
+    for done, (name, sheet_updates) in enumerate(updates_by_output.items(), start=1):
+        originals = {
+            sheet_name: {cell: workbook[sheet_name].cell(row=cell[0], column=cell[1]).value for cell in cells}
+            for sheet_name, cells in sheet_updates.items()
+        }
+        with span("write_cells", sheets=len(sheet_updates), cells=sum(len(cells) for cells in sheet_updates.values())):
+            apply_sheet_updates(workbook, sheet_updates)
+        with span("save_workbook") as timing:
+            output = io.BytesIO()
+            workbook.save(output)
+            timing.set(bytes=output.tell())
+        outputs[name] = output.getvalue()
+        # Put the template back for the next output
+        apply_sheet_updates(workbook, originals)
+        if progress:
+            progress(done, total, f"Created the {name} pay sheet")
+    
+    return outputs
+
+def build_team_pay_sheets(template_file, filtered_df, team_lists, date_range, layout=None, engine="openpyxl", progress=None):
+    """
+    Create one pay sheet per team from an all-teams preview, bundled as a ZIP.
+    
+    The jobs of every team are sorted and grouped in one pass and the template is
+    loaded once (see render_workbooks); each team's pay sheet holds the tabs of the
+    subcontractors on that team's list. A subcontractor on several lists appears on
+    each of those teams' pay sheets, as when the teams are generated separately.
+    
+    Args:
+        template_file: The uploaded template file object
+        filtered_df (pandas.DataFrame): DataFrame of filtered jobs of every team
+        team_lists (dict): Team name -> list of subcontractor names
+        date_range (list): [start_date, end_date] as datetime.date objects
+        layout (TemplateLayout): Compiled template layout; looked up from the cache if not given
+        engine (str): Output engine, "openpyxl" or "xml"
+        progress (callable): Called as progress(done, total, message) as each team's pay sheet is finished
+    
+    Returns:
+        tuple: (filename, data, skipped_subs, tab_matches, written_jobs) - ZIP file name, ZIP content,
+               list of skipped subcontractors, subcontractors matched to a tab by similarity (see
+               plan_sheet_updates) and index labels of the jobs written to any team's pay sheet
+    """
     try:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown pay sheet engine: {engine}")
+        
         # Check if we have data to process
         if filtered_df.empty:
             raise ValueError("No jobs to include in the pay sheet")
         
-        # Create a temporary directory to save the file
-        temp_dir = tempfile.mkdtemp()
+        if layout is None:
+            layout = get_template_layout(template_file)
         
-        # Generate output filename based on date range
-        if date_range and len(date_range) == 2:
-            start_date_str = date_range[0].strftime("%Y-%m-%d")
-            end_date_str = date_range[1].strftime("%Y-%m-%d")
-            output_filename = f"Sub_PaySheet_{start_date_str}_to_{end_date_str}.xlsx"
-        else:
-            # Fallback if date range is not provided
-            output_filename = f"Sub_PaySheet_{datetime.now().strftime('%Y-%m-%d')}.xlsx"
+        with span("prepare_rows", rows=len(filtered_df)) as timing:
+            sheet_rows, row_indexes = group_sheet_rows(filtered_df)
+            membership = team_membership(sheet_rows, team_lists)
+            updates_by_team = {}
+            skipped_subs = []
+            tab_matches = []
+            # A job of a subcontractor on several teams is written once per team, but counted once
+            written_jobs = {}
+            for team in team_lists:
+                team_rows = {sub: rows for sub, rows in sheet_rows.items() if team in membership[sub]}
+                if not team_rows:
+                    continue
+                sheet_updates, team_skipped, team_matches, team_written = plan_sheet_updates(team_rows, layout, date_range, row_indexes)
+                skipped_subs.extend(sub for sub in team_skipped if sub not in skipped_subs)
+                _add_tab_matches(tab_matches, team_matches)
+                if sheet_updates:
+                    updates_by_team[team] = sheet_updates
+                    written_jobs.update(dict.fromkeys(team_written))
+            timing.set(teams=len(updates_by_team))
+        if not updates_by_team:
+            raise ValueError("None of the subcontractors with jobs have a tab in the template")
         
-        output_path = os.path.join(temp_dir, output_filename)
+        workbooks = render_workbooks(template_file.getvalue(), updates_by_team, engine, progress=progress)
         
-        # Save the template file to disk temporarily
-        temp_template = os.path.join(temp_dir, "template.xlsx")
-        with open(temp_template, "wb") as f:
-            f.write(template_file.getvalue())
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as bundle:
+            for team, data in workbooks.items():
+                bundle.writestr(output_filename(date_range, prefix=f"Sub_PaySheet_{_safe_filename(team)}"), data)
         
-        # Load the workbook with openpyxl (preserving formulas)
-        workbook = openpyxl.load_workbook(temp_template, keep_vba=False)
+        logger.info(f"Created pay sheets for {len(workbooks)} teams")
+        return output_filename(date_range, prefix="Sub_PaySheets_All_Teams", extension="zip"), output.getvalue(), skipped_subs, tab_matches, list(written_jobs)
+    
+    except Exception as e:
+        logger.error(f"Error creating team pay sheets: {str(e)}")
+        raise
+
+def _add_tab_matches(tab_matches, new_matches):
+    """Add the tab matches of one output (team or week) to tab_matches, once per subcontractor."""
+    seen = {match["sub"] for match in tab_matches}
+    tab_matches.extend(match for match in new_matches if match["sub"] not in seen)
+
+def _safe_filename(name):
+    """Replace characters that are not allowed in file names."""
+    return re.sub(r'[\\/:*?"<>|]+', '_', name).strip() or "sheet"
+
+def build_pay_sheet_bundle(template_file, filtered_df, date_range, layout=None, engine="openpyxl", max_workers=None, progress=None):
+    """
+    Create one workbook per subcontractor, in parallel, and bundle them as a ZIP in memory.
+    
+    Each subcontractor workbook holds only that subcontractor's tab, so it can be sent
+    to them directly. The combined workbook (every tab, as from create_pay_sheet) is
+    generated alongside and included in the ZIP. Workbooks are generated in a process
+    pool so busy weeks scale with the available cores.
+    
+    Args:
+        template_file: The uploaded template file object
+        filtered_df (pandas.DataFrame): DataFrame of filtered jobs
+        date_range (list): [start_date, end_date] as datetime.date objects
+        layout (TemplateLayout): Compiled template layout; looked up from the cache if not given
+        engine (str): Output engine used for the combined workbook, "openpyxl" or "xml"
+        max_workers (int): Maximum number of worker processes (defaults to the number of CPUs)
+        progress (callable): Called as progress(done, total, message) as each workbook is finished
+    
+    Returns:
+        tuple: (filename, data, skipped_subs, tab_matches, written_jobs) - ZIP file name, ZIP content,
+               list of skipped subcontractors, subcontractors matched to a tab by similarity and index
+               labels of the jobs written (see plan_sheet_updates)
+    """
+    try:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown pay sheet engine: {engine}")
         
-        # Get list of sheet names (case-insensitive for comparison)
-        sheet_names = {name.lower().strip(): name for name in workbook.sheetnames}
+        # Check if we have data to process
+        if filtered_df.empty:
+            raise ValueError("No jobs to include in the pay sheet")
+        
+        if layout is None:
+            layout = get_template_layout(template_file)
         
-        # Get unique subcontractors in the filtered data
-        unique_subs = filtered_df['Tech'].unique()
+        template_bytes = template_file.getvalue()
+        sheet_rows, row_indexes = group_sheet_rows(filtered_df)
+        sheet_updates, skipped_subs, tab_matches, written_jobs = plan_sheet_updates(sheet_rows, layout, date_range, row_indexes)
+        if not sheet_updates:
+            raise ValueError("None of the subcontractors with jobs have a tab in the template")
         
-        # Process each subcontractor
-        for sub in unique_subs:
-            # Find matching sheet in template (case-insensitive)
-            sub_key = sub.lower().strip()
-            
-            if sub_key not in sheet_names:
-                logger.warning(f"No matching sheet found for subcontractor: {sub}")
-                skipped_subs.append(sub)
-                continue
-            
-            # Get actual sheet name with correct case
-            actual_sheet_name = sheet_names[sub_key]
-            sheet = workbook[actual_sheet_name]
-            
-            # Add Week Of date range to the template (typically cell B4)
-            if date_range and len(date_range) == 2:
-                # Format as MM/DD/YY - MM/DD/YY
-                start_date, end_date = date_range
-                week_of_text = f"{start_date.strftime('%m/%d/%y')} - {end_date.strftime('%m/%d/%y')}"
-                
-                # Find the "Week Of:" cell and populate the cell to its right
-                week_of_cell_found = False
-                # Search first few rows for "Week Of:" label
-                for row_idx in range(1, 10):  # Search rows 1-9
-                    for col_idx in range(1, 5):  # Search first few columns
-                        cell_value = sheet.cell(row=row_idx, column=col_idx).value
-                        if cell_value and "Week Of" in str(cell_value):
-                            # Found the Week Of label, now populate the cell to its right
-                            sheet.cell(row=row_idx, column=col_idx+1).value = week_of_text
-                            logger.info(f"Added Week Of: {week_of_text} to row {row_idx}, column {col_idx+1}")
-                            week_of_cell_found = True
-                            break
-                    if week_of_cell_found:
-                        break
-                
-                # If we didn't find the cell, try a common location (B4)
-                if not week_of_cell_found:
-                    sheet.cell(row=4, column=2).value = week_of_text
-                    logger.info(f"Added Week Of: {week_of_text} to default location (B4)")
-            
-            # Get jobs for this subcontractor
-            sub_jobs = filtered_df[filtered_df['Tech'] == sub].copy()
-            logger.info(f"Found {len(sub_jobs)} jobs for {sub}")
-            
-            # Convert to list of dictionaries for simpler sorting
-            jobs_list = sub_jobs.to_dict(orient='records')
-            
-            # Parse dates for each job
-            for job in jobs_list:
-                # Extract date as a string in MM/DD/YY format
-                if 'Completed On' in job and pd.notna(job['Completed On']):
-                    date_str = str(job['Completed On'])
-                    # Try to extract a sortable date string
-                    try:
-                        if isinstance(job['Completed On'], (pd.Timestamp, datetime)):
-                            # Already a datetime, extract month/day/year as numbers
-                            job['_month'] = job['Completed On'].month
-                            job['_day'] = job['Completed On'].day
-                            job['_year'] = job['Completed On'].year
-                        else:
-                            # Parse from string
-                            date_obj = dateutil.parser.parse(date_str)
-                            job['_month'] = date_obj.month
-                            job['_day'] = date_obj.day
-                            job['_year'] = date_obj.year
-                    except:
-                        # If parsing fails, set to high values to sort to end
-                        job['_month'] = 99
-                        job['_day'] = 99
-                        job['_year'] = 9999
-                else:
-                    # No date, sort to end
-                    job['_month'] = 99
-                    job['_day'] = 99
-                    job['_year'] = 9999
-            
-            # Simple manual sort by year, month, day
-            sorted_jobs = sorted(jobs_list, key=lambda x: (x['_year'], x['_month'], x['_day']))
-            
-            # Debug - print the sorted dates
-            debug_dates = []
-            for job in sorted_jobs:
-                if '_month' in job:
-                    debug_dates.append(f"{job['_month']:02d}/{job['_day']:02d}/{job['_year']}")
-                else:
-                    debug_dates.append("No date")
-            
-            logger.info(f"Sorted dates for {sub}: {debug_dates}")
-            
-            # Set header row (row 12) and data start row (row 13)
-            header_row = 12
-            data_start_row = 13
-            data_end_row = 29  # Maximum rows before summary row at row 30
-            
-            # Validate header row
-            if sheet.cell(row=header_row, column=1).value is None:
-                logger.warning(f"Header row (row {header_row}) in sheet '{actual_sheet_name}' appears to be empty")
-            
-            # Check if we'll exceed the available rows
-            max_rows = min(len(sorted_jobs), data_end_row - data_start_row + 1)
-            if len(sorted_jobs) > max_rows:
-                logger.warning(f"Only {max_rows} of {len(sorted_jobs)} jobs will be included for {sub} due to template limits")
-            
-            # Add jobs to the sheet, using the sorted list
-            for i, job in enumerate(sorted_jobs[:max_rows]):
-                row = data_start_row + i
-                
-                # Debug this row
-                logger.info(f"Writing job {i+1} to row {row}: Job# {job.get('Job#', 'N/A')}, Date: {job.get('Completed On', 'N/A')}")
-                
-                # Date (column A)
-                # Debug the date to see what we're getting
-                logger.info(f"Job {job.get('Job#', 'N/A')} date value: {job.get('Completed On')}, type: {type(job.get('Completed On'))}")
-                
-                # Use our already extracted and parsed date components
-                if '_year' in job and job['_year'] != 9999:
-                    try:
-                        # Create a date object from our parsed components
-                        date_obj = datetime(job['_year'], job['_month'], job['_day'])
-                        sheet.cell(row=row, column=1).value = date_obj.date()
-                        logger.info(f"Date set for row {row}: {date_obj.date()}")
-                    except Exception as e:
-                        logger.warning(f"Error creating date for row {row}: {str(e)}")
-                        # Fallback to direct value
-                        sheet.cell(row=row, column=1).value = job.get('Completed On')
-                else:
-                    # No valid date
-                    sheet.cell(row=row, column=1).value = None
-                
-                # Property/Building Unit (column B) - Use Customer name from the report
-                customer_value = None
-                
-                # Try different variations of the Customer column name
-                customer_columns = ['Customer', 'Customer)', 'Customer )']
-                for col_name in customer_columns:
-                    if col_name in job and pd.notna(job[col_name]):
-                        customer_value = str(job[col_name]).strip()
-                        logger.info(f"Found customer data in column '{col_name}': {customer_value}")
-                        break
-                
-                if customer_value:
-                    property_value = customer_value
-                else:
-                    # Fallback to Service Location Address 1 if Customer is not available
-                    logger.warning(f"Customer column not found or empty for job {job.get('Job#', 'N/A')}. Available columns: {list(job.keys())}")
-                    if 'Service Location Address 1' in job and pd.notna(job['Service Location Address 1']):
-                        property_value = str(job['Service Location Address 1'])
-                        logger.info(f"Using fallback Service Location Address 1: {property_value}")
-                    else:
-                        property_value = "N/A"
-                        logger.warning(f"No property data available for job {job.get('Job#', 'N/A')}")
-                
-                sheet.cell(row=row, column=2).value = property_value
-                
-                # Job Number (column C)
-                if 'Job#' in job and pd.notna(job['Job#']):
-                    try:
-                        # Try to convert to float first, then to int to remove decimal
-                        job_number = int(float(job['Job#']))
-                        # Assign as a number, not a string
-                        sheet.cell(row=row, column=3).value = job_number
-                    except (ValueError, TypeError):
-                        # If conversion fails, fallback to string
-                        job_number = str(job['Job#'])
-                        sheet.cell(row=row, column=3).value = job_number
-                else:
-                    sheet.cell(row=row, column=3).value = "N/A"
-                
-                # Description (column D) - Use truncated Job Details if available
-                if 'Job Details' in job and pd.notna(job['Job Details']):
-                    # Truncate Job Details to a reasonable length (e.g., 100 characters)
-                    job_details = str(job['Job Details'])
-                    description = job_details[:100] + "..." if len(job_details) > 100 else job_details
-                else:
-                    # Fallback to Job Category if Job Details is not available
-                    description = str(job['Job Category']) if 'Job Category' in job else "N/A"
-                sheet.cell(row=row, column=4).value = description
-                
-                # Quantity (column E) - Set to 1
-                sheet.cell(row=row, column=5).value = 1
-                
-                # Per Unit (column F) - Leave blank for manual entry
-                sheet.cell(row=row, column=6).value = None
-                
-                # Amount (column G) - Has formula, leave untouched
-            
-            logger.info(f"Added {min(len(sorted_jobs), max_rows)} jobs for {sub} to sheet '{actual_sheet_name}'")
+        files = {}
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            combined = pool.submit(render_workbook, template_bytes, sheet_updates, engine)
+            per_sheet = {
+                sheet_name: pool.submit(render_workbook, template_bytes, sheet_updates, "openpyxl", sheet_name)
+                for sheet_name in sheet_updates
+            }
+            files[output_filename(date_range)] = combined.result()
+            if progress:
+                progress(1, len(per_sheet) + 1, "Created the combined workbook")
+            for done, (sheet_name, future) in enumerate(per_sheet.items(), start=2):
+                files[output_filename(date_range, prefix=_safe_filename(sheet_name))] = future.result()
+                if progress:
+                    progress(done, len(per_sheet) + 1, f"Created the workbook for '{sheet_name}'")
         
-        # Save the workbook
-        workbook.save(output_path)
-        logger.info(f"Pay sheet saved to {output_path}")
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as bundle:
+            for filename, data in files.items():
+                bundle.writestr(filename, data)
         
-        return output_path, skipped_subs
+        logger.info(f"Created pay sheet bundle with {len(per_sheet)} subcontractor workbooks")
+        return output_filename(date_range, prefix="Sub_PaySheets", extension="zip"), output.getvalue(), skipped_subs, tab_matches, written_jobs
+    
+    except Exception as e:
+        logger.error(f"Error creating pay sheet bundle: {str(e)}")
+        raise
+
+def build_weekly_pay_sheets(template_file, filtered_df, layout=None, engine="openpyxl", max_workers=None, progress=None):
+    """
+    Create one pay sheet per Monday-Sunday week of a multi-week report, in parallel, as a ZIP.
+    
+    Jobs are bucketed by week in one pass (see split_by_week). The template is read and
+    compiled once and shared by every week, and the weekly workbooks are rendered
+    concurrently in a process pool.
+    
+    Args:
+        template_file: The uploaded template file object
+        filtered_df (pandas.DataFrame): DataFrame of filtered jobs spanning one or more weeks
+        layout (TemplateLayout): Compiled template layout; looked up from the cache if not given
+        engine (str): Output engine, "openpyxl" or "xml"
+        max_workers (int): Maximum number of worker processes (defaults to the number of CPUs)
+        progress (callable): Called as progress(done, total, message) as each weekly pay sheet is finished
+    
+    Returns:
+        tuple: (filename, data, skipped_subs, tab_matches, weeks, written_jobs) - ZIP file name, ZIP
+               content, list of skipped subcontractors, subcontractors matched to a tab by similarity
+               (see plan_sheet_updates), list of (start_date, end_date) weeks included and index
+               labels of the jobs written to any week's pay sheet
+    """
+    try:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown pay sheet engine: {engine}")
+        
+        # Check if we have data to process
+        if filtered_df.empty:
+            raise ValueError("No jobs to include in the pay sheet")
+        
+        if layout is None:
+            layout = get_template_layout(template_file)
+        
+        # Written values are derived once for every week, then split
+        weeks, _ = split_by_week(resolve_sheet_columns(filtered_df))
+        if not weeks:
+            raise ValueError("None of the jobs have a valid 'Completed On' date")
+        
+        template_bytes = template_file.getvalue()
+        skipped_subs = []
+        tab_matches = []
+        written_jobs = []
+        files = {}
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {}
+            for week_range, week_df in weeks:
+                week_rows, week_indexes = group_sheet_rows(week_df)
+                sheet_updates, week_skipped, week_matches, week_written = plan_sheet_updates(week_rows, layout, week_range, week_indexes)
+                skipped_subs.extend(sub for sub in week_skipped if sub not in skipped_subs)
+                _add_tab_matches(tab_matches, week_matches)
+                if sheet_updates:
+                    written_jobs.extend(week_written)
+                    futures[output_filename(week_range)] = pool.submit(render_workbook, template_bytes, sheet_updates, engine)
+            for done, (filename, future) in enumerate(futures.items(), start=1):
+                files[filename] = future.result()
+                if progress:
+                    progress(done, len(futures), f"Created {filename}")
+        
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as bundle:
+            for filename, data in files.items():
+                bundle.writestr(filename, data)
+        
+        week_ranges = [week_range for week_range, _ in weeks]
+        logger.info(f"Created {len(files)} weekly pay sheets")
+        filename = output_filename([week_ranges[0][0], week_ranges[-1][1]], prefix="Sub_PaySheets_Weekly", extension="zip")
+        return filename, output.getvalue(), skipped_subs, tab_matches, week_ranges, written_jobs
+    
+    except Exception as e:
+        logger.error(f"Error creating weekly pay sheets: {str(e)}")
+        raise
+
+def build_pay_sheet(template_file, filtered_df, date_range, layout=None, engine="openpyxl", progress=None):
+    """
+    Create a pay sheet from the template and filtered job data, entirely in memory.
+    
+    The template is read from the upload and the workbook is saved to a buffer, so
+    nothing touches the disk and the result can be streamed straight to the download.
+    
+    Two output engines are available. "openpyxl" loads and re-saves the whole template.
+    "xml" patches only the worksheets of subcontractors with jobs directly in the XLSX
+    file and copies every other part unchanged, which is much faster for large, heavily
+    styled templates. If the template uses a structure the XML engine does not support,
+    it falls back to openpyxl.
+    
+    Args:
+        template_file: The uploaded template file object
+        filtered_df (pandas.DataFrame): DataFrame of filtered jobs
+        date_range (list): [start_date, end_date] as datetime.date objects
+        layout (TemplateLayout): Compiled template layout; looked up from the cache if not given
+        engine (str): Output engine, "openpyxl" or "xml"
+        progress (callable): Called as progress(done, total, message) after each subcontractor sheet is filled
+    
+    Returns:
+        tuple: (filename, data, skipped_subs, tab_matches, written_jobs) - File name, XLSX content, list
+               of skipped subcontractors, subcontractors matched to a tab by similarity and index labels
+               of the jobs written (see plan_sheet_updates)
+    """
+    try:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown pay sheet engine: {engine}")
+        
+        # Check if we have data to process
+        if filtered_df.empty:
+            raise ValueError("No jobs to include in the pay sheet")
+        
+        # Compiled sheet layout of this template (cached per template content)
+        if layout is None:
+            layout = get_template_layout(template_file)
+        
+        # Sort and group every job once, up front, then map the rows onto the template
+        with span("prepare_rows", rows=len(filtered_df)) as timing:
+            sheet_rows, row_indexes = group_sheet_rows(filtered_df)
+            sheet_updates, skipped_subs, tab_matches, written_jobs = plan_sheet_updates(sheet_rows, layout, date_range, row_indexes)
+            timing.set(sheets=len(sheet_updates))
+        
+        data = render_workbook(template_file.getvalue(), sheet_updates, engine, progress=progress)
+        logger.info(f"Created pay sheet ({len(data)} bytes)")
+        
+        return output_filename(date_range), data, skipped_subs, tab_matches, written_jobs
     
     except Exception as e:
         logger.error(f"Error creating pay sheet: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
+
+def cleanup_spill_dir(max_age=SPILL_MAX_AGE_SECONDS):
+    """
+    Delete spilled outputs older than max_age seconds.
+    
+    Args:
+        max_age (float): Age in seconds after which a spilled output is removed
+    
+    Returns:
+        int: Number of spilled outputs removed
+    """
+    if not SPILL_DIR.exists():
+        return 0
+    
+    removed = 0
+    cutoff = time.time() - max_age
+    for entry in SPILL_DIR.iterdir():
+        try:
+            if entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry, ignore_errors=True)
+                removed += 1
+        except OSError:
+            # Removed concurrently by another session
+            continue
+    if removed:
+        logger.info(f"Removed {removed} expired outputs from {SPILL_DIR}")
+    return removed
+
+def spill_to_disk(filename, data):
+    """
+    Write a generated output to the spill directory, removing expired outputs first.
+    
+    Each output gets its own directory so concurrent sessions never collide, and the
+    file keeps its download name.
+    
+    Args:
+        filename (str): File name of the output
+        data (bytes): Content of the output
+    
+    Returns:
+        str: Path of the written file
+    """
+    cleanup_spill_dir()
+    SPILL_DIR.mkdir(parents=True, exist_ok=True)
+    output_path = os.path.join(tempfile.mkdtemp(dir=SPILL_DIR), filename)
+    with open(output_path, "wb") as f:
+        f.write(data)
+    return output_path
+
+def remove_spilled_output(output_path):
+    """
+    Delete a spilled output (and its directory) once it is no longer needed.
+    
+    Args:
+        output_path (str): Path returned by create_pay_sheet or create_pay_sheet_bundle
+    """
+    shutil.rmtree(os.path.dirname(output_path), ignore_errors=True)
+
+def create_pay_sheet_bundle(template_file, filtered_df, date_range, layout=None, engine="openpyxl", max_workers=None):
+    """
+    Create the per-subcontractor ZIP bundle (see build_pay_sheet_bundle) and spill it to disk.
+    
+    Returns:
+        tuple: (output_path, skipped_subs) - Path to the generated ZIP file and list of skipped subcontractors
+    """
+    filename, data, skipped_subs, _, _ = build_pay_sheet_bundle(template_file, filtered_df, date_range, layout, engine, max_workers)
+    output_path = spill_to_disk(filename, data)
+    logger.info(f"Pay sheet bundle saved to {output_path}")
+    return output_path, skipped_subs
+
+def create_pay_sheet(template_file, filtered_df, date_range, layout=None, engine="openpyxl"):
+    """
+    Create a pay sheet (see build_pay_sheet) and spill it to disk, for very large outputs.
+    
+    Spilled files live in a shared spill directory and are removed after SPILL_MAX_AGE_SECONDS,
+    or earlier with remove_spilled_output.
+    
+    Args:
+        template_file: The uploaded template file object
+        filtered_df (pandas.DataFrame): DataFrame of filtered jobs
+        date_range (list): [start_date, end_date] as datetime.date objects
+        layout (TemplateLayout): Compiled template layout; looked up from the cache if not given
+        engine (str): Output engine, "openpyxl" or "xml"
+    
+    Returns:
+        tuple: (output_path, skipped_subs) - Path to the generated Excel file and list of skipped subcontractors
+    """
+    filename, data, skipped_subs, _, _ = build_pay_sheet(template_file, filtered_df, date_range, layout, engine)
+    output_path = spill_to_disk(filename, data)
+    logger.info(f"Pay sheet saved to {output_path}")
+    return output_path, skipped_subs
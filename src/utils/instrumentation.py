@@ -0,0 +1,212 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Environment variable naming a JSON-lines file that receives every recorded span
+METRICS_FILE_ENV = "SUBPAY_METRICS_FILE"
+
+# Metrics run of the current session/thread; None means instrumentation is off
+_current_run = contextvars.ContextVar("subpay_metrics_run", default=None)
+_sink_lock = threading.Lock()
+# Guards a run finishing against background spans being merged into it
+_finish_lock = threading.Lock()
+
+
+class _NullSpan:
+    """Shared do-nothing span handed out while no metrics run is active."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **counts):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Times one pipeline stage and records counts (rows, sheets, ...) alongside."""
+    __slots__ = ("run", "name", "counts", "start", "seconds")
+
+    def __init__(self, run, name, counts):
+        self.run = run
+        self.name = name
+        self.counts = counts
+        self.start = None
+        self.seconds = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.start
+        self.run.spans.append(self)
+        return False
+
+    def set(self, **counts):
+        """Record counts known only once the stage has run."""
+        self.counts.update(counts)
+
+
+class MetricsRun:
+    """All spans recorded during one pipeline run (one Streamlit rerun, one batch report)."""
+
+    def __init__(self, label):
+        self.label = label
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = datetime.now()
+        self.spans = []
+        self.finished = False
+        self.sink_path = None
+
+    def records(self):
+        """
+        Return the recorded spans as plain dicts, in completion order.
+
+        Returns:
+            list: Dicts with stage, seconds and any recorded counts
+        """
+        return [
+            {"stage": span.name, "seconds": round(span.seconds, 4), **span.counts}
+            for span in self.spans
+        ]
+
+    def total_seconds(self):
+        return sum(span.seconds for span in self.spans)
+
+
+def span(name, **counts):
+    """
+    Time a pipeline stage if a metrics run is active.
+
+    When instrumentation is off this returns a shared no-op object, so the only cost
+    is one context variable lookup.
+
+    Args:
+        name (str): Stage name, e.g. "read_report"
+        **counts: Counts recorded with the timing, e.g. rows=1000
+
+    Returns:
+        Span: Context manager timing the stage (with .set(**counts) for late counts)
+    """
+    run = _current_run.get()
+    if run is None:
+        return _NULL_SPAN
+    return Span(run, name, counts)
+
+
+def current_run():
+    """The metrics run of the current session or thread, or None if instrumentation is off."""
+    return _current_run.get()
+
+
+def metrics_sink_path():
+    """Path of the JSON-lines metrics file, or None if the sink is not configured."""
+    return os.environ.get(METRICS_FILE_ENV) or None
+
+
+def start_run(label):
+    """
+    Start recording spans for the current session or thread.
+
+    Args:
+        label (str): Name of the run, e.g. "app" or the report being processed
+
+    Returns:
+        MetricsRun: The active run
+    """
+    run = MetricsRun(label)
+    _current_run.set(run)
+    return run
+
+
+def finish_run(run, sink_path=None):
+    """
+    Stop recording and append the run's spans to the JSON-lines sink, if configured.
+
+    Args:
+        run (MetricsRun): Run returned by start_run
+        sink_path (str): Metrics file; defaults to the SUBPAY_METRICS_FILE environment variable
+    """
+    if _current_run.get() is run:
+        _current_run.set(None)
+    sink_path = sink_path or metrics_sink_path()
+    with _finish_lock:
+        run.finished = True
+        run.sink_path = sink_path
+    if sink_path and run.spans:
+        write_jsonl(run, sink_path)
+
+
+def merge_run(run, parent):
+    """
+    Hand the spans of a run recorded for background work to the run that started the work.
+
+    While the parent is still recording, the spans join it and are shown and written
+    with its own. Once it has finished, the run is written by itself to the parent's sink.
+
+    Args:
+        run (MetricsRun): Finished run of the background work
+        parent (MetricsRun): Run that was active when the work was started
+    """
+    with _finish_lock:
+        if not parent.finished:
+            parent.spans.extend(run.spans)
+            run.finished = True
+            return
+    finish_run(run, parent.sink_path)
+
+
+@contextmanager
+def collect_metrics(label, sink_path=None):
+    """
+    Record spans for the duration of a with-block.
+
+    Args:
+        label (str): Name of the run
+        sink_path (str): Metrics file; defaults to the SUBPAY_METRICS_FILE environment variable
+
+    Yields:
+        MetricsRun: The active run
+    """
+    previous = _current_run.get()
+    run = start_run(label)
+    try:
+        yield run
+    finally:
+        finish_run(run, sink_path)
+        _current_run.set(previous)
+
+
+def write_jsonl(run, path):
+    """
+    Append one JSON line per span of a run to a metrics file.
+
+    Args:
+        run (MetricsRun): Finished run
+        path (str): Metrics file
+    """
+    timestamp = run.started.isoformat(timespec="seconds")
+    lines = [
+        json.dumps({"ts": timestamp, "run_id": run.run_id, "run": run.label, **record}, default=str)
+        for record in run.records()
+    ]
+    try:
+        with _sink_lock, open(path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+    except OSError as e:
+        logger.error(f"Error writing metrics to {path}: {str(e)}")
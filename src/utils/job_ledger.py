@@ -0,0 +1,244 @@
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime, timedelta
+# pandas (and dates, which needs it) are imported where first used, so the app can import the
+# ledger while drawing the page without loading them
+from .name_index import normalize_name
+from .subs_store import DATA_DIR_ENV, DEFAULT_DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Ledger database; defaults to the data directory holding the subcontractor lists
+LEDGER_PATH_ENV = "SUBPAY_LEDGER_PATH"
+LEDGER_FILENAME = "job_ledger.sqlite3"
+
+# Seconds a writer waits for another process holding the database lock
+LEDGER_TIMEOUT_SECONDS = 30
+
+# Rows returned by a history query unless asked otherwise
+DEFAULT_HISTORY_LIMIT = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS paid_jobs (
+    job_key TEXT NOT NULL,
+    tech_key TEXT NOT NULL,
+    job_number TEXT,
+    tech TEXT,
+    completed_on TEXT,
+    week_start TEXT,
+    week_end TEXT,
+    report_hash TEXT,
+    recorded_at TEXT,
+    PRIMARY KEY (job_key, tech_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS paid_jobs_by_tech ON paid_jobs (tech_key, week_start);
+"""
+
+
+def default_ledger_path():
+    """Ledger location: SUBPAY_LEDGER_PATH, else job_ledger.sqlite3 in the data directory."""
+    return os.environ.get(LEDGER_PATH_ENV) or os.path.join(os.environ.get(DATA_DIR_ENV) or DEFAULT_DATA_DIR, LEDGER_FILENAME)
+
+
+def job_keys(job_numbers):
+    """
+    Normalize Job# values so 1001, 1001.0 and "1001 " are the same job.
+
+    Built with whole-column operations. Plain digits, the usual Job#, are their number
+    without leading zeros; only the other values are parsed as numbers, and those that are
+    whole numbers (e.g. 1001.0) become their integer text. Anything else is its stripped text.
+
+    Args:
+        job_numbers (pandas.Series): Raw Job# values
+
+    Returns:
+        pandas.Series: Job keys as strings (None where the Job# is missing or blank)
+    """
+    import pandas as pd
+    present = job_numbers.notna()
+    if pd.api.types.is_integer_dtype(job_numbers):
+        return job_numbers.astype(str).astype(object).where(present, None)
+    text = job_numbers.astype(str).str.strip()
+    keys = text.astype(object).where(present & (text != ""), None)
+
+    digits = present & text.str.fullmatch(r'[0-9]+').fillna(False).astype(bool)
+    if digits.any():
+        keys = keys.mask(digits, text[digits].str.lstrip('0').replace('', '0').astype(object))
+
+    rest = present & ~digits
+    if rest.any():
+        numeric = pd.to_numeric(job_numbers[rest], errors='coerce').astype('float64')
+        # Beyond int64 a float is not exactly an integer any more; those keep their text
+        whole = (numeric % 1 == 0) & (numeric.abs() < 2 ** 63)
+        if whole.any():
+            keys = keys.mask(whole.reindex(keys.index, fill_value=False), numeric[whole].astype('int64').astype(str).astype(object))
+    return keys
+
+
+def tech_keys(techs):
+    """Normalize Tech names once per distinct name (see name_index.normalize_name)."""
+    import pandas as pd
+    codes, uniques = pd.factorize(techs, use_na_sentinel=False)
+    normalized = pd.Index([normalize_name(value) for value in uniques], dtype=object)
+    return pd.Series(normalized[codes], index=techs.index, dtype=object)
+
+
+def _iso(values):
+    """ISO dates (YYYY-MM-DD) of values, None where missing, formatted in one pass."""
+    import pandas as pd
+    dates = pd.to_datetime(pd.Series(values), errors='coerce')
+    text = dates.dt.strftime('%Y-%m-%d')
+    return text.astype(object).where(dates.notna(), None).tolist()
+
+
+class JobLedger:
+    """
+    Local SQLite record of every job that has gone on a pay sheet.
+
+    Jobs are keyed by (Job#, Tech), so a report overlapping an earlier one can be
+    checked with one indexed join instead of by hand. A second index on
+    (Tech, week) keeps per-subcontractor history queries fast as the ledger grows.
+    Every call opens its own connection, so the ledger can be shared by Streamlit
+    sessions and batch worker processes alike.
+    """
+
+    def __init__(self, path=None):
+        self.path = str(path or default_ledger_path())
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=LEDGER_TIMEOUT_SECONDS)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.executescript(_SCHEMA)
+                    self._initialized = True
+        return connection
+
+    def find_paid(self, jobs):
+        """
+        Look up which jobs are already in the ledger.
+
+        Args:
+            jobs (pandas.DataFrame): Jobs with 'Job#' and 'Tech' columns
+
+        Returns:
+            pandas.DataFrame: recorded (True if the job is in the ledger), and week_start, week_end
+                              and report_hash of its entry, aligned with jobs.index (missing if not recorded)
+        """
+        import pandas as pd
+        keys = pd.DataFrame({'job_key': job_keys(jobs['Job#']), 'tech_key': tech_keys(jobs['Tech'])})
+        candidates = keys.dropna().drop_duplicates()
+        found = pd.DataFrame(columns=['job_key', 'tech_key', 'week_start', 'week_end', 'report_hash'], dtype=object)
+
+        if not candidates.empty:
+            # Join the candidates against the primary key inside SQLite, then align in pandas
+            with closing(self._connect()) as connection:
+                connection.execute("CREATE TEMP TABLE candidates (job_key TEXT, tech_key TEXT)")
+                connection.executemany("INSERT INTO candidates VALUES (?, ?)", candidates.itertuples(index=False, name=None))
+                found = pd.read_sql_query(
+                    "SELECT p.job_key, p.tech_key, p.week_start, p.week_end, p.report_hash "
+                    "FROM candidates c JOIN paid_jobs p ON p.job_key = c.job_key AND p.tech_key = c.tech_key",
+                    connection
+                )
+
+        # (job_key, tech_key) is the primary key, so the left join keeps one row per job; its
+        # indicator splits the recorded jobs from the rest (the anti-join)
+        paid = keys.merge(found, on=['job_key', 'tech_key'], how='left', indicator=True)
+        paid.index = jobs.index
+        paid['recorded'] = (paid['_merge'] == 'both').to_numpy()
+        return paid[['recorded', 'week_start', 'week_end', 'report_hash']]
+
+    def record(self, jobs, date_range=None, report_hash=None):
+        """
+        Record jobs as paid. Jobs already in the ledger keep their first entry.
+
+        Args:
+            jobs (pandas.DataFrame): Jobs put on a pay sheet ('Job#', 'Tech', 'Completed On')
+            date_range (list): [start_date, end_date] of the pay sheet; if None each job is
+                               recorded under the Monday-Sunday week of its completion date
+            report_hash (str): Hash of the report the jobs came from
+
+        Returns:
+            int: Number of jobs newly recorded
+        """
+        import pandas as pd
+        from .dates import week_starts
+        if jobs.empty:
+            return 0
+        completed_on = jobs['Completed On'] if 'Completed On' in jobs.columns else pd.Series(pd.NaT, index=jobs.index)
+        if date_range:
+            week_start = _iso([date_range[0]]) * len(jobs)
+            week_end = _iso([date_range[1]]) * len(jobs)
+        else:
+            monday = week_starts(completed_on)
+            week_start = _iso(monday)
+            week_end = _iso(monday + timedelta(days=6))
+
+        rows = pd.DataFrame({
+            'job_key': job_keys(jobs['Job#']),
+            'tech_key': tech_keys(jobs['Tech']),
+            'job_number': jobs['Job#'].astype(str).astype(object),
+            'tech': jobs['Tech'].astype(str).astype(object),
+            'completed_on': _iso(completed_on),
+            'week_start': week_start,
+            'week_end': week_end,
+            'report_hash': report_hash,
+            'recorded_at': datetime.now().isoformat(timespec="seconds")
+        }, index=jobs.index)
+        # Jobs without a Job# cannot be told apart, so they are not recorded
+        rows = rows.loc[rows['job_key'].notna()]
+
+        with closing(self._connect()) as connection:
+            with connection:
+                before = connection.total_changes
+                connection.executemany("INSERT OR IGNORE INTO paid_jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                       rows.itertuples(index=False, name=None))
+                inserted = connection.total_changes - before
+
+        logger.info(f"Recorded {inserted} of {len(jobs)} jobs in the ledger ({len(jobs) - inserted} already recorded)")
+        return inserted
+
+    def history(self, tech, limit=DEFAULT_HISTORY_LIMIT):
+        """
+        Jobs recorded for one subcontractor, most recent pay week first.
+
+        Args:
+            tech (str): Subcontractor name (matched like the pay sheet tabs)
+            limit (int): Maximum number of jobs returned
+
+        Returns:
+            pandas.DataFrame: Job#, Completed On, pay week and when it was recorded
+        """
+        import pandas as pd
+        with closing(self._connect()) as connection:
+            return pd.read_sql_query(
+                "SELECT job_number AS 'Job#', completed_on AS 'Completed On', week_start AS 'Week Start', "
+                "week_end AS 'Week End', recorded_at AS 'Recorded' FROM paid_jobs "
+                "WHERE tech_key = ? ORDER BY week_start DESC, job_key LIMIT ?",
+                connection,
+                params=(normalize_name(tech), limit)
+            )
+
+    def __len__(self):
+        with closing(self._connect()) as connection:
+            return connection.execute("SELECT COUNT(*) FROM paid_jobs").fetchone()[0]
+
+
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+
+def get_job_ledger(path=None):
+    """Return the ledger at path (default location if None), shared within this process."""
+    path = str(path or default_ledger_path())
+    with _ledgers_lock:
+        if path not in _ledgers:
+            _ledgers[path] = JobLedger(path)
+        return _ledgers[path]
@@ -0,0 +1,476 @@
+import contextvars
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from .cache import content_hash
+from .diagnostics import diagnostics_run
+from .instrumentation import current_run, start_run, merge_run
+
+logger = logging.getLogger(__name__)
+
+# Previews and pay sheets run at the same time by this process (every session shares the queue)
+JOB_WORKERS_ENV = "SUBPAY_JOB_WORKERS"
+DEFAULT_JOB_WORKERS = 2
+
+# Estimated memory the running jobs may hold together; further jobs wait in the queue.
+# A job larger than the whole budget still runs, but only when nothing else is running.
+JOB_MEMORY_MB_ENV = "SUBPAY_JOB_MEMORY_MB"
+DEFAULT_JOB_MEMORY_MB = 1024
+
+# Jobs allowed to wait; submissions beyond this are refused until the queue drains
+JOB_QUEUE_SIZE_ENV = "SUBPAY_JOB_QUEUE_SIZE"
+DEFAULT_JOB_QUEUE_SIZE = 20
+
+# Peak memory of a loaded template relative to its unpacked XML (openpyxl measures about 7x)
+OPENPYXL_MEMORY_FACTOR = 10
+XML_ENGINE_MEMORY_FACTOR = 3
+
+# Peak memory of a preview relative to the parsed report (the filtered copies and the job table)
+PREVIEW_MEMORY_FACTOR = 2
+
+# Finished jobs, and the files they hold, are dropped this long after they finish
+JOB_RETENTION_SECONDS = 3600
+
+# Job states, in order
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+@dataclass
+class Job:
+    """State of one background job, as seen by the UI (metrics: its stage timings, if the submitter recorded any)."""
+    job_id: str
+    label: str
+    status: str = "queued"
+    done: int = 0
+    total: int = 0
+    message: str = ""
+    key: tuple = None
+    memory: int = 0
+    position: int = 0
+    result: object = None
+    error: str = None
+    metrics: list = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    @property
+    def fraction(self):
+        """Share of the work done, between 0 and 1."""
+        if self.status == "done":
+            return 1.0
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+
+class JobQueueFullError(Exception):
+    """The queue already holds as many waiting jobs as it admits."""
+
+
+def request_key(report_hash, template_hash, date_range, team, **options):
+    """
+    Identity of a preview or pay sheet request, for deduplication.
+
+    Args:
+        report_hash (str): Content hash of the report
+        template_hash (str): Content hash of the template (None for a preview)
+        date_range (list): [start_date, end_date] (None when split by week)
+        team (str): Team whose subcontractor list is used
+        **options: Anything else the result depends on (list version, engine, ...)
+
+    Returns:
+        tuple: Hashable key; equal keys give equal results
+    """
+    dates = tuple(str(value) for value in date_range) if date_range else None
+    return (report_hash, template_hash, dates, team, tuple(sorted(options.items())))
+
+
+def job_set_hash(jobs):
+    """
+    Identity of the jobs on a pay sheet, for the request key of a cached output.
+
+    The same report, dates and list give fewer jobs once some are recorded in the ledger,
+    and a cached output (with its written_jobs index labels) only fits the job table it
+    was made from. Jobs are keyed as in the ledger (see job_ledger.job_keys), with their
+    index labels.
+
+    Args:
+        jobs (pandas.DataFrame): Filtered jobs (Job# and Tech columns)
+
+    Returns:
+        str: Hex digest of the job keys and index labels
+    """
+    import pandas as pd
+    from .job_ledger import job_keys, tech_keys
+    keys = pd.DataFrame({'job': job_keys(jobs['Job#']), 'tech': tech_keys(jobs['Tech'])}, index=jobs.index)
+    return content_hash(pd.util.hash_pandas_object(keys, index=True).to_numpy().tobytes())
+
+
+class JobRunner:
+    """
+    Bounded queue running previews and pay sheets outside the Streamlit script.
+
+    At most max_workers jobs run at once, and a job only starts while the estimated
+    memory of the running jobs stays within memory_budget, so several large reports
+    submitted together wait their turn instead of exhausting the container. Jobs
+    start in submission order and each waiting job knows its queue position.
+    Submissions are refused once max_queued jobs are waiting, and a request whose
+    key matches a queued, running or finished job returns that job instead of
+    running again.
+
+    Each submitted job gets an ID the session keeps, so a rerun (any widget
+    interaction) only polls the job instead of restarting or interrupting it.
+    Jobs report progress through a callback; the UI reads a snapshot of the job
+    on each poll and fetches the result once it is done. A job runs in a copy of
+    the submitter's context, so its stage timings are recorded for the metrics
+    run that submitted it (see _call).
+    """
+
+    def __init__(self, max_workers=None, memory_budget=None, max_queued=None):
+        if max_workers is None:
+            max_workers = int(os.environ.get(JOB_WORKERS_ENV, DEFAULT_JOB_WORKERS))
+        if memory_budget is None:
+            memory_budget = int(float(os.environ.get(JOB_MEMORY_MB_ENV, DEFAULT_JOB_MEMORY_MB)) * 1024 * 1024)
+        if max_queued is None:
+            max_queued = int(os.environ.get(JOB_QUEUE_SIZE_ENV, DEFAULT_JOB_QUEUE_SIZE))
+        self.max_workers = max_workers
+        self.memory_budget = memory_budget
+        self.max_queued = max_queued
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sub-pay-job")
+        self._jobs = {}
+        self._keys = {}
+        self._pending = deque()
+        self._running = 0
+        self._running_memory = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, label="", key=None, memory=0, reuse_finished=True, **kwargs):
+        """
+        Queue a job, or join an identical one.
+
+        Args:
+            fn (callable): Work to run; called as fn(*args, progress=callback, **kwargs)
+            label (str): Short description shown with the job
+            key (tuple): Request identity (see request_key); None never deduplicates
+            memory (int): Estimated peak memory of the job in bytes
+            reuse_finished (bool): Also return a finished job with key; False only joins queued
+                                   or running ones, for results that depend on state outside
+                                   the key (e.g. a preview and the job ledger)
+            *args, **kwargs: Arguments of fn
+
+        Returns:
+            str: ID of the job (an existing one if key matches a job that has not failed)
+
+        Raises:
+            JobQueueFullError: If max_queued jobs are already waiting
+        """
+        self.prune()
+        with self._lock:
+            existing = self._existing(key, reuse_finished)
+            if existing is not None:
+                return existing
+            if len(self._pending) >= self.max_queued:
+                raise JobQueueFullError(f"{len(self._pending)} jobs are already waiting; try again shortly")
+
+            job = Job(job_id=uuid.uuid4().hex, label=label, key=key, memory=int(memory))
+            self._jobs[job.job_id] = job
+            if key is not None:
+                self._keys[key] = job.job_id
+            self._pending.append((job, fn, args, kwargs, contextvars.copy_context()))
+            logger.info(f"Queued job {job.job_id[:8]} ({label}, ~{job.memory / 1024 / 1024:.0f} MB, {len(self._pending)} waiting)")
+            self._dispatch()
+        return job.job_id
+
+    def run_inline(self, fn, *args, label="", key=None, memory=0, **kwargs):
+        """
+        Run a job known to be quick (e.g. served from a cache) in the calling thread.
+
+        The job skips the queue, so it does not wait behind large jobs, but is
+        registered like a submitted one: it deduplicates on key and the UI polls it by ID.
+
+        Args:
+            fn (callable): Work to run; called as fn(*args, progress=callback, **kwargs)
+            label (str): Short description shown with the job
+            key (tuple): Request identity (see request_key); None never deduplicates
+            memory (int): Ignored; accepted so calls can switch between submit and run_inline
+            *args, **kwargs: Arguments of fn
+
+        Returns:
+            str: ID of the (finished) job, or of an existing job if key matches one that has not failed
+        """
+        self.prune()
+        with self._lock:
+            existing = self._existing(key)
+            if existing is not None:
+                return existing
+            job = Job(job_id=uuid.uuid4().hex, label=label, key=key, status="running", started_at=time.time())
+            self._jobs[job.job_id] = job
+            if key is not None:
+                self._keys[key] = job.job_id
+
+        try:
+            result = contextvars.copy_context().run(self._call, job, fn, args, kwargs, lambda done, total, message="": None)
+        except Exception as e:
+            logger.error(f"Job {job.job_id[:8]} ({job.label}) failed: {str(e)}")
+            self._update(job, status="failed", error=str(e), finished_at=time.time())
+            return job.job_id
+        self._update(job, status="done", result=result, finished_at=time.time())
+        return job.job_id
+
+    def _existing(self, key, reuse_finished=True):
+        """ID of a job with key that has not failed (nor finished, unless reuse_finished), or None. Called with the lock held."""
+        if key is None:
+            return None
+        existing = self._jobs.get(self._keys.get(key))
+        if existing is None or existing.status == "failed" or (existing.finished and not reuse_finished):
+            return None
+        logger.info(f"Request matches job {existing.job_id[:8]} ({existing.status}); not running it again")
+        return existing.job_id
+
+    def _dispatch(self):
+        """Start waiting jobs, in order, while workers and memory are free. Called with the lock held."""
+        while self._pending and self._running < self.max_workers:
+            job = self._pending[0][0]
+            if self._running and self._running_memory + job.memory > self.memory_budget:
+                break
+            job, fn, args, kwargs, context = self._pending.popleft()
+            self._running += 1
+            self._running_memory += job.memory
+            job.status = "running"
+            job.started_at = time.time()
+            self._pool.submit(context.run, self._run, job, fn, args, kwargs)
+
+    def _call(self, job, fn, args, kwargs, progress):
+        """
+        Run fn in the submitter's (copied) context.
+
+        If the submitter was recording a metrics run, the job records its spans in a run
+        of its own, kept on the job as metrics and then merged into the submitter's run
+        (see instrumentation.merge_run).
+        """
+        parent = current_run()
+        run = start_run(job.label) if parent is not None else None
+        try:
+            with diagnostics_run(job.label):
+                return fn(*args, progress=progress, **kwargs)
+        finally:
+            if run is not None:
+                self._update(job, metrics=run.records())
+                merge_run(run, parent)
+
+    def _run(self, job, fn, args, kwargs):
+        def progress(done, total, message=""):
+            self._update(job, done=done, total=total, message=message)
+
+        try:
+            result = self._call(job, fn, args, kwargs, progress)
+        except Exception as e:
+            logger.error(f"Job {job.job_id[:8]} ({job.label}) failed: {str(e)}")
+            self._finish(job, status="failed", error=str(e))
+            return
+        self._finish(job, status="done", result=result)
+        logger.info(f"Job {job.job_id[:8]} ({job.label}) finished in {job.finished_at - job.started_at:.2f}s")
+
+    def _finish(self, job, **changes):
+        with self._lock:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            job.finished_at = time.time()
+            self._running -= 1
+            self._running_memory -= job.memory
+            self._dispatch()
+
+    def _update(self, job, **changes):
+        with self._lock:
+            for name, value in changes.items():
+                setattr(job, name, value)
+
+    def get(self, job_id):
+        """
+        Current state of a job.
+
+        Args:
+            job_id (str): ID returned by submit
+
+        Returns:
+            Job: Snapshot of the job (with its queue position while it waits), or None
+                 if it is unknown or was pruned
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            position = 0
+            if job.status == "queued":
+                position = next(number for number, (pending, *_) in enumerate(self._pending, start=1) if pending is job)
+            return replace(job, position=position)
+
+    def discard(self, job_id):
+        """Forget a job (and free its result); a waiting job is cancelled, a running one still runs to the end."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return
+            if self._keys.get(job.key) == job_id:
+                del self._keys[job.key]
+            if job.status == "queued":
+                self._pending = deque(entry for entry in self._pending if entry[0] is not job)
+
+    def prune(self, max_age=JOB_RETENTION_SECONDS):
+        """
+        Drop jobs that finished more than max_age seconds ago.
+
+        Returns:
+            int: Number of jobs dropped
+        """
+        cutoff = time.time() - max_age
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+            for job_id in expired:
+                job = self._jobs.pop(job_id)
+                if self._keys.get(job.key) == job_id:
+                    del self._keys[job.key]
+        return len(expired)
+
+    def stats(self):
+        """Running and waiting job counts and the estimated memory in use."""
+        with self._lock:
+            return {"running": self._running, "waiting": len(self._pending), "memory": self._running_memory}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+
+def estimate_preview_memory(report_df):
+    """Estimated peak memory, in bytes, of generate_preview on a parsed report."""
+    from .job_table import memory_bytes
+    return memory_bytes(report_df) * PREVIEW_MEMORY_FACTOR
+
+
+def estimate_pay_sheet_memory(template_bytes, jobs, engine="openpyxl", per_sub=False, split_weeks=False):
+    """
+    Estimated peak memory, in bytes, of creating a pay sheet.
+
+    Args:
+        template_bytes (bytes): Raw XLSX content of the template
+        jobs (pandas.DataFrame): Compact job table
+        engine (str): Output engine, "openpyxl" or "xml"
+        per_sub (bool): One workbook per subcontractor is also created
+        split_weeks (bool): One pay sheet per week is created
+
+    Returns:
+        int: Bytes
+    """
+    from .job_table import memory_bytes
+    try:
+        with zipfile.ZipFile(io.BytesIO(template_bytes)) as archive:
+            unpacked = sum(info.file_size for info in archive.infolist())
+    except zipfile.BadZipFile:
+        unpacked = len(template_bytes)
+    factor = XML_ENGINE_MEMORY_FACTOR if engine == "xml" and not per_sub else OPENPYXL_MEMORY_FACTOR
+    # Bundles and weekly splits load a copy of the template in each worker process
+    copies = (os.cpu_count() or 1) if per_sub or split_weeks else 1
+    return unpacked * factor * copies + memory_bytes(jobs)
+
+
+def run_preview_job(report_df, subs_list, date_range, ledger=None, report_hash=None, include_paid=False, progress=None):
+    """
+    Filter a report to the jobs to pay, as one queued job (see generate_preview).
+
+    Returns:
+        tuple: (filtered_df, warnings)
+    """
+    from .data_processing import generate_preview
+    return generate_preview(report_df, subs_list, date_range, ledger=ledger, report_hash=report_hash, include_paid=include_paid)
+
+
+def run_pay_sheet_job(template_bytes, jobs, date_range, layout=None, engine="openpyxl", per_sub=False,
+                      split_weeks=False, ledger=None, report_hash=None, teams=None, output_cache=None,
+                      cache_key=None, progress=None):
+    """
+    Create a pay sheet (or bundle) and record its jobs, as one background job.
+
+    Args:
+        template_bytes (bytes): Raw XLSX content of the template
+        jobs (pandas.DataFrame): Compact job table from the preview
+        date_range (list): [start_date, end_date] as datetime.date objects
+        layout (TemplateLayout): Compiled template layout; looked up from the cache if not given
+        engine (str): Output engine, "openpyxl" or "xml"
+        per_sub (bool): Also create one workbook per subcontractor, bundled as a ZIP
+        split_weeks (bool): Create one pay sheet per Monday-Sunday week, bundled as a ZIP
+        ledger (JobLedger): Ledger the jobs are recorded in once the file is created
+        report_hash (str): Hash of the report the jobs came from
+        teams (dict): Team name -> subcontractor names; if given, one pay sheet per team is
+                      created from the all-teams jobs, bundled as a ZIP (per_sub and split_weeks are ignored)
+        output_cache (OutputCache): Cache of generated outputs; an output stored under cache_key
+                                    is returned without filling the template again
+        cache_key (tuple): Request key of the output (see request_key); None bypasses the cache
+        progress (callable): Called as progress(done, total, message) as sheets are filled
+
+    Returns:
+        dict: name, data, skipped_subs and tab_matches of the output, weeks (if split), written_jobs (index
+              labels of the jobs on the output), cached (True if served from output_cache), and
+              recorded_jobs or ledger_error
+    """
+    # The pipeline modules (pandas, openpyxl) are imported by the first job, not at app startup
+    from .excel_writer import build_pay_sheet, build_pay_sheet_bundle, build_weekly_pay_sheets, build_team_pay_sheets
+    template_file = io.BytesIO(template_bytes)
+    result = {"weeks": None, "written_jobs": None, "recorded_jobs": None, "ledger_error": None, "cached": False}
+    cached = output_cache.get(cache_key) if output_cache is not None and cache_key is not None else None
+    if teams:
+        split_weeks = False
+    if cached is not None:
+        logger.info(f"Serving {cached['name']} from the output cache")
+        result.update(cached, cached=True)
+    elif teams:
+        result["name"], result["data"], result["skipped_subs"], result["tab_matches"], result["written_jobs"] = build_team_pay_sheets(
+            template_file, jobs, teams, date_range, layout=layout, engine=engine, progress=progress
+        )
+    elif split_weeks:
+        result["name"], result["data"], result["skipped_subs"], result["tab_matches"], result["weeks"], result["written_jobs"] = build_weekly_pay_sheets(
+            template_file, jobs, layout=layout, engine=engine, progress=progress
+        )
+    else:
+        generate = build_pay_sheet_bundle if per_sub else build_pay_sheet
+        result["name"], result["data"], result["skipped_subs"], result["tab_matches"], result["written_jobs"] = generate(
+            template_file, jobs, date_range, layout=layout, engine=engine, progress=progress
+        )
+    if cached is None and output_cache is not None and cache_key is not None:
+        output_cache.put(cache_key, result["name"], result["data"], result["skipped_subs"], result["tab_matches"],
+                         result["weeks"], result["written_jobs"])
+
+    # Record the written jobs so later reports overlapping this one don't pay them again; jobs of a
+    # cached output were normally recorded when it was generated, and the ledger keeps their first entries
+    if ledger is not None:
+        try:
+            written = jobs if result["written_jobs"] is None else jobs.loc[result["written_jobs"]]
+            result["recorded_jobs"] = ledger.record(written, None if split_weeks else date_range, report_hash)
+        except Exception as e:
+            logger.error(f"Error recording jobs in the ledger: {str(e)}")
+            result["ledger_error"] = str(e)
+    return result
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    """Return the runner shared by every session of this process."""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = JobRunner()
+    return _runner
@@ -0,0 +1,169 @@
+import logging
+import pandas as pd
+from .dates import parse_completed_on
+
+logger = logging.getLogger(__name__)
+
+# Columns of the job table carried from the preview to the pay sheet writer, in order.
+# Anything else in the report is dropped once the jobs are selected.
+JOB_COLUMNS = [
+    'Tech', 'Job#', 'Status', 'Completed On', 'Job Category', 'Job Details',
+    'Customer', 'Customer)', 'Customer )', 'Service Location Address 1',
+    'Missing Date', 'Duplicate', 'Paid Week'
+]
+
+# Low-cardinality text columns stored as categoricals (codes plus one copy of each value)
+CATEGORICAL_COLUMNS = ['Tech', 'Status', 'Job Category']
+
+# Job Details longer than this are truncated in the Description column
+MAX_DESCRIPTION_LENGTH = 100
+
+# Columns shown per job in the preview detail, and jobs per page
+PREVIEW_COLUMNS = ['Job#', 'Completed On', 'Job Category', 'Duplicate', 'Paid Week']
+PREVIEW_PAGE_SIZE = 100
+
+# Per-subcontractor flags counted in the preview summary: summary column -> job table column
+SUMMARY_FLAGS = {'Duplicates': 'Duplicate', 'Missing Date': 'Missing Date', 'Already Paid': 'Paid Week'}
+
+
+def compact_job_numbers(values):
+    """
+    Store Job# as nullable integers when every value is a whole number.
+
+    Args:
+        values (pandas.Series): Raw Job# values
+
+    Returns:
+        pandas.Series: Int64 Series, or the values unchanged if some Job# is not a number
+    """
+    if pd.api.types.is_integer_dtype(values):
+        return values.astype('Int64')
+    numeric = pd.to_numeric(values, errors='coerce')
+    if numeric.notna().sum() != values.notna().sum() or (numeric.dropna() % 1 != 0).any():
+        return values
+    return numeric.astype('Int64')
+
+
+def compact_columns(df, columns=None):
+    """
+    Convert the categorical columns and Job# of a frame to their compact dtypes.
+
+    Args:
+        df (pandas.DataFrame): Report or job table
+        columns (list): Columns to keep, in order; all columns if None
+
+    Returns:
+        pandas.DataFrame: New frame sharing the unchanged columns with df
+    """
+    compact = {}
+    for column in (columns or df.columns):
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if column in CATEGORICAL_COLUMNS:
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.cat.remove_unused_categories()
+            else:
+                values = values.astype('category')
+        elif column == 'Job#':
+            values = compact_job_numbers(values)
+        compact[column] = values
+    return pd.DataFrame(compact, index=df.index)
+
+
+def compact_jobs(filtered_df):
+    """
+    Build the compact job table kept in session state and passed to the writer.
+
+    Keeps only JOB_COLUMNS, stores Tech, Status and Job Category as categoricals and
+    Job# as nullable integers, and cuts Job Details to the length the Description
+    column can show, so the table costs a fraction of the report rows it came from.
+
+    Args:
+        filtered_df (pandas.DataFrame): Selected jobs, with any report columns
+
+    Returns:
+        pandas.DataFrame: Compact job table
+    """
+    jobs = compact_columns(filtered_df, JOB_COLUMNS)
+    if 'Job Details' in jobs.columns:
+        # One character more than is ever written keeps the "..." truncation marker right
+        details = jobs['Job Details']
+        if not pd.api.types.is_string_dtype(details):
+            details = details.where(details.isna(), details.astype(str))
+        jobs['Job Details'] = details.str.slice(0, MAX_DESCRIPTION_LENGTH + 1)
+    return jobs
+
+
+def memory_bytes(df):
+    """Memory held by a frame, including the Python strings in object columns."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def summarize_jobs(jobs):
+    """
+    One row per subcontractor: job count, date span and category breakdown.
+
+    Computed once per preview with grouped aggregations, so the preview shows a table
+    of subcontractors instead of every job, however many jobs there are.
+
+    Args:
+        jobs (pandas.DataFrame): Compact job table
+
+    Returns:
+        pandas.DataFrame: Tech, Jobs, First Date, Last Date, Categories and the counts
+                          of any SUMMARY_FLAGS present in jobs
+    """
+    columns = ['Tech', 'Jobs', 'First Date', 'Last Date', 'Categories']
+    if jobs.empty:
+        return pd.DataFrame(columns=columns)
+
+    tech = jobs['Tech'].astype('category')
+    if 'Completed On' in jobs.columns:
+        dates = parse_completed_on(jobs['Completed On'])
+    else:
+        dates = pd.Series(pd.NaT, index=jobs.index)
+    grouped = dates.groupby(tech, observed=True)
+    summary = pd.DataFrame({
+        'Jobs': grouped.size(),
+        'First Date': grouped.min().dt.date,
+        'Last Date': grouped.max().dt.date
+    })
+
+    # "Repair: 12, Install: 3", most frequent category first
+    breakdown = {}
+    if 'Job Category' in jobs.columns:
+        categories = jobs['Job Category'].astype('category')
+        categories = categories.cat.add_categories('(none)').fillna('(none)') if categories.isna().any() else categories
+        pairs = tech.groupby([tech, categories], observed=True).size().sort_values(ascending=False, kind='stable')
+        for (sub, category), jobs_count in pairs.items():
+            breakdown.setdefault(sub, []).append(f"{category}: {jobs_count}")
+    summary['Categories'] = [", ".join(breakdown.get(sub, [])) for sub in summary.index]
+
+    for name, column in SUMMARY_FLAGS.items():
+        if column in jobs.columns:
+            flags = jobs[column].notna() if column == 'Paid Week' else jobs[column].fillna(False).astype(bool)
+            summary[name] = flags.groupby(tech, observed=True).sum().astype(int)
+
+    summary.index = summary.index.astype(object)
+    return summary.rename_axis('Tech').reset_index()
+
+
+def job_page(jobs, sub, page=1, page_size=PREVIEW_PAGE_SIZE):
+    """
+    One page of a subcontractor's jobs, for on-demand preview detail.
+
+    Args:
+        jobs (pandas.DataFrame): Compact job table
+        sub (str): Subcontractor ('Tech') to show
+        page (int): 1-based page number; clamped to the available pages
+        page_size (int): Jobs per page
+
+    Returns:
+        tuple: (page_df, page_count) - PREVIEW_COLUMNS of the jobs on the page and the number of pages
+    """
+    rows = jobs[jobs['Tech'] == sub]
+    page_count = max(1, -(-len(rows) // page_size))
+    page = min(max(int(page), 1), page_count)
+    start = (page - 1) * page_size
+    return rows.iloc[start:start + page_size][[col for col in PREVIEW_COLUMNS if col in rows.columns]], page_count
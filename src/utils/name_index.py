@@ -0,0 +1,195 @@
+import difflib
+import logging
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Apostrophes are dropped (O'Brien == OBrien); every other non-alphanumeric character,
+# including every kind of dash, separates tokens
+_APOSTROPHES = re.compile(r"['‘’ʼ`]")
+_SEPARATORS = re.compile(r"[\W_]+")
+
+# Minimum similarity (difflib ratio of the normalized names) for a fuzzy match
+FUZZY_THRESHOLD = 0.9
+
+# The best fuzzy candidate must beat the runner-up by this much, otherwise nothing matches
+FUZZY_MARGIN = 0.05
+
+# Candidates scored per fuzzy lookup, chosen by their shared (rarest) tokens
+MAX_FUZZY_CANDIDATES = 20
+
+# Tokens shared by more names than this ("sub", "llc", "contracting") don't select candidates
+MAX_BLOCK_SIZE = 50
+
+# Lookups remembered per index; reports repeat the same few thousand tech names
+MAX_MEMO_ENTRIES = 50000
+
+# Memo marker for "not looked up yet" (None is a valid result: no match)
+_MISSING = object()
+
+# Match methods, from strictest to loosest
+MATCH_METHODS = ("exact", "normalized", "compact", "reordered", "fuzzy")
+
+
+def normalize_name(name):
+    """
+    Normalize a subcontractor name for matching.
+
+    Applies Unicode NFKC normalization and case folding, folds every kind of dash and
+    punctuation to a single space, and drops apostrophes, so "Kevin Reyes – SUB",
+    "kevin reyes - sub" and "Kevin Reyes (SUB)" all become "kevin reyes sub".
+
+    Args:
+        name (str): Name as typed in the report, the subcontractor list or a sheet tab
+
+    Returns:
+        str: Normalized name (space-separated tokens)
+    """
+    text = unicodedata.normalize("NFKC", str(name)).casefold()
+    text = _APOSTROPHES.sub("", text)
+    return " ".join(_SEPARATORS.sub(" ", text).split())
+
+
+@dataclass(frozen=True)
+class NameMatch:
+    """A name found in the index and how it was matched."""
+    name: str
+    method: str
+    score: float = 1.0
+
+
+class NameIndex:
+    """
+    Precomputed lookup tables for matching names against a fixed list (approved
+    subcontractors or template tabs).
+
+    Lookups go through progressively looser keys: the legacy lower/strip key, the
+    normalized name, the name without spaces ("I&S" == "I & S" == "IS"), the sorted
+    tokens ("Reyes, Kevin" == "Kevin Reyes"), and finally a bounded fuzzy comparison
+    against the few names sharing a token with the query. Names whose numbers differ
+    are never fuzzy-matched, so "Crew 2" cannot be paid as "Crew 3".
+    """
+
+    def __init__(self, names):
+        self.names = []
+        self._exact = {}
+        self._normalized = {}
+        self._compact = {}
+        self._reordered = {}
+        self._tokens = []
+        self._blocks = {}
+        self._memo = {}
+
+        for name in names:
+            name = str(name)
+            key = normalize_name(name)
+            if key in self._normalized:
+                continue
+            tokens = key.split()
+            position = len(self.names)
+            self.names.append(name)
+            self._tokens.append(tokens)
+            self._exact.setdefault(name.lower().strip(), position)
+            self._normalized[key] = position
+            self._compact.setdefault(key.replace(" ", ""), position)
+            self._reordered.setdefault(" ".join(sorted(tokens)), position)
+            for token in set(tokens):
+                self._blocks.setdefault(token, []).append(position)
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, query):
+        """
+        Find the indexed name a query refers to.
+
+        Args:
+            query (str): Name to look up
+
+        Returns:
+            NameMatch: The matched name, method and score, or None if nothing matches
+        """
+        query = str(query)
+        # One lookup: the index is shared by session threads, and another thread may clear
+        # the memo between a membership test and a read
+        result = self._memo.get(query, _MISSING)
+        if result is not _MISSING:
+            return result
+
+        result = self._lookup(query)
+        if len(self._memo) >= MAX_MEMO_ENTRIES:
+            self._memo.clear()
+        self._memo[query] = result
+        return result
+
+    def _lookup(self, query):
+        position = self._exact.get(query.lower().strip())
+        if position is not None:
+            return NameMatch(self.names[position], "exact")
+
+        key = normalize_name(query)
+        if not key:
+            return None
+        tokens = key.split()
+        for method, table, lookup_key in (
+            ("normalized", self._normalized, key),
+            ("compact", self._compact, key.replace(" ", "")),
+            ("reordered", self._reordered, " ".join(sorted(tokens)))
+        ):
+            position = table.get(lookup_key)
+            if position is not None:
+                return NameMatch(self.names[position], method)
+
+        return self._fuzzy(key, tokens)
+
+    def _fuzzy(self, key, tokens):
+        """Compare the query with the names sharing its rarest tokens."""
+        weights = Counter()
+        for token in set(tokens):
+            block = self._blocks.get(token, ())
+            if len(block) > MAX_BLOCK_SIZE:
+                continue
+            for position in block:
+                weights[position] += 1 / len(block)
+        if not weights:
+            return None
+
+        numbers = {token for token in tokens if token.isdigit()}
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        matcher.set_seq2(key)
+        scores = []
+        for position, _ in weights.most_common(MAX_FUZZY_CANDIDATES):
+            candidate_tokens = self._tokens[position]
+            if {token for token in candidate_tokens if token.isdigit()} != numbers:
+                continue
+            matcher.set_seq1(" ".join(candidate_tokens))
+            if matcher.real_quick_ratio() < FUZZY_THRESHOLD or matcher.quick_ratio() < FUZZY_THRESHOLD:
+                continue
+            scores.append((matcher.ratio(), position))
+
+        scores.sort(reverse=True)
+        if not scores or scores[0][0] < FUZZY_THRESHOLD:
+            return None
+        if len(scores) > 1 and scores[0][0] - scores[1][0] < FUZZY_MARGIN:
+            logger.debug(f"Ambiguous fuzzy match for '{key}': {[self.names[pos] for _, pos in scores[:3]]}")
+            return None
+        score, position = scores[0]
+        return NameMatch(self.names[position], "fuzzy", round(score, 3))
+
+
+@lru_cache(maxsize=16)
+def get_name_index(names):
+    """
+    Return the (cached) index of a list of names.
+
+    Args:
+        names (tuple): Names to index, e.g. tuple(subs_list)
+
+    Returns:
+        NameIndex: Index shared by every caller with the same names
+    """
+    return NameIndex(names)
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Directory of the generated pay sheet cache; shared by every process on the machine
+OUTPUT_CACHE_DIR_ENV = "SUBPAY_OUTPUT_CACHE_DIR"
+DEFAULT_OUTPUT_CACHE_DIR = Path(tempfile.gettempdir()) / "sub_pay_outputs"
+
+# Total size the cache may grow to before the least recently used outputs are evicted
+OUTPUT_CACHE_MAX_MB_ENV = "SUBPAY_OUTPUT_CACHE_MAX_MB"
+DEFAULT_OUTPUT_CACHE_MAX_MB = 256
+
+# Outputs older than this are generated again (0 disables the cache)
+OUTPUT_CACHE_TTL_ENV = "SUBPAY_OUTPUT_CACHE_TTL_SECONDS"
+DEFAULT_OUTPUT_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Each output is a data file plus a JSON file with its download name and details
+OUTPUT_DATA_SUFFIX = ".bin"
+OUTPUT_META_SUFFIX = ".json"
+
+
+def output_key(key):
+    """
+    Content address of a request key (see job_runner.request_key).
+
+    Args:
+        key (tuple): Report hash, template hash, date range, team and options
+
+    Returns:
+        str: Hex digest naming the cached output
+    """
+    return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+
+class OutputCache:
+    """
+    Generated pay sheets stored on disk under the hash of the request that made them.
+
+    A request for the same report, template, date range, team, list version and
+    options as an earlier one gets the stored bytes back instead of filling the
+    template again. Outputs expire ttl seconds after they were generated; reading
+    one marks it as recently used, and once the files exceed max_bytes the least
+    recently used ones are deleted.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, ttl=None):
+        self.cache_dir = Path(cache_dir or os.environ.get(OUTPUT_CACHE_DIR_ENV) or DEFAULT_OUTPUT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get(OUTPUT_CACHE_MAX_MB_ENV, DEFAULT_OUTPUT_CACHE_MAX_MB)) * 1024 * 1024)
+        if ttl is None:
+            ttl = float(os.environ.get(OUTPUT_CACHE_TTL_ENV, DEFAULT_OUTPUT_CACHE_TTL_SECONDS))
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = max_bytes > 0 and ttl > 0
+        self._lock = threading.Lock()
+
+    def _paths(self, key):
+        name = output_key(key)
+        return self.cache_dir / f"{name}{OUTPUT_DATA_SUFFIX}", self.cache_dir / f"{name}{OUTPUT_META_SUFFIX}"
+
+    def _read_meta(self, meta_path):
+        meta = json.loads(meta_path.read_text())
+        if time.time() - meta["created"] > self.ttl:
+            return None
+        return meta
+
+    def contains(self, key):
+        """True if an unexpired output is stored for key (without reading it)."""
+        if not self.enabled:
+            return False
+        data_path, meta_path = self._paths(key)
+        try:
+            return data_path.exists() and self._read_meta(meta_path) is not None
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def get(self, key):
+        """
+        Load a cached output.
+
+        Args:
+            key (tuple): Request key
+
+        Returns:
+            dict: name, data, skipped_subs, tab_matches, weeks and written_jobs of the output, or None if
+                  it is not cached or has expired
+        """
+        if not self.enabled:
+            return None
+        data_path, meta_path = self._paths(key)
+        try:
+            meta = self._read_meta(meta_path)
+            if meta is None:
+                self._remove(data_path, meta_path)
+                return None
+            data = data_path.read_bytes()
+            os.utime(data_path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # A truncated or foreign entry is dropped and the output generated again
+            logger.warning(f"Discarding unreadable cached output {data_path}: {str(e)}")
+            self._remove(data_path, meta_path)
+            return None
+
+        weeks = meta["weeks"]
+        if weeks is not None:
+            weeks = [tuple(date.fromisoformat(day) for day in week) for week in weeks]
+        return {"name": meta["name"], "data": data, "skipped_subs": meta["skipped_subs"],
+                "tab_matches": meta.get("tab_matches", []), "weeks": weeks, "written_jobs": meta.get("written_jobs")}
+
+    def put(self, key, name, data, skipped_subs=(), tab_matches=(), weeks=None, written_jobs=None):
+        """
+        Store a generated output, then evict old outputs beyond the size limit.
+
+        Args:
+            key (tuple): Request key
+            name (str): Download file name
+            data (bytes): Content of the output
+            skipped_subs (list): Subcontractors without a template tab
+            tab_matches (list): Subcontractors matched to a tab by similarity (see excel_writer.plan_sheet_updates)
+            weeks (list): (start_date, end_date) of each week, for weekly outputs
+            written_jobs (list): Index labels of the jobs on the output (see excel_writer.plan_sheet_updates)
+        """
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        data_path, meta_path = self._paths(key)
+        meta = {
+            "name": name,
+            "skipped_subs": list(skipped_subs),
+            "tab_matches": list(tab_matches),
+            "weeks": [[day.isoformat() for day in week] for week in weeks] if weeks is not None else None,
+            "written_jobs": list(written_jobs) if written_jobs is not None else None,
+            "created": time.time()
+        }
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Data first, then the metadata that makes the entry visible; both under temporary
+            # names so readers never see a partial file
+            for path, content in ((data_path, data), (meta_path, json.dumps(meta).encode("utf-8"))):
+                fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(content)
+                    os.replace(temp_path, path)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+        except Exception as e:
+            logger.warning(f"Could not cache output {name}: {str(e)}")
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Delete expired outputs, then least recently used ones until the cache fits in max_bytes.
+
+        Returns:
+            int: Number of outputs removed
+        """
+        with self._lock:
+            entries = []
+            for data_path in self.cache_dir.glob(f"*{OUTPUT_DATA_SUFFIX}"):
+                try:
+                    stat = data_path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, data_path))
+
+            cutoff = time.time() - self.ttl
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for mtime, size, data_path in sorted(entries):
+                meta_path = data_path.with_suffix(OUTPUT_META_SUFFIX)
+                try:
+                    expired = json.loads(meta_path.read_text())["created"] < cutoff
+                except (OSError, ValueError, KeyError):
+                    # Metadata not written yet (a put in progress) or unreadable; judge by age alone
+                    expired = mtime < cutoff
+                if not expired and total <= self.max_bytes:
+                    continue
+                self._remove(data_path, meta_path)
+                total -= size
+                removed += 1
+
+        if removed:
+            logger.info(f"Evicted {removed} cached outputs from {self.cache_dir}")
+        return removed
+
+    def clear(self):
+        """Delete every cached output."""
+        for data_path in self.cache_dir.glob(f"*{OUTPUT_DATA_SUFFIX}"):
+            self._remove(data_path, data_path.with_suffix(OUTPUT_META_SUFFIX))
+
+    @staticmethod
+    def _remove(*paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_output_cache = None
+_output_cache_lock = threading.Lock()
+
+
+def get_output_cache():
+    """Return the output cache shared by every session of this process."""
+    global _output_cache
+    if _output_cache is None:
+        with _output_cache_lock:
+            if _output_cache is None:
+                _output_cache = OutputCache()
+    return _output_cache
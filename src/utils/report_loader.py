@@ -0,0 +1,244 @@
+import pandas as pd
+import io
+import logging
+from .cache import LRUCache, content_hash
+from .instrumentation import span
+from .report_spill import ReportSpillCache, SPILL_FORMAT_VERSION
+from .job_table import compact_columns
+from .dates import parse_completed_on
+
+logger = logging.getLogger(__name__)
+
+# Name of the sheet Service Fusion exports the job list to
+REPORT_SHEET_NAME = "Worksheet"
+
+# Report columns used by the preview and the pay sheet writer, with the header
+# spellings Service Fusion has been seen to export for each of them
+REPORT_COLUMN_ALIASES = {
+    'Tech': ['Tech'],
+    'Job#': ['Job#'],
+    'Status': ['Status'],
+    'Completed On': ['Completed On'],
+    'Job Category': ['Job Category'],
+    'Job Details': ['Job Details'],
+    'Customer': ['Customer', 'Customer)', 'Customer )'],
+    'Service Location Address 1': ['Service Location Address 1'],
+}
+
+# Marker text of the summary rows Service Fusion appends to each tech's jobs
+TOTALS_MARKER = "totals represent tech's share"
+
+# Maximum number of parsed reports kept in memory across all sessions
+MAX_CACHED_REPORTS = 8
+
+# Parsed reports keyed by the hash of the uploaded bytes
+_report_cache = LRUCache(max_entries=MAX_CACHED_REPORTS)
+
+# Parsed reports on disk (Parquet), surviving restarts and shared between processes; the
+# projected columns are part of the format, so editing REPORT_COLUMN_ALIASES starts a new one
+_report_spill = ReportSpillCache(
+    version=f"{SPILL_FORMAT_VERSION}-{content_hash(repr(REPORT_COLUMN_ALIASES).encode('utf-8'))[:8]}"
+)
+
+
+def _read_bytes(report_file):
+    """
+    Get the raw bytes of an uploaded report (Streamlit upload, file object or bytes).
+    """
+    if isinstance(report_file, (bytes, bytearray)):
+        return bytes(report_file)
+    if hasattr(report_file, "getvalue"):
+        return report_file.getvalue()
+    report_file.seek(0)
+    return report_file.read()
+
+
+def _normalize_header(value):
+    """Normalize a header cell for alias lookup (case and whitespace insensitive)."""
+    return " ".join(str(value).split()).lower() if value is not None else ""
+
+
+def resolve_report_columns(header_row, column_aliases=None):
+    """
+    Map each wanted report column to its position in the header row.
+
+    Aliases are resolved once per report; the first alias present in the header wins.
+
+    Args:
+        header_row (tuple): Values of the header row
+        column_aliases (dict): Canonical column name -> list of accepted header spellings
+
+    Returns:
+        dict: Canonical column name -> zero-based column index, for the columns found
+    """
+    column_aliases = column_aliases or REPORT_COLUMN_ALIASES
+    positions = {}
+    for idx, value in enumerate(header_row):
+        key = _normalize_header(value)
+        if key and key not in positions:
+            positions[key] = idx
+    
+    resolved = {}
+    for column, aliases in column_aliases.items():
+        for alias in aliases:
+            idx = positions.get(_normalize_header(alias))
+            if idx is not None:
+                resolved[column] = idx
+                break
+    return resolved
+
+
+def read_worksheet(data, sheet_name=REPORT_SHEET_NAME, column_aliases=None):
+    """
+    Stream the report sheet row by row, keeping only the columns the app uses.
+
+    Uses openpyxl's read-only mode so the workbook is never fully materialized, and
+    drops the "Totals represent tech's share" summary rows and blank rows while reading.
+    Header aliases (e.g. "Customer )") are mapped to their canonical column name.
+
+    Args:
+        data (bytes): Raw XLSX content
+        sheet_name (str): Name of the sheet holding the job list
+        column_aliases (dict): Canonical column name -> list of accepted header spellings
+
+    Returns:
+        pandas.DataFrame: Projected report with canonical column names
+    """
+    # Imported on first use: openpyxl is slow to import and not needed for cached reports
+    import openpyxl
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        if sheet_name not in workbook.sheetnames:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        sheet = workbook[sheet_name]
+        
+        header_row = next(sheet.iter_rows(max_row=1, values_only=True), None)
+        if header_row is None:
+            return pd.DataFrame()
+        
+        resolved = resolve_report_columns(header_row, column_aliases)
+        missing = [col for col in (column_aliases or REPORT_COLUMN_ALIASES) if col not in resolved]
+        if missing:
+            logger.warning(f"Report columns not found: {missing}")
+        
+        names = list(resolved)
+        indexes = [resolved[name] for name in names]
+        tech_pos = names.index('Tech') if 'Tech' in resolved else None
+        columns = [[] for _ in names]
+        if not names:
+            return pd.DataFrame()
+        
+        # Cells right of the last projected column are never materialized
+        rows = sheet.iter_rows(min_row=2, max_col=max(indexes) + 1, values_only=True)
+        for row in rows:
+            values = [row[idx] if idx < len(row) else None for idx in indexes]
+            if all(value is None for value in values):
+                continue
+            if tech_pos is not None:
+                tech = values[tech_pos]
+                if isinstance(tech, str) and TOTALS_MARKER in tech.lower():
+                    continue
+            for column, value in zip(columns, values):
+                column.append(value)
+        
+        return pd.DataFrame(dict(zip(names, columns)))
+    finally:
+        workbook.close()
+
+
+def type_report_columns(report_df, report_hash=None):
+    """
+    Give every report column a single type so the report can be stored as Parquet.
+
+    'Completed On' is parsed to datetimes once, here, instead of by every consumer
+    (see dates.parse_completed_on). Text columns that mix strings with numbers (Service Fusion exports numeric-looking
+    values as numbers) are converted to strings, keeping missing values missing, and
+    the repetitive columns are stored compactly (see job_table.compact_columns).
+
+    Args:
+        report_df (pandas.DataFrame): Report as read by read_worksheet
+        report_hash (str): Hash of the upload, to reuse the date format inferred for it
+
+    Returns:
+        pandas.DataFrame: Report with typed columns
+    """
+    typed = {}
+    for column in report_df.columns:
+        values = report_df[column]
+        if column == 'Completed On':
+            values = parse_completed_on(values, report_hash)
+        elif values.dtype == object:
+            values = values.where(values.isna(), values.astype(str)).infer_objects()
+        typed[column] = values
+    # Tech, Status and Job Category become categoricals, Job# nullable integers if possible
+    return compact_columns(pd.DataFrame(typed, index=report_df.index))
+
+
+def load_report(report_file):
+    """
+    Load the "Worksheet" sheet of a Service Fusion report, parsing each distinct upload only once.
+
+    Only the columns listed in REPORT_COLUMN_ALIASES are read (see read_worksheet).
+    Reports are cached by a hash of their content, so Streamlit reruns (widget changes,
+    button clicks, st.rerun) reuse the parsed DataFrame instead of re-reading the XLSX.
+    Parsed reports are also written to a Parquet cache on disk, so uploading the same
+    report again later, or in another process, skips the XLSX parse too.
+    Every caller gets its own shallow copy, so replacing columns on the returned frame
+    never leaks into the cached report shared with other sessions.
+
+    Args:
+        report_file: The uploaded report file object or its raw bytes
+
+    Returns:
+        tuple: (report_df, report_hash) - DataFrame of the report and hash of the uploaded content
+    """
+    data = _read_bytes(report_file)
+    report_hash = content_hash(data)
+
+    with span("read_report", bytes=len(data)) as timing:
+        report_df = _report_cache.get(report_hash)
+        source = "memory"
+        if report_df is None:
+            report_df = _report_spill.get(report_hash)
+            source = "disk"
+            if report_df is None:
+                logger.info(f"Parsing report {report_hash[:12]} ({len(data)} bytes)")
+                report_df = type_report_columns(read_worksheet(data), report_hash)
+                source = "xlsx"
+                _report_spill.put(report_hash, report_df)
+            _report_cache.put(report_hash, report_df)
+        logger.debug(f"Loaded report {report_hash[:12]} from {source}")
+        timing.set(rows=len(report_df), cached=source != "xlsx", source=source)
+
+    return report_df.copy(deep=False), report_hash
+
+
+def load_cached_report(report_hash):
+    """
+    Load a previously parsed report by its content hash, without the upload.
+
+    Args:
+        report_hash (str): Hash returned by load_report
+
+    Returns:
+        pandas.DataFrame: The report, or None if it is no longer cached
+    """
+    report_df = _report_cache.get(report_hash)
+    if report_df is None:
+        report_df = _report_spill.get(report_hash)
+        if report_df is None:
+            return None
+        _report_cache.put(report_hash, report_df)
+    return report_df.copy(deep=False)
+
+
+def clear_report_cache(disk=False):
+    """
+    Drop every cached report.
+
+    Args:
+        disk (bool): Also delete the reports cached on disk
+    """
+    _report_cache.clear()
+    if disk:
+        _report_spill.clear()
@@ -0,0 +1,149 @@
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Directory of the columnar report cache; shared by every process on the machine
+REPORT_SPILL_DIR_ENV = "SUBPAY_REPORT_CACHE_DIR"
+DEFAULT_REPORT_SPILL_DIR = Path(tempfile.gettempdir()) / "sub_pay_reports"
+
+# Total size the cache may grow to before the least recently used reports are evicted
+REPORT_SPILL_MAX_MB_ENV = "SUBPAY_REPORT_CACHE_MAX_MB"
+DEFAULT_REPORT_SPILL_MAX_MB = 512
+
+REPORT_SPILL_SUFFIX = ".parquet"
+
+# Layout of the stored reports; bump when the typed columns change (report_loader.type_report_columns),
+# so files written by an earlier version are parsed again instead of served
+SPILL_FORMAT_VERSION = 2
+
+
+def _parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ReportSpillCache:
+    """
+    Parsed reports stored on disk as Parquet files named by the hash of the upload and
+    the format version, so a deploy changing how reports are typed never serves old files.
+
+    Loading a cached report reads a few typed columns instead of parsing XLSX, so a
+    report processed once (in any session, process or earlier run) loads in
+    milliseconds. Reading a report marks it as recently used; once the files exceed
+    max_bytes, the least recently used ones are deleted.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, version=SPILL_FORMAT_VERSION):
+        self.cache_dir = Path(cache_dir or os.environ.get(REPORT_SPILL_DIR_ENV) or DEFAULT_REPORT_SPILL_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get(REPORT_SPILL_MAX_MB_ENV, DEFAULT_REPORT_SPILL_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.version = version
+        self.enabled = max_bytes > 0 and _parquet_available()
+        self._lock = threading.Lock()
+        if max_bytes > 0 and not self.enabled:
+            logger.warning("pyarrow is not installed; parsed reports will not be cached on disk")
+
+    def path(self, report_hash):
+        return self.cache_dir / f"{report_hash}.v{self.version}{REPORT_SPILL_SUFFIX}"
+
+    def get(self, report_hash):
+        """
+        Load a cached report.
+
+        Args:
+            report_hash (str): Content hash of the uploaded report
+
+        Returns:
+            pandas.DataFrame: The parsed report, or None if it is not cached
+        """
+        if not self.enabled:
+            return None
+        path = self.path(report_hash)
+        try:
+            report_df = pd.read_parquet(path)
+            os.utime(path)
+            return report_df
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # A truncated or foreign file is dropped and the report parsed again
+            logger.warning(f"Discarding unreadable cached report {path}: {str(e)}")
+            self._remove(path)
+            return None
+
+    def put(self, report_hash, report_df):
+        """
+        Store a parsed report, then evict old reports beyond the size limit.
+
+        Args:
+            report_hash (str): Content hash of the uploaded report
+            report_df (pandas.DataFrame): Parsed report with typed columns
+        """
+        if not self.enabled:
+            return
+        path = self.path(report_hash)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Written under a temporary name so readers never see a partial file
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            os.close(fd)
+            try:
+                report_df.to_parquet(temp_path, index=False)
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        except Exception as e:
+            logger.warning(f"Could not cache report {report_hash[:12]} on disk: {str(e)}")
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used reports until the cache fits in max_bytes.
+
+        Returns:
+            int: Number of reports removed
+        """
+        with self._lock:
+            entries = []
+            for path in self.cache_dir.glob(f"*{REPORT_SPILL_SUFFIX}"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+                removed += 1
+
+        if removed:
+            logger.info(f"Evicted {removed} cached reports from {self.cache_dir}")
+        return removed
+
+    def clear(self):
+        """Delete every cached report."""
+        for path in self.cache_dir.glob(f"*{REPORT_SPILL_SUFFIX}"):
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,320 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from .name_index import normalize_name
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Default list of subcontractors (fallback if file is missing or empty)
+DEFAULT_SUBS = [
+    "Fire Sprinkler Co.",
+    "HVAC Masters",
+    "Electric Pros"
+]
+
+# One list file per team, one name per line
+TEAM_FILES = {
+    "Construction": "subcontractors.txt",
+    "Welding": "welding_subcontractors.txt"
+}
+TEAMS = tuple(TEAM_FILES)
+
+# Pseudo-team selecting every team's list at once (see team_subs)
+ALL_TEAMS = "All teams"
+
+# Directory holding the list files; defaults to the repository root, not the working directory
+DATA_DIR_ENV = "SUBPAY_DATA_DIR"
+DEFAULT_DATA_DIR = Path(__file__).resolve().parents[2]
+
+# Version reported for the built-in default list
+DEFAULT_VERSION = "default"
+
+
+class SubsConflictError(Exception):
+    """The list was changed by someone else since the caller loaded it."""
+
+
+@dataclass(frozen=True)
+class SubsList:
+    """One version of a team's subcontractor list, with its lookup set built once."""
+    team: str
+    names: tuple
+    keys: frozenset
+    version: str
+
+    def __contains__(self, name):
+        return normalize_name(name) in self.keys
+
+
+def _build_list(team, names, version):
+    return SubsList(team=team, names=tuple(names), keys=frozenset(normalize_name(name) for name in names), version=version)
+
+
+def _parse(text):
+    """Filter out empty lines and strip whitespace."""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+class SubsStore:
+    """
+    Subcontractor lists kept as one text file per team.
+
+    Files are replaced atomically (written to a temporary file, then renamed), so
+    readers never see a half-written list. Every lookup checks the file's signature
+    (inode, size and modification time; a single stat call) and rereads it only when
+    another session, worker process or replica has replaced it, so all of them serve
+    the same list without any explicit cache clearing.
+    """
+
+    def __init__(self, data_dir=None):
+        self.data_dir = Path(data_dir or os.environ.get(DATA_DIR_ENV) or DEFAULT_DATA_DIR)
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    def path(self, team):
+        """
+        Path of a team's list file.
+
+        Args:
+            team (str): Team name ("Construction" or "Welding")
+
+        Returns:
+            pathlib.Path: List file of the team
+        """
+        if team not in TEAM_FILES:
+            raise ValueError(f"Unknown team '{team}'; expected one of {', '.join(TEAMS)}")
+        return self.data_dir / TEAM_FILES[team]
+
+    def get(self, team):
+        """
+        Return the current list of a team, rereading the file only if it changed.
+
+        Args:
+            team (str): Team name ("Construction" or "Welding")
+
+        Returns:
+            SubsList: Current names, lookup set and version
+        """
+        path = self.path(team)
+        try:
+            stat = os.stat(path)
+            signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            signature = None
+
+        cached = self._cache.get(team)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with self._lock:
+            subs = self._read(team, path, signature)
+            self._cache[team] = (signature, subs)
+        return subs
+
+    def _read(self, team, path, signature):
+        if signature is None:
+            logger.info(f"Subcontractor file not found at {path}. Using default list.")
+            return _build_list(team, DEFAULT_SUBS, DEFAULT_VERSION)
+
+        content = path.read_bytes()
+        names = _parse(content.decode("utf-8"))
+        if not names:
+            logger.info(f"Subcontractor file {path} is empty. Using default list.")
+            return _build_list(team, DEFAULT_SUBS, DEFAULT_VERSION)
+
+        logger.info(f"Loaded {len(names)} {team} subcontractors from {path}")
+        return _build_list(team, names, hashlib.sha256(content).hexdigest()[:16])
+
+    @contextmanager
+    def _write_lock(self, path):
+        """Serialize writers of one list, across processes where the platform allows."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(path.with_name(path.name + ".lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self, team, names, expected_version=None):
+        """
+        Atomically replace a team's list.
+
+        Args:
+            team (str): Team name ("Construction" or "Welding")
+            names (list): Subcontractor names, one per entry
+            expected_version (str): Version the caller edited; if the stored list has
+                changed since, nothing is written
+
+        Returns:
+            SubsList: The saved list
+
+        Raises:
+            SubsConflictError: If expected_version is given and no longer current
+        """
+        path = self.path(team)
+        names = [str(name).strip() for name in names if str(name).strip()]
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self._write_lock(path):
+            if expected_version is not None:
+                # Compare with the file on disk, not with this process's cache
+                self._cache.pop(team, None)
+                current = self.get(team).version
+                if current != expected_version:
+                    raise SubsConflictError(f"The {team} list was changed elsewhere (version {current}, edited {expected_version})")
+
+            fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+            try:
+                # mkstemp creates the file private to its owner; keep the list's usual permissions
+                os.chmod(temp_path, 0o644)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write("\n".join(names))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+        logger.info(f"Saved {len(names)} {team} subcontractors to {path}")
+        return self.get(team)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_subs_store():
+    """Return the store shared by every session of this process."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SubsStore()
+    return _store
+
+
+def set_subs_store(store):
+    """Replace the shared store (e.g. to point it at another data directory); returns the previous one."""
+    global _store
+    previous, _store = _store, store
+    return previous
+
+
+def load_subs(team="Construction"):
+    """
+    Load the subcontractor list of the specified team from the shared store.
+    Falls back to default list if file is missing or empty.
+
+    The store rereads the list file only when it has changed (in this or any other
+    process), so this is cheap enough to call on every rerun.
+
+    Args:
+        team (str): Team name ("Construction" or "Welding"), or ALL_TEAMS for the union
+                    of every team's list (a name on several lists is listed once)
+
+    Returns:
+        list: List of subcontractor names
+    """
+    try:
+        if team == ALL_TEAMS:
+            union = {}
+            for names in team_subs(ALL_TEAMS).values():
+                for name in names:
+                    union.setdefault(normalize_name(name), name)
+            return list(union.values())
+        return list(get_subs_store().get(team).names)
+
+    except Exception as e:
+        logger.error(f"Error loading subcontractors: {str(e)}")
+        return list(DEFAULT_SUBS)
+
+
+def subs_version(team="Construction"):
+    """
+    Version of a team's current subcontractor list, for save_subs(expected_version=...).
+
+    Args:
+        team (str): Team name ("Construction" or "Welding"), or ALL_TEAMS
+
+    Returns:
+        str: Version of the list (of every list for ALL_TEAMS), or None if it cannot be read
+    """
+    try:
+        if team == ALL_TEAMS:
+            return "+".join(get_subs_store().get(name).version for name in TEAMS)
+        return get_subs_store().get(team).version
+
+    except Exception as e:
+        logger.error(f"Error loading subcontractors: {str(e)}")
+        return None
+
+
+def save_subs(text, team="Construction", expected_version=None):
+    """
+    Save the subcontractor list of the specified team, replacing the file atomically.
+
+    Args:
+        text (str): Text content with one subcontractor per line
+        team (str): Team name ("Construction" or "Welding")
+        expected_version (str): Version the text was edited from; the save is refused if
+            the list has been changed in another session since
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        get_subs_store().save(team, lines, expected_version=expected_version)
+        return True
+
+    except SubsConflictError as e:
+        logger.warning(f"Subcontractor list not saved: {str(e)}")
+        return False
+
+    except Exception as e:
+        logger.error(f"Error saving subcontractors: {str(e)}")
+        return False
+
+
+def team_subs(team="Construction"):
+    """
+    Subcontractor lists by team.
+
+    Args:
+        team (str): Team name, or ALL_TEAMS for every team
+
+    Returns:
+        dict: Team name -> list of subcontractor names
+    """
+    return {name: load_subs(name) for name in (TEAMS if team == ALL_TEAMS else (team,))}
+
+
+def team_membership(names, team_lists):
+    """
+    Find the teams each subcontractor is listed under, comparing normalized names.
+
+    Args:
+        names (iterable): Subcontractor names, e.g. the 'Tech' values of an all-teams preview
+        team_lists (dict): Team name -> list of subcontractor names, as from team_subs
+
+    Returns:
+        dict: Name -> list of teams (empty if the name is on no list)
+    """
+    team_keys = {team: {normalize_name(name) for name in names_list} for team, names_list in team_lists.items()}
+    return {name: [team for team, keys in team_keys.items() if normalize_name(name) in keys] for name in names}
@@ -0,0 +1,277 @@
+import io
+import logging
+import re
+from dataclasses import dataclass, field
+from .cache import LRUCache, content_hash
+from .instrumentation import span
+from .name_index import NameIndex, normalize_name
+
+logger = logging.getLogger(__name__)
+
+# Where the pay sheet templates have historically put their table
+DEFAULT_WEEK_OF_CELL = (4, 2)  # B4
+DEFAULT_HEADER_ROW = 12
+DEFAULT_DATA_END_ROW = 29  # Maximum rows before summary row at row 30
+
+# Area searched for the "Week Of" label (rows 1-9, columns A-D)
+WEEK_OF_SEARCH_ROWS = 9
+WEEK_OF_SEARCH_COLUMNS = 4
+
+# How far down the sheet the header and summary rows are looked for
+HEADER_SEARCH_ROWS = 40
+SUMMARY_SEARCH_ROWS = 200
+
+# Row numbers of the ranges summed by a SUM formula, e.g. =SUM(G$13:G29) -> (13, 29)
+SUM_RANGE_PATTERN = re.compile(r"SUM\(\s*(?:[^!()]*!)?\$?[A-Z]{1,3}\$?(\d+)\s*:\s*\$?[A-Z]{1,3}\$?(\d+)", re.IGNORECASE)
+
+# Columns the writer fills: Date, Property, Job #, Description, Qty, Per Unit
+WRITTEN_COLUMNS = 6
+
+# Number of compiled templates kept in memory across all sessions
+MAX_CACHED_LAYOUTS = 8
+
+_layout_cache = LRUCache(max_entries=MAX_CACHED_LAYOUTS)
+
+
+def sheet_key(name):
+    """Key used to match subcontractor names to template sheet names."""
+    return normalize_name(name)
+
+
+@dataclass
+class SheetLayout:
+    """Where the writer puts the week and the jobs on one subcontractor tab."""
+    sheet_name: str
+    key: str
+    week_of_cell: tuple
+    week_of_found: bool
+    header_row: int
+    data_start_row: int
+    data_end_row: int
+    formula_columns: tuple = ()
+
+    @property
+    def capacity(self):
+        """Number of job rows the data region can hold."""
+        return self.data_end_row - self.data_start_row + 1
+
+
+@dataclass
+class TemplateLayout:
+    """Compiled layout of every sheet in a pay sheet template."""
+    template_hash: str
+    sheets: dict = field(default_factory=dict)
+    issues: list = field(default_factory=list)
+    _name_index: NameIndex = field(default=None, init=False, repr=False, compare=False)
+
+    def match_sheet(self, sub):
+        """
+        Find the tab for a subcontractor and how its name was matched.
+
+        Args:
+            sub (str): Subcontractor name
+
+        Returns:
+            tuple: (SheetLayout, NameMatch), or (None, None) if the template has no tab for sub
+        """
+        if self._name_index is None or len(self._name_index) != len(self.sheets):
+            self._name_index = NameIndex(sheet.sheet_name for sheet in self.sheets.values())
+        match = self._name_index.match(sub)
+        if match is None:
+            return None, None
+        return self.sheets[sheet_key(match.name)], match
+
+    def find_sheet(self, sub):
+        """
+        Find the layout of the tab for a subcontractor.
+
+        Args:
+            sub (str): Subcontractor name
+
+        Returns:
+            SheetLayout: Layout of the matching sheet, or None if the template has no tab for sub
+        """
+        return self.match_sheet(sub)[0]
+
+
+def describe_tab_match(tab_match):
+    """
+    Describe a subcontractor written to a tab whose name is not an exact match, for warnings.
+
+    Args:
+        tab_match (dict): sub, sheet, method and score, as returned by excel_writer.plan_sheet_updates
+
+    Returns:
+        str: Warning message naming the subcontractor, the tab and how its name was matched
+    """
+    return (f"Subcontractor '{tab_match['sub']}' was written to tab '{tab_match['sheet']}' "
+            f"({tab_match['method']} match, {tab_match['score']:.0%}). Check this is the right tab.")
+
+
+def _is_formula(value):
+    return isinstance(value, str) and value.startswith("=")
+
+
+def _is_summary_row(values, row_idx, data_start_row):
+    """
+    A row holding a "Total" label, or a SUM over the job rows above it, closes the data region.
+
+    A SUM counts only if its range starts at or above the first job row and ends above
+    this row, so a running total inside the job rows (e.g. =SUM(G$13:G14) in row 14)
+    does not end the region.
+    """
+    for value in values:
+        if not isinstance(value, str):
+            continue
+        text = value.strip()
+        if text.lower().startswith("total"):
+            return True
+        if text.startswith("="):
+            for start, end in SUM_RANGE_PATTERN.findall(text):
+                start, end = sorted((int(start), int(end)))
+                if start <= data_start_row <= end < row_idx:
+                    return True
+    return False
+
+
+def compile_sheet(sheet_name, rows):
+    """
+    Discover the layout of a single template sheet.
+
+    Args:
+        sheet_name (str): Name of the sheet
+        rows (list): Cell values of the sheet as a list of row tuples, starting at row 1
+
+    Returns:
+        tuple: (SheetLayout, issues) - the compiled layout and list of problems found
+    """
+    issues = []
+
+    def value(row_idx, col_idx):
+        if row_idx > len(rows) or col_idx > len(rows[row_idx - 1]):
+            return None
+        return rows[row_idx - 1][col_idx - 1]
+
+    # Find the "Week Of:" label; the week goes in the cell to its right
+    week_of_cell = None
+    for row_idx in range(1, WEEK_OF_SEARCH_ROWS + 1):
+        for col_idx in range(1, WEEK_OF_SEARCH_COLUMNS + 1):
+            cell_value = value(row_idx, col_idx)
+            if cell_value and "Week Of" in str(cell_value):
+                week_of_cell = (row_idx, col_idx + 1)
+                break
+        if week_of_cell:
+            break
+    week_of_found = week_of_cell is not None
+    if not week_of_found:
+        week_of_cell = DEFAULT_WEEK_OF_CELL
+
+    # The header row starts with a "Date" column
+    header_row = None
+    for row_idx in range(1, HEADER_SEARCH_ROWS + 1):
+        cell_value = value(row_idx, 1)
+        if isinstance(cell_value, str) and cell_value.strip().lower() == "date":
+            header_row = row_idx
+            break
+    if header_row is None:
+        header_row = DEFAULT_HEADER_ROW
+        if value(header_row, 1) is None:
+            issues.append(f"Header row (row {header_row}) in sheet '{sheet_name}' appears to be empty")
+    data_start_row = header_row + 1
+
+    # The data region ends right above the summary (Total) row
+    data_end_row = None
+    for row_idx in range(data_start_row, data_start_row + SUMMARY_SEARCH_ROWS):
+        if row_idx > len(rows):
+            break
+        if _is_summary_row(rows[row_idx - 1], row_idx, data_start_row):
+            data_end_row = row_idx - 1
+            break
+    if data_end_row is None:
+        data_end_row = data_start_row + DEFAULT_DATA_END_ROW - DEFAULT_HEADER_ROW - 1
+    if data_end_row < data_start_row:
+        issues.append(f"Sheet '{sheet_name}' has no room for jobs between the header (row {header_row}) and the summary row")
+
+    # Columns with formulas in the data region (e.g. Amount) are never overwritten
+    formula_columns = sorted({
+        col_idx
+        for row_idx in range(data_start_row, min(data_end_row, len(rows)) + 1)
+        for col_idx, cell_value in enumerate(rows[row_idx - 1], start=1)
+        if _is_formula(cell_value)
+    })
+    protected = [col for col in formula_columns if col <= WRITTEN_COLUMNS]
+    if protected:
+        issues.append(f"Sheet '{sheet_name}' has formulas in columns {protected} of the job rows; they will be left untouched")
+
+    layout = SheetLayout(
+        sheet_name=sheet_name,
+        key=sheet_key(sheet_name),
+        week_of_cell=week_of_cell,
+        week_of_found=week_of_found,
+        header_row=header_row,
+        data_start_row=data_start_row,
+        data_end_row=data_end_row,
+        formula_columns=tuple(formula_columns)
+    )
+    return layout, issues
+
+
+def compile_template(template_bytes):
+    """
+    Compile the layout of every sheet of a pay sheet template.
+
+    The template is read once in read-only mode, and only the rows the layout search needs.
+
+    Args:
+        template_bytes (bytes): Raw XLSX content of the template
+
+    Returns:
+        TemplateLayout: Compiled layout with any problems found listed in issues
+    """
+    layout = TemplateLayout(template_hash=content_hash(template_bytes))
+    max_row = max(WEEK_OF_SEARCH_ROWS, HEADER_SEARCH_ROWS) + SUMMARY_SEARCH_ROWS
+
+    # Imported on first use: openpyxl is slow to import and not needed for cached layouts
+    import openpyxl
+    workbook = openpyxl.load_workbook(io.BytesIO(template_bytes), read_only=True, data_only=False)
+    try:
+        for sheet in workbook.worksheets:
+            rows = list(sheet.iter_rows(min_row=1, max_row=max_row, values_only=True))
+            sheet_layout, issues = compile_sheet(sheet.title, rows)
+            if sheet_layout.key in layout.sheets:
+                issues.append(f"Sheets '{layout.sheets[sheet_layout.key].sheet_name}' and '{sheet.title}' have the same name; only the first is used")
+            else:
+                layout.sheets[sheet_layout.key] = sheet_layout
+            layout.issues.extend(issues)
+    finally:
+        workbook.close()
+
+    logger.info(f"Compiled template {layout.template_hash[:12]} with {len(layout.sheets)} sheets")
+    return layout
+
+
+def get_template_layout(template_file):
+    """
+    Get the compiled layout of a template, compiling each distinct template only once.
+
+    Args:
+        template_file: The uploaded template file object or its raw bytes
+
+    Returns:
+        TemplateLayout: Compiled (and cached) layout of the template
+    """
+    data = template_file if isinstance(template_file, (bytes, bytearray)) else template_file.getvalue()
+    template_hash = content_hash(data)
+
+    layout = _layout_cache.get(template_hash)
+    if layout is None:
+        with span("compile_template", bytes=len(data)) as timing:
+            layout = compile_template(data)
+            timing.set(sheets=len(layout.sheets))
+        _layout_cache.put(template_hash, layout)
+    return layout
+
+
+def clear_layout_cache():
+    """Drop every compiled template layout."""
+    _layout_cache.clear()
@@ -0,0 +1,99 @@
+import importlib
+import logging
+import os
+import threading
+import time
+from .subs_store import get_subs_store, TEAMS
+from .name_index import get_name_index
+
+logger = logging.getLogger(__name__)
+
+# Set to 0 to skip the background warmup (e.g. in tests or one-off scripts)
+WARMUP_ENV = "SUBPAY_WARMUP"
+
+# Templates compiled into the layout cache at startup, separated by os.pathsep
+WARM_TEMPLATES_ENV = "SUBPAY_WARM_TEMPLATES"
+
+# Modules the first report or template upload needs; importing them is most of a cold start
+WARM_MODULES = (
+    "pandas",
+    "openpyxl",
+    "pyarrow",
+    ".data_processing",
+    ".report_loader",
+    ".template_layout",
+    ".excel_writer",
+    ".job_ledger"
+)
+
+_started = False
+_started_lock = threading.Lock()
+
+
+def warm_caches(template_paths=()):
+    """
+    Import the pipeline modules and fill the caches the first request would otherwise fill.
+
+    Loads every team's subcontractor list and its name index, and compiles the given
+    templates into the layout cache. Failures are logged and skipped: warming is only
+    an optimization.
+
+    Args:
+        template_paths (iterable): Pay sheet templates to compile
+
+    Returns:
+        dict: Seconds spent per step
+    """
+    timings = {}
+    for module in WARM_MODULES:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module, package=__package__)
+        except ImportError as e:
+            logger.debug(f"Not warming {module}: {str(e)}")
+        timings[module.lstrip(".")] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for team in TEAMS:
+        try:
+            get_name_index(tuple(get_subs_store().get(team).names))
+        except Exception as e:
+            logger.warning(f"Could not warm the {team} subcontractor list: {str(e)}")
+    timings["subs_lists"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from .template_layout import get_template_layout
+    for path in template_paths:
+        try:
+            with open(path, "rb") as f:
+                get_template_layout(f.read())
+        except Exception as e:
+            logger.warning(f"Could not warm template {path}: {str(e)}")
+    timings["templates"] = time.perf_counter() - start
+
+    logger.info(f"Warmed caches in {sum(timings.values()):.2f}s")
+    return timings
+
+
+def start_warmup():
+    """
+    Run warm_caches in a background thread, once per process.
+
+    Called by the app after the page has been drawn, so the first visitor sees the
+    page right away and the next upload finds the modules and caches ready.
+    Templates are read from SUBPAY_WARM_TEMPLATES; SUBPAY_WARMUP=0 turns it off.
+
+    Returns:
+        bool: True if this call started the warmup
+    """
+    global _started
+    if os.environ.get(WARMUP_ENV, "1") == "0":
+        return False
+    with _started_lock:
+        if _started:
+            return False
+        _started = True
+
+    template_paths = [path for path in os.environ.get(WARM_TEMPLATES_ENV, "").split(os.pathsep) if path]
+    threading.Thread(target=warm_caches, args=(template_paths,), name="subpay-warmup", daemon=True).start()
+    return True
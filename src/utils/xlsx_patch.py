@@ -0,0 +1,319 @@
+import io
+import re
+import math
+import numbers
+import posixpath
+import logging
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger(__name__)
+
+# Excel's day zero for the 1900 date system (accounts for the 1900 leap-year bug)
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+# Built-in "m/d/yyyy" number format, used when a date lands in a cell without a date format
+DATE_NUM_FMT_ID = 14
+
+# Built-in number format ids that display dates
+BUILTIN_DATE_FMT_IDS = set(range(14, 23)) | set(range(27, 37)) | set(range(50, 59))
+
+_ROW_RE = re.compile(r'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+_CELL_RE = re.compile(r'<c\b[^>]*?(?:/>|>.*?</c>)', re.S)
+_ATTR_RE = r'\b{}="([^"]*)"'
+_CELL_REF_RE = re.compile(r'([A-Z]+)(\d+)')
+_ILLEGAL_XML_CHARS_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class XlsxPatchError(Exception):
+    """Raised when a template uses a structure the XML patcher does not handle."""
+
+
+def _attr(tag, name):
+    match = re.search(_ATTR_RE.format(re.escape(name)), tag)
+    return match.group(1) if match else None
+
+
+def _start_tag(element):
+    return element[:element.index('>') + 1]
+
+
+def column_letter(col_idx):
+    """Convert a 1-based column index to its letter (1 -> A, 27 -> AA)."""
+    letters = ""
+    while col_idx:
+        col_idx, remainder = divmod(col_idx - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def column_index(letters):
+    """Convert a column letter to its 1-based index (A -> 1, AA -> 27)."""
+    col_idx = 0
+    for char in letters:
+        col_idx = col_idx * 26 + ord(char) - 64
+    return col_idx
+
+
+def _resolve_target(target):
+    """Resolve a workbook relationship target to a path inside the zip."""
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join('xl', target))
+
+
+def sheet_parts(archive):
+    """
+    Map every sheet name of a workbook to its worksheet XML part.
+
+    Args:
+        archive (zipfile.ZipFile): Open XLSX archive
+
+    Returns:
+        dict: Sheet name -> path of the worksheet part inside the archive
+    """
+    workbook_xml = archive.read('xl/workbook.xml').decode('utf-8')
+    rels_xml = archive.read('xl/_rels/workbook.xml.rels').decode('utf-8')
+
+    targets = {}
+    for rel in re.findall(r'<Relationship\b[^>]*>', rels_xml):
+        targets[_attr(rel, 'Id')] = _resolve_target(_attr(rel, 'Target'))
+
+    parts = {}
+    for sheet in re.findall(r'<sheet\b[^>]*>', workbook_xml):
+        # The relationship id attribute is r:id with whatever prefix the file declares
+        rel_id = re.search(r'\b\w+:id="([^"]*)"', sheet)
+        rel_id = rel_id.group(1) if rel_id else None
+        name = _attr(sheet, 'name')
+        if name is None or rel_id not in targets:
+            raise XlsxPatchError(f"Cannot resolve the worksheet part of sheet {name!r}")
+        parts[_unescape(name)] = targets[rel_id]
+    return parts
+
+
+def _unescape(text):
+    return (text.replace('&lt;', '<').replace('&gt;', '>').replace('&quot;', '"')
+            .replace('&apos;', "'").replace('&amp;', '&'))
+
+
+class _DateStyles:
+    """
+    Tracks the cell formats of styles.xml so dates always land in a date-formatted style.
+
+    Styles of cells that already display dates are reused; otherwise a copy of the
+    cell's format with a date number format is appended to cellXfs (once per style).
+    """
+
+    def __init__(self, styles_xml):
+        self.styles_xml = styles_xml
+        self._added = {}
+        self._date_fmt_ids = set(BUILTIN_DATE_FMT_IDS)
+        for num_fmt in re.findall(r'<numFmt\b[^>]*>', styles_xml):
+            code = _unescape(_attr(num_fmt, 'formatCode') or '').lower()
+            # Drop quoted literals and colour/locale sections before looking for date tokens
+            code = re.sub(r'"[^"]*"|\[[^\]]*\]', '', code)
+            if re.search(r'[dmy]', code):
+                self._date_fmt_ids.add(int(_attr(num_fmt, 'numFmtId')))
+
+        match = re.search(r'<cellXfs\b[^>]*>(.*?)</cellXfs>', styles_xml, re.S)
+        if not match:
+            raise XlsxPatchError("styles.xml has no cellXfs")
+        self._xfs = re.findall(r'<xf\b[^>]*?(?:/>|>.*?</xf>)', match.group(1), re.S)
+        self._new_xfs = []
+
+    @property
+    def changed(self):
+        return bool(self._new_xfs)
+
+    def date_style(self, style):
+        """Return the index of a date-formatted version of cell style index style."""
+        style = int(style or 0)
+        if style in self._added:
+            return self._added[style]
+        if style < len(self._xfs):
+            base = self._xfs[style]
+            num_fmt_id = int(_attr(_start_tag(base), 'numFmtId') or 0)
+            if num_fmt_id in self._date_fmt_ids:
+                return style
+        else:
+            base = '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+
+        tag = _start_tag(base)
+        new_tag = re.sub(r'\bnumFmtId="[^"]*"', f'numFmtId="{DATE_NUM_FMT_ID}"', tag)
+        if 'numFmtId=' not in new_tag:
+            new_tag = new_tag.replace('<xf', f'<xf numFmtId="{DATE_NUM_FMT_ID}"', 1)
+        if 'applyNumberFormat=' in new_tag:
+            new_tag = re.sub(r'\bapplyNumberFormat="[^"]*"', 'applyNumberFormat="1"', new_tag)
+        else:
+            new_tag = new_tag.replace('<xf', '<xf applyNumberFormat="1"', 1)
+        self._new_xfs.append(new_tag + base[len(tag):])
+
+        index = len(self._xfs) + len(self._new_xfs) - 1
+        self._added[style] = index
+        return index
+
+    def render(self):
+        """Return styles.xml with the added cell formats."""
+        total = len(self._xfs) + len(self._new_xfs)
+
+        def append(match):
+            start = re.sub(r'\bcount="\d+"', f'count="{total}"', match.group(1))
+            return start + match.group(2) + ''.join(self._new_xfs) + '</cellXfs>'
+
+        return re.sub(r'(<cellXfs\b[^>]*>)(.*?)</cellXfs>', append, self.styles_xml, count=1, flags=re.S)
+
+
+def _cell_xml(ref, value, style, date_styles):
+    """Build the XML of a cell holding value, keeping the template's style where possible."""
+    if isinstance(value, (date, datetime)):
+        if not isinstance(value, datetime):
+            value = datetime(value.year, value.month, value.day)
+        serial = (value - EXCEL_EPOCH).total_seconds() / 86400
+        style = date_styles.date_style(style)
+        serial = int(serial) if serial.is_integer() else serial
+        return f'<c r="{ref}" s="{style}"><v>{serial}</v></c>'
+
+    style_attr = f' s="{style}"' if style is not None else ''
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return f'<c r="{ref}"{style_attr}/>'
+    if isinstance(value, bool):
+        return f'<c r="{ref}"{style_attr} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Number):
+        return f'<c r="{ref}"{style_attr}><v>{value}</v></c>'
+    text = escape(_ILLEGAL_XML_CHARS_RE.sub('', str(value)))
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _patch_row(row_xml, row_idx, values, date_styles):
+    """Replace or insert the cells of one row."""
+    if row_xml is None:
+        start_tag, body = f'<row r="{row_idx}">', ''
+    elif row_xml.endswith('/>') and row_xml.index('>') == len(row_xml) - 1:
+        start_tag, body = row_xml[:-2].rstrip() + '>', ''
+    else:
+        start_tag = _start_tag(row_xml)
+        body = row_xml[len(start_tag):-len('</row>')]
+    # Spans are an optional hint and may no longer be accurate once cells are added
+    start_tag = re.sub(r'\s+spans="[^"]*"', '', start_tag)
+
+    cells = {}
+    for cell in _CELL_RE.findall(body):
+        ref = _attr(_start_tag(cell), 'r')
+        if ref is None:
+            raise XlsxPatchError(f"Row {row_idx} has cells without a reference")
+        cells[column_index(_CELL_REF_RE.match(ref).group(1))] = cell
+    if _CELL_RE.sub('', body).strip():
+        raise XlsxPatchError(f"Row {row_idx} has content other than cells")
+
+    for col_idx, value in values.items():
+        existing = cells.get(col_idx)
+        if existing is not None and re.search(r'<f\b[^>]*\bt="shared"[^>]*\bref=', existing):
+            raise XlsxPatchError(f"Cell {column_letter(col_idx)}{row_idx} holds a shared formula")
+        style = _attr(_start_tag(existing), 's') if existing is not None else _attr(start_tag, 's')
+        cells[col_idx] = _cell_xml(f"{column_letter(col_idx)}{row_idx}", value, style, date_styles)
+
+    return start_tag + ''.join(cells[col] for col in sorted(cells)) + '</row>'
+
+
+def patch_sheet_xml(sheet_xml, cell_values, date_styles):
+    """
+    Write cell values into a worksheet XML part, leaving everything else as it is.
+
+    Args:
+        sheet_xml (str): Worksheet XML
+        cell_values (dict): (row, column) -> value, with 1-based row and column
+        date_styles (_DateStyles): Style tracker of the workbook
+
+    Returns:
+        str: Patched worksheet XML
+    """
+    match = re.search(r'<sheetData\b[^>]*?(?:/>|>(.*?)</sheetData>)', sheet_xml, re.S)
+    if not match:
+        raise XlsxPatchError("Worksheet has no sheetData")
+    body = match.group(1) or ''
+
+    by_row = {}
+    for (row_idx, col_idx), value in cell_values.items():
+        by_row.setdefault(row_idx, {})[col_idx] = value
+
+    rows = {}
+    for row in _ROW_RE.findall(body):
+        row_idx = _attr(_start_tag(row), 'r')
+        if row_idx is None:
+            raise XlsxPatchError("Worksheet has rows without a row number")
+        rows[int(row_idx)] = row
+    if _ROW_RE.sub('', body).strip():
+        raise XlsxPatchError("sheetData has content other than rows")
+
+    for row_idx, values in by_row.items():
+        rows[row_idx] = _patch_row(rows.get(row_idx), row_idx, values, date_styles)
+
+    new_body = ''.join(rows[row_idx] for row_idx in sorted(rows))
+    return sheet_xml[:match.start()] + f'<sheetData>{new_body}</sheetData>' + sheet_xml[match.end():]
+
+
+def _force_full_calc(workbook_xml):
+    """Ask Excel to recalculate formulas (e.g. Amount totals) when the file is opened."""
+    calc_pr = re.search(r'<calcPr\b[^>]*?/?>', workbook_xml)
+    if calc_pr:
+        tag = calc_pr.group(0)
+        if 'fullCalcOnLoad=' in tag:
+            new_tag = re.sub(r'\bfullCalcOnLoad="[^"]*"', 'fullCalcOnLoad="1"', tag)
+        else:
+            new_tag = tag.replace('<calcPr', '<calcPr fullCalcOnLoad="1"', 1)
+        return workbook_xml.replace(tag, new_tag, 1)
+
+    # calcPr follows these elements in the workbook schema
+    position = None
+    for closing in ('</sheets>', '</functionGroups>', '</externalReferences>', '</definedNames>'):
+        idx = workbook_xml.find(closing)
+        if idx != -1:
+            position = idx + len(closing)
+    if position is None:
+        return workbook_xml
+    return workbook_xml[:position] + '<calcPr fullCalcOnLoad="1"/>' + workbook_xml[position:]
+
+
+def patch_workbook(template_bytes, sheet_updates, progress=None):
+    """
+    Write cell values into selected sheets of an XLSX file by editing its XML directly.
+
+    Only the worksheet parts listed in sheet_updates are rewritten (plus styles.xml when a
+    date format has to be added, and the calculation flag in workbook.xml); every other
+    part is copied unchanged, so formulas, styles and sheets without jobs stay intact.
+
+    Args:
+        template_bytes (bytes): Raw XLSX content of the template
+        sheet_updates (dict): Sheet name -> {(row, column): value}
+        progress (callable): Called as progress(done, total, message) after each sheet is patched
+
+    Returns:
+        bytes: XLSX content of the patched workbook
+
+    Raises:
+        XlsxPatchError: If the template uses a structure the patcher does not handle
+    """
+    with zipfile.ZipFile(io.BytesIO(template_bytes)) as archive:
+        parts = sheet_parts(archive)
+        date_styles = _DateStyles(archive.read('xl/styles.xml').decode('utf-8'))
+
+        patched = {}
+        for done, (sheet_name, cell_values) in enumerate(sheet_updates.items(), start=1):
+            if sheet_name not in parts:
+                raise XlsxPatchError(f"Sheet '{sheet_name}' not found in template")
+            part = parts[sheet_name]
+            patched[part] = patch_sheet_xml(archive.read(part).decode('utf-8'), cell_values, date_styles).encode('utf-8')
+            if progress:
+                progress(done, len(sheet_updates), f"Filled sheet '{sheet_name}'")
+        if date_styles.changed:
+            patched['xl/styles.xml'] = date_styles.render().encode('utf-8')
+        patched['xl/workbook.xml'] = _force_full_calc(archive.read('xl/workbook.xml').decode('utf-8')).encode('utf-8')
+
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as out:
+            for info in archive.infolist():
+                out.writestr(info, patched.get(info.filename, archive.read(info.filename)))
+
+    logger.info(f"Patched {len(sheet_updates)} of {len(parts)} sheets")
+    return output.getvalue()
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+import io
+import json
+import openpyxl
+from datetime import datetime
+from src.utils.batch import discover_pairs, run_batch
+from tests.test_excel_writer import create_test_template
+
+def write_report(path, techs):
+    """Write a small Service Fusion style report."""
+    df = pd.DataFrame({
+        'Tech': techs,
+        'Job#': [1000 + i for i in range(len(techs))],
+        'Status': ['Invoiced'] * len(techs),
+        'Completed On': [datetime(2024, 5, 7)] * len(techs),
+        'Job Category': ['Repair'] * len(techs)
+    })
+    df.to_excel(path, sheet_name="Worksheet", index=False)
+
+def test_run_batch(tmp_path):
+    """Every report in a directory is processed and summarized."""
+    input_dir = tmp_path / "reports"
+    input_dir.mkdir()
+    write_report(input_dir / "week1.xlsx", ['Sub 1', 'Sub 3', '2 Sub'])
+    write_report(input_dir / "week2.xlsx", ['Employee'])
+    (input_dir / "broken.xlsx").write_bytes(b"not a workbook")
+    template_path = tmp_path / "template.xlsx"
+    template_path.write_bytes(create_test_template())
+    
+    pairs = discover_pairs(input_dir, template_path)
+    summary = run_batch(pairs, ['Sub 1', 'Sub 3', '2 Sub'], tmp_path / "out", workers=2)
+    
+    assert [result['report'] for result in summary['results']] == [pair[0] for pair in pairs]
+    results = {result['report'].rsplit('/', 1)[-1]: result for result in summary['results']}
+    assert summary['failed'] == 1
+    assert results['broken.xlsx']['error']
+    assert results['week2.xlsx']['output'] is None
+    
+    week1 = results['week1.xlsx']
+    assert week1['date_range'] == ['2024-05-06', '2024-05-12']
+    assert week1['skipped_subs'] == ['Sub 3']
+    # The reordered name is written to the Sub 2 tab, and the summary says so
+    assert [match['sheet'] for match in week1['tab_matches']] == ['Sub 2']
+    assert any("'2 Sub' was written to tab 'Sub 2'" in warning for warning in week1['warnings'])
+    wb = openpyxl.load_workbook(week1['output'])
+    assert wb["Sub 1"].cell(row=13, column=3).value == 1000
+    
+    with open(tmp_path / "out" / "summary.json") as f:
+        assert json.load(f)['processed'] == 3
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])
@@ -2,42 +2,38 @@ import pandas as pd
 import pytest
 import os
 import tempfile
+from pathlib import Path
 from datetime import datetime, timedelta
-from src.utils.data_processing import load_subs, save_subs, infer_week_range, generate_preview
+from src.utils.data_processing import load_subs, save_subs, subs_version, infer_week_range, generate_preview, team_subs, team_membership
+from src.utils.subs_store import SubsStore, set_subs_store, DEFAULT_SUBS, ALL_TEAMS
 
-def test_load_save_subs():
+def test_load_save_subs(tmp_path):
     """Test loading and saving the subcontractors list."""
-    # Create a temporary file for testing
-    temp_file = "test_subs.txt"
+    previous_store = set_subs_store(SubsStore(tmp_path))
     
     try:
-        # Test save function
-        test_subs = "Test Sub 1\nTest Sub 2\nTest Sub 3"
-        
-        # Override default subs file path for testing
-        import src.utils.data_processing
-        original_subs_file = src.utils.data_processing.SUBS_FILE
-        src.utils.data_processing.SUBS_FILE = temp_file
-        
         # Test save
-        save_subs(test_subs)
+        test_subs = "Test Sub 1\nTest Sub 2\n\nTest Sub 3"
+        assert save_subs(test_subs)
         
         # Test load
         loaded_subs = load_subs()
         
         # Verify content
-        assert len(loaded_subs) == 3
-        assert "Test Sub 1" in loaded_subs
-        assert "Test Sub 2" in loaded_subs
-        assert "Test Sub 3" in loaded_subs
+        assert loaded_subs == ["Test Sub 1", "Test Sub 2", "Test Sub 3"]
+        assert (tmp_path / "subcontractors.txt").read_text() == "Test Sub 1\nTest Sub 2\nTest Sub 3"
         
-    finally:
-        # Clean up
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
+        # Saving from an outdated version is refused
+        version = subs_version()
+        assert save_subs("Test Sub 4", expected_version=version)
+        assert not save_subs("Test Sub 5", expected_version=version)
+        assert load_subs() == ["Test Sub 4"]
         
-        # Restore original path
-        src.utils.data_processing.SUBS_FILE = original_subs_file
+        # Teams are stored separately; a missing list falls back to the defaults
+        assert load_subs("Welding") == DEFAULT_SUBS
+    
+    finally:
+        set_subs_store(previous_store)
 
 def test_infer_week_range():
     """Test the week range inference from dates."""
@@ -95,5 +91,22 @@ def test_generate_preview():
     assert len(filtered_df) == 2  # Only Sub 1 rows
     assert all(filtered_df['Tech'] == 'Sub 1')
 
+def test_all_teams_lists(tmp_path):
+    """All teams is the union of the team lists; membership is matched on normalized names."""
+    previous_store = set_subs_store(SubsStore(tmp_path))
+    
+    try:
+        assert save_subs("Sub 1\nSub 3", "Construction")
+        assert save_subs("SUB 1\nSub 2", "Welding")
+        
+        assert load_subs(ALL_TEAMS) == ["Sub 1", "Sub 3", "Sub 2"]
+        assert subs_version(ALL_TEAMS) == f"{subs_version('Construction')}+{subs_version('Welding')}"
+        teams = team_subs(ALL_TEAMS)
+        assert teams == {"Construction": ["Sub 1", "Sub 3"], "Welding": ["SUB 1", "Sub 2"]}
+        assert team_membership(["Sub 1", "Sub 2", "Other"], teams) == {"Sub 1": ["Construction", "Welding"], "Sub 2": ["Welding"], "Other": []}
+    
+    finally:
+        set_subs_store(previous_store)
+
 if __name__ == "__main__":
     pytest.main(['-v', __file__]) 
\ No newline at end of file
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+from datetime import date, datetime
+import src.utils.dates as dates
+from src.utils.dates import parse_completed_on, infer_date_format, from_excel_serial, week_histogram, clear_format_cache
+
+def test_excel_serial_fast_path():
+    """Serial day numbers, as numbers or text, should convert to their calendar dates."""
+    parsed = parse_completed_on(pd.Series([45426, 45426.5, None, -3]))
+
+    assert parsed.tolist()[:2] == [pd.Timestamp('2024-05-14'), pd.Timestamp('2024-05-14 12:00')]
+    assert parsed[2:].isna().all()
+    assert from_excel_serial(pd.Series(['45426'])).iloc[0] == pd.Timestamp('2024-05-14')
+
+def test_infer_date_format():
+    """The format matching the whole sample should win; day-first dates are not guessed."""
+    assert infer_date_format(pd.Series(['05/14/2024', '12/31/2024'])) == '%m/%d/%Y'
+    assert infer_date_format(pd.Series(['05/14/2024 09:30 AM', '05/14/2024 01:15 PM'])) == '%m/%d/%Y %I:%M %p'
+    assert infer_date_format(pd.Series(['2024-05-14', '2024-12-31'])) == '%Y-%m-%d'
+    assert infer_date_format(pd.Series(['14.05.2024'])) is None
+
+def test_mixed_cells():
+    """Datetimes, serial numbers and text in one column should each parse; junk becomes NaT."""
+    values = pd.Series([datetime(2024, 5, 13), 45426, '05/15/2024', '2024-05-16', 'not a date', None], dtype=object)
+    parsed = parse_completed_on(values)
+
+    assert parsed.dt.date.tolist()[:4] == [date(2024, 5, 13), date(2024, 5, 14), date(2024, 5, 15), date(2024, 5, 16)]
+    assert parsed[4:].isna().all()
+    assert parse_completed_on(parsed) is parsed
+
+def test_format_cached_per_report(monkeypatch):
+    """A report's sample should be checked once; later parses reuse the cached format."""
+    clear_format_cache()
+    calls = []
+    original = dates.infer_date_format
+    monkeypatch.setattr(dates, 'infer_date_format', lambda values: calls.append(len(values)) or original(values))
+
+    values = pd.Series(['05/14/2024', '05/15/2024'])
+    parse_completed_on(values, report_hash='report-a')
+    parse_completed_on(values, report_hash='report-a')
+    parse_completed_on(values, report_hash='report-b')
+
+    assert len(calls) == 2
+
+def test_week_histogram():
+    """Jobs should be counted per Monday-Sunday week, earliest week first, without undated jobs."""
+    histogram = week_histogram(pd.Series(['05/19/2024', '05/13/2024', '05/14/2024', '05/20/2024', None]))
+
+    assert histogram['Week Start'].tolist() == [date(2024, 5, 13), date(2024, 5, 20)]
+    assert histogram['Week End'].tolist() == [date(2024, 5, 19), date(2024, 5, 26)]
+    assert histogram['Jobs'].tolist() == [3, 1]
+    assert week_histogram(pd.Series([None, None])).empty
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])
@@ -0,0 +1,59 @@
+import logging
+import pytest
+from src.utils import diagnostics
+from src.utils.diagnostics import event, count, recent_events, clear_events, diagnostics_run, set_level, set_sample_rate, set_buffer_size
+from src.utils.excel_writer import plan_sheet_updates
+from src.utils.template_layout import compile_template
+from tests.test_excel_writer import create_test_template
+
+@pytest.fixture(autouse=True)
+def fresh_buffer():
+    """Each test starts from an empty buffer at the default level."""
+    clear_events()
+    previous = set_level(logging.INFO)
+    yield
+    set_level(previous)
+    set_buffer_size(diagnostics.DEFAULT_DIAGNOSTICS_BUFFER)
+    clear_events()
+
+def test_level_gating_and_sampling():
+    """Events below the level are only counted; sampled events keep 1 in N per run."""
+    set_sample_rate("row_written", 3)
+    with diagnostics_run("test") as run:
+        assert not event("detail", logging.DEBUG, "Not kept")
+        kept = [event("row_written", logging.INFO, f"Row {row}", row=row) for row in range(7)]
+        count("cells", 40)
+    
+    assert kept == [True, False, False, True, False, False, True]
+    assert run.counters == {"detail": 1, "row_written": 7, "cells": 40}
+    
+    events = recent_events()
+    assert [record["event"] for record in events] == ["run_summary", "row_written", "row_written", "row_written"]
+    assert [record["fields"].get("row") for record in events[1:]] == [6, 3, 0]
+    assert events[0]["fields"]["counters"] == {"detail": 1, "row_written": 7, "cells": 40}
+    assert events[1]["run"] == "test"
+
+def test_ring_buffer_is_bounded():
+    """Only the newest events are kept, and they can be filtered by level."""
+    set_buffer_size(5)
+    for number in range(20):
+        event("note", logging.WARNING if number % 2 else logging.INFO, f"Note {number}")
+    
+    assert [record["message"] for record in recent_events()] == [f"Note {number}" for number in range(19, 14, -1)]
+    assert [record["message"] for record in recent_events("WARNING", limit=2)] == ["Note 19", "Note 17"]
+
+def test_plan_sheet_updates_summarizes_per_sheet_lines(caplog):
+    """Writing many sheets logs a sample of per-sheet lines and one summary with the counts."""
+    layout = compile_template(create_test_template())
+    sheet_rows = {sub: [("05/07/2024", "Property", 1000, "Repair", 1, None)] for sub in ["Sub 1", "Sub 3"]}
+    set_level(logging.DEBUG)
+    
+    with caplog.at_level(logging.DEBUG), diagnostics_run("pay sheet") as run:
+        plan_sheet_updates(sheet_rows, layout, None)
+    
+    assert run.counters == {"sheet_filled": 1, "jobs_written": 1, "sheet_missing": 1}
+    assert "sheet_missing: No matching sheet found for subcontractor: Sub 3" in caplog.text
+    assert sum("run_summary" in message for message in caplog.messages) == 1
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])
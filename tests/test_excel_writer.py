@@ -3,9 +3,10 @@ import pytest
 import os
 import io
 import tempfile
+import zipfile
 import openpyxl
 from datetime import datetime, timedelta
-from src.utils.excel_writer import create_pay_sheet
+from src.utils.excel_writer import create_pay_sheet, create_pay_sheet_bundle, build_pay_sheet, build_weekly_pay_sheets, build_team_pay_sheets, prepare_sheet_rows, resolve_sheet_columns, cleanup_spill_dir
 
 class MockFileUpload:
     """Mock class to simulate a file upload in Streamlit."""
@@ -82,15 +83,15 @@ def test_create_pay_sheet():
         
         # Check Sub 1 sheet
         sheet = wb["Sub 1"]
-        assert sheet.cell(row=13, column=1).value == monday  # Date
-        assert sheet.cell(row=13, column=3).value == "1001"  # Job#
-        assert sheet.cell(row=14, column=3).value == "1002"  # Job#
+        assert sheet.cell(row=13, column=1).value.date() == monday  # Date
+        assert sheet.cell(row=13, column=3).value == 1001  # Job# written as a number
+        assert sheet.cell(row=14, column=3).value == 1002  # Job#
         assert sheet.cell(row=13, column=5).value == 1  # Qty
         
         # Check Sub 2 sheet
         sheet = wb["Sub 2"]
-        assert sheet.cell(row=13, column=1).value == sunday  # Date
-        assert sheet.cell(row=13, column=3).value == "1003"  # Job#
+        assert sheet.cell(row=13, column=1).value.date() == sunday  # Date
+        assert sheet.cell(row=13, column=3).value == 1003  # Job#
         assert sheet.cell(row=13, column=5).value == 1  # Qty
         
         # Check formulas preserved
@@ -102,5 +103,246 @@ def test_create_pay_sheet():
         if os.path.exists(output_path):
             os.remove(output_path)
 
+def test_prepare_sheet_rows():
+    """Jobs are grouped per subcontractor, sorted by date with undated jobs last."""
+    data = {
+        'Tech': ['Sub 1', 'Sub 2', 'Sub 1', 'Sub 1'],
+        'Job#': ['1001', 1002.0, None, 'A-7'],
+        'Completed On': ['05/03/2024', datetime(2024, 5, 1), None, '2024-05-02'],
+        'Customer )': [None, ' Acme ', None, None],
+        'Service Location Address 1': ['1 Main St', None, None, None],
+        'Job Details': ['x' * 120, None, None, 'Patch wall'],
+        'Job Category': ['Repair', 'Install', None, 'Repair']
+    }
+    
+    rows = prepare_sheet_rows(pd.DataFrame(data))
+    
+    assert list(rows) == ['Sub 1', 'Sub 2']
+    sub_1 = rows['Sub 1']
+    assert [row[0] for row in sub_1] == [datetime(2024, 5, 2).date(), datetime(2024, 5, 3).date(), None]
+    assert sub_1[0] == (datetime(2024, 5, 2).date(), 'N/A', 'A-7', 'Patch wall', 1, None)
+    assert sub_1[1][1:3] == ('1 Main St', 1001)
+    assert sub_1[1][3] == 'x' * 100 + '...'
+    assert sub_1[2][2:4] == ('N/A', 'N/A')
+    assert rows['Sub 2'] == [(datetime(2024, 5, 1).date(), 'Acme', 1002, 'Install', 1, None)]
+
+def test_resolve_sheet_columns():
+    """Written columns are derived once as whole columns; a resolved frame is passed through."""
+    jobs = pd.DataFrame({
+        'Tech': ['Sub 1', 'Sub 1', 'Sub 1'],
+        'Job#': pd.Series(['1001.9', 'inf', None], dtype='str'),
+        'Completed On': ['05/03/2024', None, '05/01/2024'],
+        'Customer': ['', 'Acme', None],
+        'Customer )': ['Beta', None, None]
+    })
+    
+    resolved = resolve_sheet_columns(jobs)
+    
+    assert resolved['Date'].tolist() == [datetime(2024, 5, 3).date(), None, datetime(2024, 5, 1).date()]
+    assert resolved['Property'].tolist() == ['Beta', 'Acme', 'N/A']
+    assert resolved['Job Number'].tolist() == [1001, 'inf', 'N/A']
+    assert resolved['Description'].tolist() == ['N/A', 'N/A', 'N/A']
+    assert resolve_sheet_columns(resolved) is resolved
+    assert prepare_sheet_rows(resolved) == prepare_sheet_rows(jobs)
+
+def test_create_pay_sheet_xml_engine():
+    """The XML patching engine writes the same values and keeps other sheets and formulas intact."""
+    monday = datetime(2024, 5, 6).date()
+    sunday = datetime(2024, 5, 12).date()
+    
+    data = {
+        'Tech': ['Sub 1', 'Sub 1', 'Sub 3'],
+        'Job#': ['1001', '1002', '1004'],
+        'Completed On': [monday + timedelta(days=2), monday, sunday],
+        'Job Category': ['A & B', '<Repair>', 'Category 4'],
+        'Customer': ['Acme "North"', None, 'Globex']
+    }
+    template_file = MockFileUpload(create_test_template())
+    
+    output_path, skipped_subs = create_pay_sheet(template_file, pd.DataFrame(data), [monday, sunday], engine="xml")
+    
+    try:
+        assert skipped_subs == ["Sub 3"]
+        wb = openpyxl.load_workbook(output_path)
+        
+        sheet = wb["Sub 1"]
+        assert sheet.cell(row=13, column=1).value.date() == monday
+        assert sheet.cell(row=13, column=1).is_date
+        assert [sheet.cell(row=13, column=col).value for col in range(2, 6)] == ["N/A", 1002, "<Repair>", 1]
+        assert [sheet.cell(row=14, column=col).value for col in range(2, 6)] == ['Acme "North"', 1001, "A & B", 1]
+        assert sheet.cell(row=30, column=7).value == "=SUM(G13:G29)"
+        
+        # Sheets without jobs are copied unchanged
+        assert wb["Sub 2"].cell(row=13, column=1).value is None
+        assert wb["Sub 2"].cell(row=12, column=1).value == "Date"
+    
+    finally:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+def test_create_pay_sheet_bundle():
+    """Each subcontractor gets a workbook with only their tab, next to the combined workbook."""
+    monday = datetime(2024, 5, 6).date()
+    sunday = datetime(2024, 5, 12).date()
+    
+    data = {
+        'Tech': ['Sub 1', 'Sub 2', 'Sub 3'],
+        'Job#': ['1001', '1002', '1003'],
+        'Completed On': [monday, sunday, sunday],
+        'Job Category': ['Category 1', 'Category 2', 'Category 3']
+    }
+    template_file = MockFileUpload(create_test_template())
+    
+    output_path, skipped_subs = create_pay_sheet_bundle(template_file, pd.DataFrame(data), [monday, sunday], max_workers=2)
+    
+    try:
+        assert output_path.endswith('.zip')
+        assert skipped_subs == ["Sub 3"]
+        with zipfile.ZipFile(output_path) as bundle:
+            names = sorted(bundle.namelist())
+            assert names == [
+                "Sub 1_2024-05-06_to_2024-05-12.xlsx",
+                "Sub 2_2024-05-06_to_2024-05-12.xlsx",
+                "Sub_PaySheet_2024-05-06_to_2024-05-12.xlsx"
+            ]
+            
+            wb = openpyxl.load_workbook(io.BytesIO(bundle.read("Sub 2_2024-05-06_to_2024-05-12.xlsx")))
+            assert wb.sheetnames == ["Sub 2"]
+            assert wb["Sub 2"].cell(row=13, column=3).value == 1002
+            
+            wb = openpyxl.load_workbook(io.BytesIO(bundle.read("Sub_PaySheet_2024-05-06_to_2024-05-12.xlsx")))
+            assert wb.sheetnames == ["Sub 1", "Sub 2"]
+            assert wb["Sub 1"].cell(row=13, column=3).value == 1001
+    
+    finally:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+def test_build_pay_sheet_in_memory():
+    """The in-memory pipeline returns the workbook bytes without writing files."""
+    monday = datetime(2024, 5, 6).date()
+    sunday = datetime(2024, 5, 12).date()
+    
+    data = {
+        'Tech': ['Sub 1'],
+        'Job#': ['1001'],
+        'Completed On': [monday],
+        'Job Category': ['Category 1']
+    }
+    template_file = MockFileUpload(create_test_template())
+    
+    filename, content, skipped_subs, tab_matches, written_jobs = build_pay_sheet(template_file, pd.DataFrame(data), [monday, sunday])
+    
+    assert filename == "Sub_PaySheet_2024-05-06_to_2024-05-12.xlsx"
+    assert skipped_subs == []
+    assert tab_matches == []
+    assert written_jobs == [0]
+    wb = openpyxl.load_workbook(io.BytesIO(content))
+    assert wb["Sub 1"].cell(row=13, column=3).value == 1001
+
+def test_written_jobs_leave_out_unwritten_jobs():
+    """Jobs of a subcontractor without a tab and jobs beyond a sheet's capacity are not reported as written."""
+    monday, sunday = datetime(2024, 5, 6).date(), datetime(2024, 5, 12).date()
+    jobs = pd.DataFrame({
+        'Tech': ['Sub 1'] * 20 + ['Sub 3'],
+        'Job#': list(range(1001, 1022)),
+        'Completed On': [datetime(2024, 5, 6) + timedelta(hours=hour) for hour in range(21)],
+        'Job Category': ['Repair'] * 21
+    })
+    
+    _, content, skipped_subs, _, written_jobs = build_pay_sheet(MockFileUpload(create_test_template()), jobs, [monday, sunday])
+    
+    assert skipped_subs == ['Sub 3']
+    assert written_jobs == list(range(17))
+    wb = openpyxl.load_workbook(io.BytesIO(content))
+    assert wb["Sub 1"].cell(row=29, column=3).value == 1017
+
+def test_tab_matches_reported():
+    """Subcontractors written to a tab matched by similarity are returned with the tab, method and score."""
+    monday, sunday = datetime(2024, 5, 6).date(), datetime(2024, 5, 12).date()
+    jobs = pd.DataFrame({
+        'Tech': ['SUB 1', '2 Sub', 'Sub 3'],
+        'Job#': ['1001', '1002', '1003'],
+        'Completed On': [datetime(2024, 5, 7)] * 3,
+        'Job Category': ['Repair'] * 3
+    })
+    
+    _, content, skipped_subs, tab_matches, written_jobs = build_pay_sheet(MockFileUpload(create_test_template()), jobs, [monday, sunday])
+    
+    # A case difference is not reported; the reordered name is
+    assert skipped_subs == ['Sub 3']
+    assert tab_matches == [{"sub": "2 Sub", "sheet": "Sub 2", "method": "reordered", "score": 1.0}]
+    assert sorted(written_jobs) == [0, 1]
+    wb = openpyxl.load_workbook(io.BytesIO(content))
+    assert wb["Sub 2"].cell(row=13, column=3).value == 1002
+
+def test_spilled_outputs_cleaned_up():
+    """Spilled outputs are removed once they expire."""
+    monday = datetime(2024, 5, 6).date()
+    data = {'Tech': ['Sub 1'], 'Job#': ['1001'], 'Completed On': [monday], 'Job Category': ['Category 1']}
+    
+    output_path, _ = create_pay_sheet(MockFileUpload(create_test_template()), pd.DataFrame(data), [monday, monday])
+    assert os.path.exists(output_path)
+    
+    cleanup_spill_dir(max_age=-1)
+    assert not os.path.exists(output_path)
+
+def test_build_weekly_pay_sheets():
+    """A multi-week report becomes one pay sheet per Monday-Sunday week."""
+    data = {
+        'Tech': ['Sub 1', 'Sub 1', 'Sub 2', 'Sub 1'],
+        'Job#': ['1001', '1002', '1003', '1004'],
+        'Completed On': [datetime(2024, 5, 6), datetime(2024, 5, 19), datetime(2024, 5, 14), None],
+        'Job Category': ['Category 1', 'Category 2', 'Category 3', 'Category 4']
+    }
+    template_file = MockFileUpload(create_test_template())
+    
+    filename, content, skipped_subs, tab_matches, weeks, written_jobs = build_weekly_pay_sheets(template_file, pd.DataFrame(data), max_workers=2)
+    
+    assert filename == "Sub_PaySheets_Weekly_2024-05-06_to_2024-05-19.zip"
+    assert weeks == [(datetime(2024, 5, 6).date(), datetime(2024, 5, 12).date()), (datetime(2024, 5, 13).date(), datetime(2024, 5, 19).date())]
+    assert skipped_subs == []
+    assert tab_matches == []
+    # The undated job is on no week's pay sheet
+    assert sorted(written_jobs) == [0, 1, 2]
+    with zipfile.ZipFile(io.BytesIO(content)) as bundle:
+        wb = openpyxl.load_workbook(io.BytesIO(bundle.read("Sub_PaySheet_2024-05-13_to_2024-05-19.xlsx")))
+        assert wb["Sub 1"].cell(row=13, column=3).value == 1002
+        assert wb["Sub 2"].cell(row=13, column=3).value == 1003
+        assert wb["Sub 1"].cell(row=14, column=3).value is None
+        assert len(bundle.namelist()) == 2
+
+@pytest.mark.parametrize("engine", ["openpyxl", "xml"])
+def test_build_team_pay_sheets(engine):
+    """Each team's pay sheet holds only its own subcontractors, from one template load."""
+    data = {
+        'Tech': ['Sub 1', 'Sub 2', 'Sub 1', 'Sub 3'],
+        'Job#': ['1001', '1002', '1003', '1004'],
+        'Completed On': [datetime(2024, 5, 7)] * 4,
+        'Job Category': ['Category 1', 'Category 2', 'Category 3', 'Category 4']
+    }
+    # Welding is filled first, so Construction's pay sheet shows its cells are put back
+    teams = {'Welding': ['SUB 2', 'Sub 1'], 'Construction': ['Sub 1', 'Sub 3']}
+    date_range = [datetime(2024, 5, 6).date(), datetime(2024, 5, 12).date()]
+    
+    filename, content, skipped_subs, tab_matches, written_jobs = build_team_pay_sheets(MockFileUpload(create_test_template()), pd.DataFrame(data), teams, date_range, engine=engine)
+    
+    assert filename == "Sub_PaySheets_All_Teams_2024-05-06_to_2024-05-12.zip"
+    assert skipped_subs == ['Sub 3']
+    assert tab_matches == []
+    # Sub 1's jobs are on two teams' pay sheets but listed once; Sub 3 has no tab
+    assert sorted(written_jobs) == [0, 1, 2]
+    with zipfile.ZipFile(io.BytesIO(content)) as bundle:
+        construction = openpyxl.load_workbook(io.BytesIO(bundle.read("Sub_PaySheet_Construction_2024-05-06_to_2024-05-12.xlsx")))
+        welding = openpyxl.load_workbook(io.BytesIO(bundle.read("Sub_PaySheet_Welding_2024-05-06_to_2024-05-12.xlsx")))
+    
+    # Sub 1 is on both lists; Sub 2 only on Welding's, so Construction's Sub 2 tab stays empty
+    assert [construction["Sub 1"].cell(row=row, column=3).value for row in (13, 14)] == [1001, 1003]
+    assert construction["Sub 2"].cell(row=13, column=3).value is None
+    assert construction["Sub 2"].cell(row=4, column=2).value is None
+    assert welding["Sub 2"].cell(row=13, column=3).value == 1002
+    assert [welding["Sub 1"].cell(row=row, column=3).value for row in (13, 14)] == [1001, 1003]
+    assert welding["Sub 1"].cell(row=30, column=7).value == "=SUM(G13:G29)"
+
 if __name__ == "__main__":
     pytest.main(['-v', __file__]) 
\ No newline at end of file
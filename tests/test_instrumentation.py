@@ -0,0 +1,38 @@
+import json
+import pytest
+from src.utils.instrumentation import span, collect_metrics, _NULL_SPAN
+from src.utils.report_loader import load_report, clear_report_cache
+from tests.test_report_loader import create_test_report
+
+def test_span_is_noop_without_run():
+    """Spans outside a metrics run should be the shared no-op object."""
+    with span("anything", rows=10) as timing:
+        timing.set(sheets=2)
+    
+    assert timing is _NULL_SPAN
+
+def test_collect_metrics_records_and_writes_jsonl(tmp_path):
+    """Spans inside a run should be recorded with their counts and written to the sink."""
+    clear_report_cache()
+    sink = tmp_path / "metrics.jsonl"
+    
+    content = create_test_report(rows=4)
+    
+    with collect_metrics("test", sink_path=str(sink)) as run:
+        load_report(content)
+        load_report(content)
+    
+    records = run.records()
+    assert [record["stage"] for record in records] == ["read_report", "read_report"]
+    assert records[0]["rows"] == 4 and records[0]["cached"] is False
+    assert records[1]["cached"] is True
+    
+    lines = [json.loads(line) for line in sink.read_text().splitlines()]
+    assert len(lines) == 2
+    assert all(line["run"] == "test" and line["run_id"] == run.run_id for line in lines)
+    
+    # The run is closed once the block exits
+    assert span("after") is _NULL_SPAN
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])
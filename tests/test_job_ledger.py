@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+from datetime import date
+from src.utils.job_ledger import JobLedger, job_keys
+from src.utils.data_processing import generate_preview
+
+def create_report(job_numbers, techs=None):
+    """A report of invoiced jobs, all for Sub 1 unless techs are given."""
+    techs = techs or ['Sub 1'] * len(job_numbers)
+    return pd.DataFrame({
+        'Tech': techs,
+        'Job#': job_numbers,
+        'Status': ['Invoiced'] * len(job_numbers),
+        'Completed On': [pd.Timestamp(2024, 5, 7)] * len(job_numbers)
+    })
+
+def test_job_keys():
+    """Numeric and text spellings of a Job# share a key."""
+    keys = job_keys(pd.Series([1001, '1001', 1001.0, ' A-7 ', None, '', '01001', '1001.5'], dtype=object))
+    
+    assert keys.tolist() == ['1001', '1001', '1001', 'A-7', None, None, '1001', '1001.5']
+    assert job_keys(pd.Series(['1001', None], dtype='str')).tolist() == ['1001', None]
+
+def test_ledger_skips_paid_jobs(tmp_path):
+    """Jobs paid from an earlier report are skipped or flagged; re-runs of that report are not."""
+    ledger = JobLedger(tmp_path / "ledger.sqlite3")
+    week = [date(2024, 5, 6), date(2024, 5, 12)]
+    
+    first, _ = generate_preview(create_report([1001, 1002]), ['Sub 1'], week, ledger=ledger, report_hash="first")
+    assert ledger.record(first, week, "first") == 2
+    assert ledger.record(first, week, "first") == 0
+    
+    # Regenerating the same report keeps its jobs
+    rerun, _ = generate_preview(create_report([1001, 1002]), ['Sub 1'], week, ledger=ledger, report_hash="first")
+    assert len(rerun) == 2
+    
+    # An overlapping export only brings the new job; duplicates within it are flagged
+    overlap = create_report(['1002', 1003, 1003, 1001], techs=['SUB 1', 'Sub 1', 'Sub 1', 'Sub 2'])
+    filtered_df, warnings = generate_preview(overlap, ['Sub 1', 'Sub 2'], week, ledger=ledger, report_hash="second")
+    assert filtered_df['Job#'].tolist() == [1003, 1003, 1001]
+    assert filtered_df['Duplicate'].tolist() == [False, True, False]
+    assert any("Skipped 1 jobs" in warning for warning in warnings)
+    
+    flagged_df, _ = generate_preview(overlap, ['Sub 1', 'Sub 2'], week, ledger=ledger, report_hash="second", include_paid=True)
+    assert flagged_df['Paid Week'].tolist()[0] == '2024-05-06'
+    assert flagged_df['Paid Week'].isna().sum() == 3
+
+def test_duplicates_with_text_job_numbers():
+    """A text Job# in the report does not hide a job listed twice with different spellings."""
+    report = create_report(['1001', '1001 ', 1001.0, 'A-7', ' A-7', None, None])
+    
+    filtered_df, warnings = generate_preview(report, ['Sub 1'], [date(2024, 5, 6), date(2024, 5, 12)])
+    
+    assert filtered_df['Duplicate'].tolist() == [False, True, True, False, True, False, False]
+    assert any("3 jobs appear more than once" in warning for warning in warnings)
+
+def test_ledger_history(tmp_path):
+    """History lists a subcontractor's jobs, latest pay week first."""
+    ledger = JobLedger(tmp_path / "ledger.sqlite3")
+    jobs = create_report([1, 2, 3], techs=['Sub 1', 'Sub 1', 'Sub 2'])
+    jobs.loc[1, 'Completed On'] = pd.Timestamp(2024, 5, 14)
+    ledger.record(jobs, report_hash="weekly")
+    
+    history = ledger.history("sub 1")
+    
+    assert history['Job#'].tolist() == ['2', '1']
+    assert history['Week Start'].tolist() == ['2024-05-13', '2024-05-06']
+    assert len(ledger) == 3
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])
@@ -0,0 +1,199 @@
+import pandas as pd
+import pytest
+import io
+import threading
+import openpyxl
+from datetime import date, datetime
+from src.utils.job_runner import JobRunner, JobQueueFullError, request_key, job_set_hash, run_pay_sheet_job
+from src.utils.job_ledger import JobLedger
+from src.utils.output_cache import OutputCache
+from src.utils.instrumentation import span, collect_metrics
+from tests.test_excel_writer import create_test_template
+
+def wait(runner, job_id, timeout=30):
+    """Poll a job until it has finished, like the UI does."""
+    deadline = datetime.now().timestamp() + timeout
+    while datetime.now().timestamp() < deadline:
+        job = runner.get(job_id)
+        if job.finished:
+            return job
+        threading.Event().wait(0.01)
+    raise TimeoutError(job_id)
+
+def test_job_progress_and_result():
+    """Jobs run in the background, report progress and keep their result until fetched."""
+    runner = JobRunner(max_workers=1)
+    release = threading.Event()
+    
+    def work(count, progress=None):
+        for done in range(1, count + 1):
+            progress(done, count, f"Step {done}")
+        release.wait(5)
+        return count * 2
+    
+    job_id = runner.submit(work, 3, label="Test")
+    job = runner.get(job_id)
+    assert job.label == "Test" and not job.finished
+    
+    release.set()
+    job = wait(runner, job_id)
+    assert job.status == "done" and job.result == 6
+    assert (job.done, job.total, job.message, job.fraction) == (3, 3, "Step 3", 1.0)
+    
+    runner.discard(job_id)
+    assert runner.get(job_id) is None
+
+def test_failed_job_and_prune():
+    """Errors are kept on the job; finished jobs expire."""
+    runner = JobRunner(max_workers=1)
+    
+    def fail(progress=None):
+        raise ValueError("No jobs to include in the pay sheet")
+    
+    job = wait(runner, runner.submit(fail))
+    assert job.status == "failed"
+    assert job.error == "No jobs to include in the pay sheet"
+    assert runner.prune(max_age=0) == 1
+    assert len(runner) == 0
+
+def test_queue_limits_workers_and_memory():
+    """Jobs wait for a free worker and for memory, in order, and know their position."""
+    runner = JobRunner(max_workers=2, memory_budget=100, max_queued=2)
+    release = threading.Event()
+    
+    def work(progress=None):
+        release.wait(5)
+    
+    first = runner.submit(work, memory=60)
+    second = runner.submit(work, memory=60)
+    third = runner.submit(work, memory=10)
+    assert runner.get(first).status == "running"
+    # The second job would exceed the memory budget, and the third waits behind it
+    assert (runner.get(second).status, runner.get(second).position) == ("queued", 1)
+    assert runner.get(third).position == 2
+    assert runner.stats() == {"running": 1, "waiting": 2, "memory": 60}
+    with pytest.raises(JobQueueFullError):
+        runner.submit(work)
+    
+    release.set()
+    for job_id in (first, second, third):
+        assert wait(runner, job_id).status == "done"
+    assert runner.stats() == {"running": 0, "waiting": 0, "memory": 0}
+
+def test_identical_requests_share_a_job():
+    """Requests with the same key run once; failed jobs, and finished ones if asked, are run again."""
+    runner = JobRunner(max_workers=1)
+    calls = []
+    
+    def work(progress=None):
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError("boom")
+        return len(calls)
+    
+    key = request_key("report", "template", [date(2024, 5, 6), date(2024, 5, 12)], "Construction", engine="xml")
+    failed = runner.submit(work, key=key)
+    assert wait(runner, failed).status == "failed"
+    
+    retried = runner.submit(work, key=key)
+    assert retried != failed
+    assert runner.submit(work, key=key) == retried
+    assert wait(runner, retried).result == 2
+    assert runner.submit(work, key=key) == retried
+    assert runner.submit(work, key=request_key("report", "template", None, "Construction", engine="xml")) != retried
+    
+    # Results depending on state outside the key (previews and the ledger) only join running jobs
+    rerun = runner.submit(work, key=key, reuse_finished=False)
+    assert rerun != retried and wait(runner, rerun).result == 4
+
+def staged_job(progress):
+    """A job with one timed stage."""
+    with span("stage", rows=3):
+        pass
+    return "done"
+
+def test_job_spans_reach_submitter_run(tmp_path):
+    """A submitted job's spans join the submitter's run while it records, and are written on their own after it finished."""
+    runner = JobRunner(max_workers=1)
+    sink = tmp_path / "metrics.jsonl"
+    
+    with collect_metrics("app", sink_path=str(sink)) as run:
+        job = wait(runner, runner.submit(staged_job, label="Preview"))
+    assert [record["stage"] for record in run.records()] == ["stage"]
+    assert job.metrics == run.records()
+    
+    with collect_metrics("app", sink_path=str(sink)) as run:
+        job_id = runner.submit(staged_job, label="Pay sheet")
+    job = wait(runner, job_id)
+    assert run.spans == [] and job.metrics[0]["stage"] == "stage"
+    assert [line.count('"stage": "stage"') for line in sink.read_text().splitlines()] == [1, 1]
+    
+    # Without a metrics run nothing is recorded
+    assert wait(runner, runner.submit(staged_job)).metrics is None
+
+def test_run_pay_sheet_job(tmp_path):
+    """The pay sheet job reports per-sheet progress and records only the jobs it wrote."""
+    # 20 jobs for Sub 1 (the template holds 17) and one for Sub 3, who has no tab
+    jobs = pd.DataFrame({
+        'Tech': ['Sub 1'] * 20 + ['Sub 3'],
+        'Job#': list(range(1001, 1022)),
+        'Completed On': [datetime(2024, 5, 7)] * 21,
+        'Job Category': ['Repair'] * 21
+    })
+    ledger = JobLedger(tmp_path / "ledger.sqlite3")
+    calls = []
+    
+    result = run_pay_sheet_job(
+        create_test_template(), jobs, [date(2024, 5, 6), date(2024, 5, 12)],
+        ledger=ledger, report_hash="report", progress=lambda *args: calls.append(args)
+    )
+    
+    assert calls == [(1, 1, "Filled sheet 'Sub 1'")]
+    assert result['skipped_subs'] == ['Sub 3']
+    assert result['recorded_jobs'] == 17
+    assert len(ledger) == 17
+    wb = openpyxl.load_workbook(io.BytesIO(result['data']))
+    assert wb["Sub 1"].cell(row=13, column=3).value == 1001
+    
+    # The jobs left off are still unpaid for the next overlapping report
+    paid = ledger.find_paid(jobs)['week_start'].notna()
+    assert paid.tolist() == [True] * 17 + [False] * 4
+
+def test_pay_sheet_served_from_output_cache(tmp_path):
+    """An identical request gets the cached bytes without filling the template, run inline past the queue."""
+    jobs = pd.DataFrame({'Tech': ['Sub 1'], 'Job#': [1001], 'Completed On': [datetime(2024, 5, 7)], 'Job Category': ['Repair']})
+    date_range = [date(2024, 5, 6), date(2024, 5, 12)]
+    cache = OutputCache(tmp_path / "outputs", max_bytes=10 * 1024 * 1024, ttl=60)
+    key = request_key("report", "template", date_range, "Construction", engine="openpyxl")
+    calls = []
+    
+    first = run_pay_sheet_job(create_test_template(), jobs, date_range, output_cache=cache, cache_key=key,
+                              progress=lambda *args: calls.append(args))
+    assert not first['cached'] and cache.contains(key)
+    
+    # A runner with no free worker still serves the cached output at once
+    runner = JobRunner(max_workers=1)
+    blocker = threading.Event()
+    runner.submit(lambda progress: blocker.wait(5))
+    assert runner.stats()["running"] == 1
+    job_id = runner.run_inline(run_pay_sheet_job, create_test_template(), jobs, date_range,
+                               output_cache=cache, cache_key=key, key=key)
+    job = runner.get(job_id)
+    blocker.set()
+    
+    assert job.status == "done" and job.result['cached']
+    assert job.result['data'] == first['data'] and job.result['name'] == first['name']
+    assert len(calls) == 1
+    assert runner.run_inline(run_pay_sheet_job, key=key) == job_id
+
+def test_job_set_hash():
+    """The cache key changes with the job set, e.g. once the ledger drops a job, but not with Job# spelling."""
+    jobs = pd.DataFrame({'Tech': ['Sub 1', 'Sub 1'], 'Job#': [1001, 1002]})
+    
+    assert job_set_hash(jobs) == job_set_hash(jobs.assign(**{'Job#': ['1001', '1002 ']}))
+    assert job_set_hash(jobs) != job_set_hash(jobs.iloc[1:])
+    assert job_set_hash(jobs) != job_set_hash(jobs.set_axis([5, 6]))
+    assert job_set_hash(jobs) != job_set_hash(jobs.assign(Tech=['Sub 1', 'Sub 2']))
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+from src.utils.job_table import compact_jobs, compact_job_numbers, memory_bytes, summarize_jobs, job_page, MAX_DESCRIPTION_LENGTH
+from src.utils.excel_writer import prepare_sheet_rows
+
+def create_jobs(rows=200):
+    """Filtered jobs as generate_preview sees them, with unused report columns."""
+    return pd.DataFrame({
+        'Tech': [f'Sub {i % 3}' for i in range(rows)],
+        'Job#': [str(1000 + i) for i in range(rows)],
+        'Status': ['Invoiced'] * rows,
+        'Completed On': pd.to_datetime(['2024-05-06'] * rows),
+        'Job Category': ['Repair', 'Paint'] * (rows // 2),
+        'Job Details': ['Replace damaged section, patch and paint. ' * 10] * rows,
+        'Customer': [f'Property {i % 7}' for i in range(rows)],
+        'Unused': [object()] * rows
+    }, index=range(10, 10 + rows))
+
+def test_compact_jobs():
+    """The job table keeps the writer's columns in compact dtypes."""
+    jobs = create_jobs()
+    
+    compact = compact_jobs(jobs)
+    
+    assert 'Unused' not in compact.columns
+    assert all(isinstance(compact[col].dtype, pd.CategoricalDtype) for col in ['Tech', 'Status', 'Job Category'])
+    assert str(compact['Job#'].dtype) == 'Int64'
+    assert compact['Job Details'].str.len().max() == MAX_DESCRIPTION_LENGTH + 1
+    assert list(compact.index) == list(jobs.index)
+    assert memory_bytes(compact) * 3 < memory_bytes(jobs)
+    
+    # The pay sheet rows are the same as from the full frame
+    assert prepare_sheet_rows(compact) == prepare_sheet_rows(jobs)
+
+def test_compact_job_numbers():
+    """Job# becomes Int64 only when every value is a whole number."""
+    assert compact_job_numbers(pd.Series([1001.0, None])).tolist() == [1001, pd.NA]
+    assert compact_job_numbers(pd.Series(['1001', 'A-7'])).tolist() == ['1001', 'A-7']
+
+def test_summarize_jobs_and_pages():
+    """The preview summary has one row per subcontractor; job rows come a page at a time."""
+    jobs = compact_jobs(create_jobs(rows=10)).assign(Duplicate=[False] * 9 + [True])
+    jobs.loc[10, 'Completed On'] = pd.Timestamp('2024-05-09')
+    
+    summary = summarize_jobs(jobs)
+    
+    assert summary['Tech'].tolist() == ['Sub 0', 'Sub 1', 'Sub 2']
+    assert summary['Jobs'].tolist() == [4, 3, 3]
+    assert summary['Last Date'].astype(str).tolist() == ['2024-05-09', '2024-05-06', '2024-05-06']
+    assert summary['Categories'].tolist() == ['Paint: 2, Repair: 2', 'Paint: 2, Repair: 1', 'Repair: 2, Paint: 1']
+    assert summary['Duplicates'].tolist() == [1, 0, 0]
+    
+    page, page_count = job_page(jobs, 'Sub 0', page=2, page_size=3)
+    assert page_count == 2
+    assert page['Job#'].tolist() == [1009]
+    assert list(page.columns) == ['Job#', 'Completed On', 'Job Category', 'Duplicate']
+    assert summarize_jobs(jobs.iloc[:0]).empty
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])
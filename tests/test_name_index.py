@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+from src.utils.name_index import NameIndex, normalize_name
+from src.utils.data_processing import generate_preview
+
+def test_normalize_name():
+    """Dashes, punctuation, case and Unicode width variants normalize to the same key."""
+    assert normalize_name("Kevin Reyes – SUB") == "kevin reyes sub"
+    assert normalize_name("  KEVIN REYES - sub ") == "kevin reyes sub"
+    assert normalize_name("Ｋｅｖｉｎ Reyes (SUB)") == "kevin reyes sub"
+    assert normalize_name("O’Brien Painting") == normalize_name("OBrien Painting")
+
+def test_match_methods():
+    """Each lookup reports the loosest rule it needed."""
+    index = NameIndex(["Kevin Reyes – SUB", "Ivan I&S", "Crew 2 Roofing", "Fire Sprinkler Co."])
+    
+    assert index.match(" kevin reyes – sub").method == "exact"
+    assert index.match("Kevin Reyes - SUB").name == "Kevin Reyes – SUB"
+    assert index.match("Kevin Reyes - SUB").method == "normalized"
+    assert index.match("Ivan I & S").method == "normalized"
+    assert index.match("Ivan IS").method == "compact"
+    assert index.match("SUB, Reyes Kevin").method == "reordered"
+    
+    fuzzy = index.match("Fire Sprinkler Co")
+    assert fuzzy.method == "normalized"
+    fuzzy = index.match("Fire Sprinklers Co")
+    assert (fuzzy.name, fuzzy.method) == ("Fire Sprinkler Co.", "fuzzy")
+    assert 0.9 <= fuzzy.score < 1
+    
+    # Numbers must agree, and unrelated names don't match
+    assert index.match("Crew 3 Roofing") is None
+    assert index.match("Employee 12") is None
+
+def test_ambiguous_fuzzy_match():
+    """A query close to two names matches neither."""
+    index = NameIndex(["Smith Roofing LLC", "Smyth Roofing LLC"])
+    
+    assert index.match("Smath Roofing LLC") is None
+
+def test_generate_preview_uses_name_index():
+    """Report spellings of a subcontractor are kept and written under the listed name."""
+    df = pd.DataFrame({
+        'Tech': ['Kevin Reyes - SUB', 'KEVIN REYES – SUB', 'Ivan I & S', 'Employee 1', "Totals represent tech's share"],
+        'Job#': ['1', '2', '3', '4', None],
+        'Status': ['Invoiced'] * 4 + [None],
+        'Completed On': ['05/06/2024'] * 4 + [None],
+        'Customer': ['A', 'B', 'C', 'D', None]
+    })
+    
+    filtered_df, warnings = generate_preview(df, ["Kevin Reyes – SUB", "Ivan I&S"], [None, None])
+    
+    assert list(filtered_df['Tech']) == ["Kevin Reyes – SUB", "Kevin Reyes – SUB", "Ivan I&S"]
+    assert not any('similarity' in warning for warning in warnings)
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])
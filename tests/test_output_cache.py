@@ -0,0 +1,47 @@
+import time
+import pytest
+from datetime import date
+from src.utils.output_cache import OutputCache
+
+KEY = ("report", "template", ("2024-05-06", "2024-05-12"), "Construction", (("engine", "xml"),))
+TAB_MATCHES = [{"sub": "Sub One", "sheet": "Sub 1", "method": "fuzzy", "score": 0.875}]
+
+def test_output_cache_round_trip(tmp_path):
+    """A stored output comes back with its name, skipped subcontractors, tab matches, weeks and written jobs."""
+    cache = OutputCache(tmp_path, max_bytes=1024 * 1024, ttl=60)
+    assert cache.get(KEY) is None
+    
+    weeks = [(date(2024, 5, 6), date(2024, 5, 12))]
+    cache.put(KEY, "Sub_PaySheets.zip", b"zip bytes", ["Sub 3"], TAB_MATCHES, weeks, [4, 7])
+    
+    assert cache.contains(KEY)
+    assert cache.get(KEY) == {"name": "Sub_PaySheets.zip", "data": b"zip bytes", "skipped_subs": ["Sub 3"], "tab_matches": TAB_MATCHES, "weeks": weeks,
+                              "written_jobs": [4, 7]}
+    assert cache.get(KEY[:-1] + ((("engine", "openpyxl"),),)) is None
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_output_cache_ttl_and_size(tmp_path, monkeypatch):
+    """Outputs expire after the TTL, and the least recently used go first once the cache is full."""
+    cache = OutputCache(tmp_path, max_bytes=250, ttl=60)
+    for number in range(3):
+        cache.put(("report", number), f"out{number}.xlsx", b"x" * 100)
+        time.sleep(0.01)
+    
+    # 300 bytes do not fit in 250: the oldest output is evicted
+    assert cache.get(("report", 0)) is None
+    assert cache.get(("report", 1)) is not None
+    
+    monkeypatch.setattr(time, "time", lambda: 10 ** 12)
+    assert not cache.contains(("report", 2))
+    assert cache.get(("report", 2)) is None
+    assert cache.evict() == 1
+    
+    # Outputs larger than the whole cache are not stored; a zero TTL disables the cache
+    cache.put(("report", 3), "big.xlsx", b"x" * 500)
+    assert cache.get(("report", 3)) is None
+    disabled = OutputCache(tmp_path / "off", max_bytes=1024, ttl=0)
+    disabled.put(KEY, "out.xlsx", b"data")
+    assert disabled.get(KEY) is None
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])
@@ -0,0 +1,140 @@
+import pandas as pd
+import pytest
+import io
+from datetime import datetime
+import src.utils.report_loader as report_loader
+from src.utils.report_loader import load_report, load_cached_report, clear_report_cache, read_worksheet
+from src.utils.report_spill import ReportSpillCache
+from src.utils.data_processing import infer_week_range
+
+def create_test_report(rows=3):
+    """Create a small Service Fusion style report as XLSX bytes."""
+    df = pd.DataFrame({
+        'Tech': [f'Sub {i}' for i in range(rows)],
+        'Job#': [1000 + i for i in range(rows)],
+        'Completed On': [f'05/0{i + 1}/2024' for i in range(rows)],
+        'Status': ['Invoiced'] * rows
+    })
+    buffer = io.BytesIO()
+    df.to_excel(buffer, sheet_name="Worksheet", index=False)
+    return buffer.getvalue()
+
+def test_load_report_parses_once(tmp_path, monkeypatch):
+    """The same upload content is parsed once, then served from memory or the Parquet spill."""
+    monkeypatch.setattr(report_loader, "_report_spill", ReportSpillCache(tmp_path))
+    clear_report_cache()
+    calls = []
+    
+    def counting_read_worksheet(data, *args, **kwargs):
+        calls.append(len(data))
+        return read_worksheet(data, *args, **kwargs)
+    
+    monkeypatch.setattr(report_loader, "read_worksheet", counting_read_worksheet)
+    content = create_test_report()
+    
+    first_df, first_hash = load_report(content)
+    second_df, second_hash = load_report(io.BytesIO(content))
+    
+    assert len(calls) == 1
+    assert first_hash == second_hash
+    assert len(first_df) == 3
+    assert first_df is not second_df
+    assert first_df['Tech'].tolist() == second_df['Tech'].tolist()
+    
+    # With the memory cache cleared the report comes back from the spill, not the XLSX
+    clear_report_cache()
+    spilled_df, _ = load_report(content)
+    assert len(calls) == 1
+    assert spilled_df['Tech'].tolist() == first_df['Tech'].tolist()
+
+def test_cached_report_not_mutated():
+    """Inferring the week range must not change the cached report."""
+    clear_report_cache()
+    content = create_test_report()
+    
+    report_df, _ = load_report(content)
+    infer_week_range(report_df)
+    report_df['Tech'] = 'Changed'
+    
+    cached_df, _ = load_report(content)
+    assert cached_df['Completed On'].tolist() == [pd.Timestamp(2024, 5, day) for day in (1, 2, 3)]
+    assert cached_df['Tech'].tolist() == ['Sub 0', 'Sub 1', 'Sub 2']
+
+def test_read_worksheet_projects_columns():
+    """Only used columns are kept, aliases are resolved and totals rows dropped."""
+    df = pd.DataFrame({
+        'Tech': ['Sub 1', "Totals represent tech's share", 'Sub 2'],
+        'Unused Column': ['a', 'b', 'c'],
+        'Job#': [1001, None, 1002],
+        'Customer )': ['Acme', None, 'Globex'],
+        'Completed On': [datetime(2024, 5, 1), None, datetime(2024, 5, 2)]
+    })
+    buffer = io.BytesIO()
+    df.to_excel(buffer, sheet_name="Worksheet", index=False)
+    
+    report_df = read_worksheet(buffer.getvalue())
+    
+    assert list(report_df.columns) == ['Tech', 'Job#', 'Completed On', 'Customer']
+    assert report_df['Tech'].tolist() == ['Sub 1', 'Sub 2']
+    assert report_df['Customer'].tolist() == ['Acme', 'Globex']
+    assert report_df['Completed On'].iloc[0] == datetime(2024, 5, 1)
+
+def test_read_worksheet_missing_sheet():
+    """A workbook without the Worksheet sheet is rejected."""
+    buffer = io.BytesIO()
+    pd.DataFrame({'Tech': ['Sub 1']}).to_excel(buffer, sheet_name="Other", index=False)
+    
+    with pytest.raises(ValueError):
+        read_worksheet(buffer.getvalue())
+
+def test_report_spill_cache(tmp_path, monkeypatch):
+    """Parsed reports are typed, stored as Parquet and reloaded without the XLSX."""
+    monkeypatch.setattr(report_loader, "_report_spill", ReportSpillCache(tmp_path))
+    clear_report_cache()
+    df = pd.DataFrame({
+        'Tech': ['Sub 1', 'Sub 2', 'Sub 3'],
+        'Job#': [1001, 'A-7', None],
+        'Customer': ['Acme', 42, None],
+        'Completed On': ['05/03/2024', datetime(2024, 5, 1), 'not a date']
+    })
+    buffer = io.BytesIO()
+    df.to_excel(buffer, sheet_name="Worksheet", index=False)
+    
+    report_df, report_hash = load_report(buffer.getvalue())
+    assert report_df['Job#'].tolist()[:2] == ['1001', 'A-7']
+    assert report_df['Customer'].tolist()[1] == '42'
+    assert report_df['Completed On'].tolist()[:2] == [pd.Timestamp(2024, 5, 3), pd.Timestamp(2024, 5, 1)]
+    assert pd.isna(report_df['Completed On'].iloc[2])
+    
+    # A fresh process (empty memory cache) reads the Parquet copy
+    clear_report_cache()
+    monkeypatch.setattr(report_loader, "read_worksheet", None)
+    cached_df = load_cached_report(report_hash)
+    pd.testing.assert_frame_equal(cached_df, report_df, check_dtype=False)
+    reloaded_df, _ = load_report(buffer.getvalue())
+    assert reloaded_df['Tech'].tolist() == ['Sub 1', 'Sub 2', 'Sub 3']
+
+def test_report_spill_eviction(tmp_path):
+    """The least recently used reports are evicted beyond the size limit."""
+    cache = ReportSpillCache(tmp_path, max_bytes=1)
+    df = pd.DataFrame({'Tech': ['Sub 1'] * 100})
+    
+    cache.put("old", df)
+    cache.put("new", df)
+    
+    assert cache.get("old") is None
+    assert cache.get("new") is None
+    cache.max_bytes = 10 * 1024 * 1024
+    cache.put("kept", df)
+    assert cache.get("kept")['Tech'].tolist() == df['Tech'].tolist()
+
+def test_report_spill_format_version(tmp_path):
+    """Reports stored by an earlier format version are not served after a version bump."""
+    df = pd.DataFrame({'Tech': ['Sub 1']})
+    ReportSpillCache(tmp_path, version=1).put("report", df)
+    
+    assert ReportSpillCache(tmp_path, version=1).get("report") is not None
+    assert ReportSpillCache(tmp_path, version=2).get("report") is None
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])
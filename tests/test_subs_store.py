@@ -0,0 +1,41 @@
+import os
+import pytest
+from src.utils.subs_store import SubsStore, SubsConflictError, DEFAULT_VERSION
+
+def test_store_sees_changes_from_other_processes(tmp_path):
+    """A store rereads a list replaced by another store (standing in for another process)."""
+    reader = SubsStore(tmp_path)
+    writer = SubsStore(tmp_path)
+    
+    assert reader.get("Construction").version == DEFAULT_VERSION
+    first = writer.save("Construction", ["Kevin Reyes – SUB", " Ivan I&S "])
+    
+    subs = reader.get("Construction")
+    assert subs.names == ("Kevin Reyes – SUB", "Ivan I&S")
+    assert subs.version == first.version
+    assert "kevin reyes - sub" in subs
+    assert "Someone Else" not in subs
+    
+    # Unchanged files are served from the cache
+    assert reader.get("Construction") is subs
+    
+    # A rewrite with the same size within the same clock tick is still noticed
+    writer.save("Construction", ["Kevin Reyes – SUB", " Ivan I&Z "])
+    assert reader.get("Construction").names[1] == "Ivan I&Z"
+
+def test_store_save_is_atomic_and_versioned(tmp_path):
+    """Saves replace the file in one step and refuse stale versions."""
+    store = SubsStore(tmp_path)
+    saved = store.save("Welding", ["Welder A"])
+    
+    with pytest.raises(SubsConflictError):
+        store.save("Welding", ["Welder B"], expected_version="stale")
+    store.save("Welding", ["Welder C"], expected_version=saved.version)
+    
+    assert store.get("Welding").names == ("Welder C",)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+    with pytest.raises(ValueError):
+        store.get("Plumbing")
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])
@@ -0,0 +1,76 @@
+import pytest
+import io
+import openpyxl
+from src.utils.template_layout import compile_template, get_template_layout, clear_layout_cache
+
+def create_test_template(header_row=12, summary_row=30, week_of_row=3):
+    """Create a template with one tab whose table sits at the given rows."""
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.title = "Sub 1 "
+    
+    sheet.cell(row=week_of_row, column=1).value = "Week Of:"
+    for col, header in enumerate(["Date", "Property", "Job #", "Description", "Qty", "Per Unit", "Amount"], start=1):
+        sheet.cell(row=header_row, column=col).value = header
+    for row in range(header_row + 1, summary_row):
+        sheet.cell(row=row, column=7).value = f"=E{row}*F{row}"
+    sheet.cell(row=summary_row, column=4).value = "Total"
+    sheet.cell(row=summary_row, column=7).value = f"=SUM(G{header_row + 1}:G{summary_row - 1})"
+    
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+def test_compile_template():
+    """The compiled layout records the week cell, header, data region and formula columns."""
+    layout = compile_template(create_test_template(header_row=8, summary_row=20, week_of_row=2))
+    
+    sheet_layout = layout.find_sheet("  SUB 1")
+    assert sheet_layout.sheet_name == "Sub 1 "
+    assert sheet_layout.week_of_cell == (2, 2)
+    assert sheet_layout.week_of_found
+    assert sheet_layout.header_row == 8
+    assert (sheet_layout.data_start_row, sheet_layout.data_end_row) == (9, 19)
+    assert sheet_layout.capacity == 11
+    assert sheet_layout.formula_columns == (7,)
+    assert layout.issues == []
+    assert layout.find_sheet("Sub 2") is None
+
+def test_running_total_column_stays_in_data_region():
+    """A per-row SUM (running total) in the job rows does not end the region; the SUM over them below does."""
+    wb = openpyxl.load_workbook(io.BytesIO(create_test_template()))
+    sheet = wb["Sub 1 "]
+    for row in range(13, 30):
+        sheet.cell(row=row, column=8).value = f"=SUM(G$13:G{row})"
+    sheet.cell(row=30, column=4).value = None
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    
+    sheet_layout = compile_template(buffer.getvalue()).find_sheet("Sub 1")
+    
+    assert (sheet_layout.data_start_row, sheet_layout.data_end_row) == (13, 29)
+    assert sheet_layout.capacity == 17
+    assert sheet_layout.formula_columns == (7, 8)
+
+def test_compile_template_defaults():
+    """Templates without labels fall back to B4 and the row 12 header, and report it."""
+    wb = openpyxl.Workbook()
+    wb.active.title = "Sub 1"
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    
+    sheet_layout = compile_template(buffer.getvalue()).find_sheet("Sub 1")
+    
+    assert sheet_layout.week_of_cell == (4, 2)
+    assert not sheet_layout.week_of_found
+    assert (sheet_layout.header_row, sheet_layout.data_start_row, sheet_layout.data_end_row) == (12, 13, 29)
+
+def test_get_template_layout_cached():
+    """The same template content is compiled only once."""
+    clear_layout_cache()
+    content = create_test_template()
+    
+    assert get_template_layout(content) is get_template_layout(bytes(content))
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])
@@ -0,0 +1,44 @@
+import sys
+import pytest
+import src.utils.warmup as warmup
+from src.utils.cache import content_hash
+from src.utils.template_layout import _layout_cache, clear_layout_cache
+from tests.test_excel_writer import create_test_template
+
+def test_warm_caches_compiles_templates(tmp_path):
+    """Warming should import the pipeline modules and put the given templates in the layout cache."""
+    clear_layout_cache()
+    template = create_test_template()
+    path = tmp_path / "template.xlsx"
+    path.write_bytes(template)
+
+    timings = warmup.warm_caches([str(path), str(tmp_path / "missing.xlsx")])
+
+    assert content_hash(template) in _layout_cache
+    assert "openpyxl" in sys.modules and "src.utils.excel_writer" in sys.modules
+    assert {"pandas", "subs_lists", "templates"} <= set(timings)
+
+def test_start_warmup_once(monkeypatch):
+    """The background warmup starts at most once per process and can be turned off."""
+    started = []
+    monkeypatch.setattr(warmup, "_started", False)
+    monkeypatch.setattr(warmup, "warm_caches", lambda paths: started.append(paths))
+
+    monkeypatch.setenv(warmup.WARMUP_ENV, "0")
+    assert not warmup.start_warmup()
+
+    monkeypatch.setenv(warmup.WARMUP_ENV, "1")
+    assert warmup.start_warmup()
+    assert not warmup.start_warmup()
+
+def test_first_page_loads_no_heavy_modules():
+    """Drawing the app's first page (its whole script, not just its imports) loads neither pandas nor openpyxl."""
+    from benchmarks.bench_startup import time_app_script
+    
+    _, loaded, errors = time_app_script(repeat=1)
+    
+    assert loaded == []
+    assert errors == []
+
+if __name__ == "__main__":
+    pytest.main(['-v', __file__])